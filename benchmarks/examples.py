@@ -0,0 +1,51 @@
+"""
+Compares the time it takes to parse the example configurations with the
+interpreted, optimized, compiled, and generated versions of their grammars.
+The "compiled" column compiles the grammar as it is, and "optimized +
+compiled" compiles it after fusion, so the two gains can be told apart.
+
+    python benchmarks/examples.py
+"""
+from __future__ import print_function
+import timeit
+import types
+
+from parsr import codegen
+
+from parsr.examples import corosync_conf, httpd_conf, multipath_conf, nginx_conf
+from parsr.examples.tests.test_corosync import COROSYNC_CONF
+from parsr.examples.tests.test_httpd import HTTPD_CONF_NEST_1
+from parsr.examples.tests.test_multipath import EXAMPLE as MULTIPATH_CONF
+from parsr.examples.tests.test_nginx import MIME_TYPES, NGINX_CONF
+
+EXAMPLES = [
+    ("corosync", corosync_conf.Top, COROSYNC_CONF),
+    ("httpd", httpd_conf.Top, HTTPD_CONF_NEST_1),
+    ("multipath", multipath_conf.Top, MULTIPATH_CONF),
+    ("nginx", nginx_conf.Top, NGINX_CONF),
+    ("nginx mime types", nginx_conf.Top, MIME_TYPES),
+]
+
+
+def best(func, data, number=20, repeat=5):
+    return min(timeit.repeat(lambda: func(data), number=number, repeat=repeat)) / number
+
+
+def generate(grammar):
+    mod = types.ModuleType("generated")
+    exec(compile(codegen.generate(grammar), "<generated>", "exec"), mod.__dict__)
+    return mod.parse
+
+
+def main():
+    columns = ["interpreted", "optimized", "compiled", "optimized + compiled", "generated"]
+    print("{0:<18}".format("grammar") + "".join("{0:>22}".format(c) for c in columns))
+    for name, grammar, data in EXAMPLES:
+        parsers = [grammar, grammar.optimize(), grammar.compile(), grammar.optimize().compile(),
+                   generate(grammar)]
+        times = [best(p, data) * 1000 for p in parsers]
+        print("{0:<18}".format(name) + "".join("{0:>20.2f}ms".format(t) for t in times))
+
+
+if __name__ == "__main__":
+    main()
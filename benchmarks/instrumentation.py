@@ -0,0 +1,44 @@
+"""
+Measures what wrapping every parser with the debug hook costs on the tightest
+loops in the engine. Each grammar is run plainly and again with
+:py:func:`parsr.enable_debug` in effect, which is how every parse ran before
+instrumentation was only installed when needed.
+
+    python benchmarks/instrumentation.py
+"""
+from __future__ import print_function
+import timeit
+
+from parsr import Char, InSet, Many, String, WS, disable_debug, enable_debug
+from parsr.examples import nginx_conf
+from parsr.examples.tests.test_nginx import NGINX_CONF
+
+EXAMPLES = [
+    ("Many(Char)", Many(Char("a")), "a" * 10000),
+    ("Many(InSet)", Many(InSet("abc")), "abc" * 3333),
+    ("String", String("abc"), "abc" * 3333),
+    ("WS", WS, " \t\n" * 3333),
+    ("nginx", nginx_conf.Top, NGINX_CONF),
+]
+
+
+def best(func, number=20):
+    return min(timeit.repeat(func, number=number, repeat=5)) / number
+
+
+def main():
+    print("{0:<16}{1:>14}{2:>14}{3:>10}".format("grammar", "plain", "hooked", "ratio"))
+    for name, grammar, data in EXAMPLES:
+        plain = best(lambda: grammar(data))
+        enable_debug()
+        try:
+            hooked = best(lambda: grammar(data))
+        finally:
+            disable_debug()
+        print("{0:<16}{1:>12.2f}ms{2:>12.2f}ms{3:>9.1f}x".format(name, plain * 1000,
+                                                                 hooked * 1000,
+                                                                 hooked / plain))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Measures what a running :py:class:`parsr.sampling.Sampler` costs the parses
+it samples. Each grammar is parsed with no sampler and again while one samples
+every interval, and the best of several interleaved runs is compared. Timings
+on a busy machine are noisy, so the share of time each sampler spent sampling
+is shown too.
+
+    python benchmarks/sampling.py
+"""
+from __future__ import print_function
+import timeit
+
+from parsr.examples import httpd_conf, multipath_conf, nginx_conf
+from parsr.examples.tests.test_httpd import DATA as HTTPD_CONF
+from parsr.examples.tests.test_multipath import EXAMPLE as MULTIPATH_CONF
+from parsr.examples.tests.test_nginx import NGINX_CONF
+from parsr.sampling import Sampler
+
+EXAMPLES = [
+    ("httpd", httpd_conf.Top, HTTPD_CONF * 200),
+    ("multipath", multipath_conf.Top, MULTIPATH_CONF * 100),
+    ("nginx", nginx_conf.Top, NGINX_CONF * 50),
+]
+
+INTERVALS = [0.01, 0.001]
+ROUNDS = 5
+
+
+def best(func, sampler=None, number=5):
+    if sampler is not None:
+        sampler.start()
+    try:
+        return min(timeit.repeat(func, number=number, repeat=3)) / number
+    finally:
+        if sampler is not None:
+            sampler.stop()
+
+
+def main():
+    header = "{0:<12}{1:>12}".format("grammar", "plain")
+    for interval in INTERVALS:
+        header += "{0:>20}".format("every {0:g}ms".format(interval * 1000))
+    print(header)
+    for name, grammar, data in EXAMPLES:
+        grammar(data)
+        plain = float("inf")
+        sampled = dict((i, float("inf")) for i in INTERVALS)
+        samplers = dict((i, Sampler(interval=i)) for i in INTERVALS)
+        # alternate so changes in machine load hit every column alike
+        for _ in range(ROUNDS):
+            plain = min(plain, best(lambda: grammar(data)))
+            for i in INTERVALS:
+                sampled[i] = min(sampled[i], best(lambda: grammar(data), samplers[i]))
+        line = "{0:<12}{1:>10.2f}ms".format(name, plain * 1000)
+        for i in INTERVALS:
+            line += "{0:>10.2f}ms {1:>+7.1%}".format(sampled[i] * 1000, sampled[i] / plain - 1)
+        print(line)
+        line = "{0:<24}".format("  sampler busy")
+        for i in INTERVALS:
+            line += "{0:>20.2%}".format(samplers[i].overhead)
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""
+Parses multi-megabyte nginx and multipath configurations built by repeating
+the examples and reports the time per megabyte for each size. The times stay
+about the same as the input grows if parsing is linear.
+
+    python benchmarks/scaling.py
+"""
+from __future__ import print_function
+import time
+
+from parsr.examples import multipath_conf, nginx_conf
+from parsr.examples.tests.test_multipath import EXAMPLE as MULTIPATH_CONF
+from parsr.examples.tests.test_nginx import NGINX_CONF
+
+EXAMPLES = [
+    ("nginx", nginx_conf.Top, NGINX_CONF),
+    ("multipath", multipath_conf.Top, MULTIPATH_CONF),
+]
+
+SIZES = [1, 2, 4]
+
+
+def main():
+    print("{0:<12}{1:>8}{2:>16}{3:>16}".format("grammar", "MB", "interpreted", "compiled"))
+    for name, grammar, example in EXAMPLES:
+        compiled = grammar.compile()
+        for size in SIZES:
+            data = example * (size * 1024 * 1024 // len(example))
+            times = []
+            for parser in (grammar, compiled):
+                start = time.time()
+                parser(data)
+                times.append((time.time() - start) / size)
+            print("{0:<12}{1:>8}{2:>14.2f}s{3:>14.2f}s".format(name, size, *times))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Compares three ways a short-lived collector can parse small files: starting a
+python process that imports the grammar and parses one file, sending the file
+to a warm :py:class:`parsr.server.ParseServer`, and parsing in a process that
+already has the grammar built.
+
+    python benchmarks/server.py
+"""
+from __future__ import print_function
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from parsr.examples import nginx_conf
+from parsr.examples.tests.test_nginx import NGINX_CONF
+from parsr.server import Client, ParseServer
+
+FILES = 200
+COLD_FILES = 10
+CLIENTS = 4
+
+COLD = "import sys; from parsr.examples import nginx_conf; nginx_conf.load(open(sys.argv[1]))"
+
+
+def rate(count, seconds):
+    return "{0:>10.1f} files/s".format(count / seconds)
+
+
+def cold(path):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    start = time.time()
+    for _ in range(COLD_FILES):
+        subprocess.check_call([sys.executable, "-c", COLD, path], env=env)
+    return rate(COLD_FILES, time.time() - start)
+
+
+def served(address, path, clients):
+    def run():
+        # a new connection per file, like a collector that runs once per file
+        for _ in range(FILES // clients):
+            with Client(address) as c:
+                c.parse("nginx", path=path)
+
+    threads = [threading.Thread(target=run) for _ in range(clients)]
+    start = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return rate(FILES // clients * clients, time.time() - start)
+
+
+def in_process(path):
+    start = time.time()
+    for _ in range(FILES):
+        with open(path) as f:
+            nginx_conf.load(f)
+    return rate(FILES, time.time() - start)
+
+
+def main():
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, "nginx.conf")
+        with open(path, "w") as f:
+            f.write(NGINX_CONF)
+        address = os.path.join(tmp, "parsr.sock")
+        print("{0:<28}{1}".format("new process per file", cold(path)))
+        with ParseServer(address, workers=CLIENTS):
+            print("{0:<28}{1}".format("server, 1 client", served(address, path, 1)))
+            print("{0:<28}{1}".format("server, %d clients" % CLIENTS, served(address, path, CLIENTS)))
+        print("{0:<28}{1}".format("in process, warm", in_process(path)))
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    main()
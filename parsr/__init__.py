@@ -47,14 +47,23 @@ Here's an example that evaluates arithmetic expressions.
         evaluate = expr << EOF
 """
 from __future__ import print_function
+import copy
 import functools
 import logging
+import mmap
 import re
 import os
 import string
+import sys
+import threading
+import time
 import traceback
+import warnings
+import weakref
+from array import array
 from bisect import bisect_left
-from six import StringIO, with_metaclass
+from collections import namedtuple
+from six import StringIO, string_types, text_type, unichr, with_metaclass
 
 log = logging.getLogger(__name__)
 
@@ -65,33 +74,91 @@ class Node(object):
     each instance containing a list of its children. Its main purpose is to
     simplify pretty printing.
     """
+    # Incremented whenever any node's children change. _stamp is its value
+    # when the children of the node or of any node below it last changed, so
+    # information derived from a graph can tell when it's out of date without
+    # changes to other graphs making it look stale.
+    _version = 0
+    _stamp = 0
+
+    # Set by Parser.freeze
+    _frozen = False
+
+    # Set by _ParserMeta on parser classes defined outside of parsr that
+    # don't check for FAIL
+    _children_raise = False
+
     def __init__(self):
         self.children = []
 
+    def _check_mutable(self):
+        if self._frozen:
+            raise Exception("Can't change {0}. Its grammar is frozen.".format(self))
+
     def add_child(self, child):
+        self._check_mutable()
         self.children.append(child)
+        child._link(self)
+        self._touch()
+        if self._children_raise and not child._raises_failures:
+            child._raises_failures = True
+            child._hook()
         return self
 
     def set_children(self, children):
+        self._check_mutable()
         self.children = []
         for c in children:
             self.add_child(c)
         return self
 
+    def _link(self, parent):
+        """
+        Remembers that parent has the node as a child. Parents are weakly
+        referenced, so grammars built on a shared parser can still be freed.
+        """
+        parents = self.__dict__.get("_parents")
+        if parents is None:
+            parents = self.__dict__["_parents"] = weakref.WeakSet()
+        parents.add(parent)
+
+    def _touch(self):
+        """
+        Stamps the node and every node above it with a new version. Frozen
+        nodes can't change, so they're passed through without being stamped.
+        """
+        Node._version += 1
+        stack = [self]
+        seen = set()
+        while stack:
+            node = stack.pop()
+            if node in seen:
+                continue
+            seen.add(node)
+            if not node._frozen:
+                node._stamp = Node._version
+            stack.extend(node.__dict__.get("_parents", ()))
+
     def __repr__(self):
         return self.__class__.__name__
 
 
-def text_format(tree):
+def text_format(tree, stats=None):
     """
-    Converts a PEG into a pretty printed string.
+    Converts a PEG into a pretty printed string. If stats is given, each
+    node that ``stats.get(node)`` returns something for is annotated with it,
+    like the rule statistics of a :py:class:`parsr.profiler.Profile`.
     """
     out = StringIO()
     tab = " " * 2
     seen = set()
 
     def inner(cur, prefix):
-        print(prefix + str(cur), file=out)
+        line = prefix + str(cur)
+        note = stats.get(cur) if stats is not None else None
+        if note is not None:
+            line = "{0}  [{1}]".format(line, note)
+        print(line, file=out)
         if cur in seen:
             return
 
@@ -106,45 +173,472 @@ def text_format(tree):
     return out.read()
 
 
-def render(tree):
+_WHITESPACE = []
+
+
+def _whitespace():
+    """
+    Returns the set of characters for which ``str.isspace`` is true. It's only
+    computed once and only if a grammar's FIRST sets need it.
+    """
+    if not _WHITESPACE:
+        chars = (unichr(i) for i in range(sys.maxunicode + 1))
+        _WHITESPACE.append(frozenset(c for c in chars if c.isspace()))
+    return _WHITESPACE[0]
+
+
+# Values of the ASCII characters in bytes input.
+_ASCII = tuple(unichr(i) for i in range(128))
+_ASCII_SPACE = dict((i, c) for i, c in enumerate(_ASCII) if c.isspace())
+
+
+def _decode(span):
+    """
+    Decodes a span of bytes input as UTF-8. Invalid bytes are replaced instead
+    of stopping the parse.
+    """
+    return text_type(span, "utf-8", "replace")
+
+
+def _utf8_char(data, pos):
+    """
+    Returns the end of the UTF-8 sequence that starts at pos in bytes input
+    and the character it encodes. The byte at pos must not be ASCII.
+    """
+    c = data[pos]
+    end = pos + (2 if c < 0xE0 else 3 if c < 0xF0 else 4)
+    return end, _decode(data[pos:end])
+
+
+def _byte_class(chars):
+    """
+    Returns a bytes regular expression character class that matches the ASCII
+    characters in chars.
+    """
+    chars = [c.encode("ascii") for c in sorted(chars) if ord(c) < 128]
+    if not chars:
+        return b"(?!)"
+    return b"[" + b"".join(re.escape(c) for c in chars) + b"]"
+
+
+def _first_of(parsers, seen):
+    """
+    Returns the FIRST set and nullability of a sequence of parsers.
+    """
+    chars = set()
+    for p in parsers:
+        first, nullable = p.first(seen)
+        if first is None:
+            return None, True
+        chars |= first
+        if not nullable:
+            return chars, False
+    return chars, True
+
+
+def _regex_anchored(pattern, flags):
+    """
+    Returns True if a regular expression uses ``^``, ``\\A``, or a
+    lookbehind. They see the text before the current position when the
+    pattern is matched in place, so :py:class:`Regex` matches them against
+    the rest of the input instead.
+    """
+    try:
+        import re._parser as sre_parse
+    except ImportError:  # pragma: no cover
+        import sre_parse
+
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+    except Exception:
+        return True
+
+    starts = (sre_parse.AT_BEGINNING, sre_parse.AT_BEGINNING_STRING)
+    stack = [parsed]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, sre_parse.SubPattern):
+            for op, av in value:
+                if op is sre_parse.AT and av in starts:
+                    return True
+                if op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT) and av[0] < 0:
+                    return True
+                stack.append(av)
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+    return False
+
+
+def _regex_first(pattern, flags):
     """
-    Pretty prints a PEG.
+    Returns the FIRST set and nullability of a regular expression. Patterns
+    that are case insensitive or that start with something other than
+    literals, character sets, groups, alternatives, or repetitions of them
+    have unknown FIRST sets.
     """
-    print(text_format(tree))
+    try:
+        import re._parser as sre_parse
+    except ImportError:  # pragma: no cover
+        import sre_parse
+
+    if flags & re.IGNORECASE:
+        return None, True
+
+    def of_seq(items):
+        chars = set()
+        for op, av in items:
+            first, nullable = of_item(op, av)
+            if first is None:
+                return None, True
+            chars |= first
+            if not nullable:
+                return chars, False
+        return chars, True
+
+    def of_set(items):
+        chars = set()
+        for op, av in items:
+            if op is sre_parse.LITERAL:
+                chars.add(unichr(av))
+            elif op is sre_parse.RANGE and av[1] - av[0] < 256:
+                chars.update(unichr(i) for i in range(av[0], av[1] + 1))
+            elif op is sre_parse.CATEGORY and av is sre_parse.CATEGORY_SPACE:
+                chars |= _whitespace()
+            else:
+                return None, True
+        return chars, False
+
+    def of_item(op, av):
+        if op is sre_parse.LITERAL:
+            return set([unichr(av)]), False
+        if op is sre_parse.IN:
+            return of_set(av)
+        if op is sre_parse.SUBPATTERN:
+            if av[1] & re.IGNORECASE:
+                return None, True
+            return of_seq(av[-1])
+        if op is sre_parse.BRANCH:
+            chars = set()
+            nullable = False
+            for branch in av[1]:
+                first, n = of_seq(branch)
+                if first is None:
+                    return None, True
+                chars |= first
+                nullable = nullable or n
+            return chars, nullable
+        if op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT,
+                  getattr(sre_parse, "POSSESSIVE_REPEAT", None)):
+            first, nullable = of_seq(av[2])
+            return first, nullable or av[0] == 0
+        if op in (sre_parse.AT, sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            # zero width, so whatever follows decides
+            return set(), True
+        return None, True
+
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+        if parsed.state.flags & re.IGNORECASE:
+            return None, True
+        return of_seq(parsed)
+    except Exception:
+        return None, True
+
+
+def render(tree, stats=None):
+    """
+    Pretty prints a PEG, annotated with stats if they're given.
+    """
+    print(text_format(tree, stats))
 
 
 def _debug_hook(func):
     """
-    _debug_hook wraps the process function of every parser. It maintains a
-    stack of active parsers during evaluation to help with error reporting and
-    prints diagnostic messages for parsers with debug enabled.
+    _debug_hook wraps the process function of parsers that need
+    instrumentation. It memoizes results, maintains a stack of active parsers
+    during evaluation to help with error reporting, prints diagnostic
+    messages for parsers with debug enabled, and reports calls to the
+    context's profile if it has one.
+
+    Parsers with debug or memo enabled are always wrapped. Parses that
+    memoize every parser, collect error messages, or are recorded run an
+    instrumented copy of the grammar whose parsers are all wrapped. Every
+    other parser is only wrapped while :py:func:`enable_debug` is in effect.
     """
     @functools.wraps(func)
     def inner(self, pos, data, ctx):
-        if ctx.function_error is not None:
-            # no point in continuing...
-            raise Exception()
+        key = None
+        if self._memo or ctx.memoize:
+            key = ctx.memo_key(self, pos)
+            if key in ctx.memo:
+                return ctx.recall(key)
+            ctx.memo_misses += 1
 
         ctx.parser_stack.append(self)
         if self._debug:
             line = ctx.line(pos) + 1
             col = ctx.col(pos) + 1
             log.debug("Trying {0} at line {1} col {2}".format(self, line, col))
-        try:
+
+        if ctx.profile is None:
             res = func(self, pos, data, ctx)
-            if self._debug:
-                log.debug("Result: {0}".format(res[1]))
-            return res
-        except:
-            if self._debug:
+        else:
+            res = ctx.profile.call(func, self, pos, data, ctx)
+
+        if key is not None:
+            ctx.memo[key] = (res, tuple(ctx.tags))
+        if self._debug:
+            if res is FAIL:
                 ps = "-> ".join([str(p) for p in ctx.parser_stack])
                 log.debug("Failed: {0}".format(ps))
+            else:
+                log.debug("Result: {0}".format(res[1]))
+        ctx.parser_stack.pop()
+        return res
+    return inner
+
+
+def _bind(func, parser):
+    """
+    Returns a process function that calls func with parser in place of the
+    parser it's called with.
+    """
+    @functools.wraps(func)
+    def inner(_, pos, data, ctx):
+        return func(parser, pos, data, ctx)
+    return inner
+
+
+def _parsers_in(value):
+    """
+    Yields the parsers in an attribute value of a parser, looking inside
+    lists, tuples, and dictionary values.
+    """
+    stack = [value]
+    while stack:
+        v = stack.pop()
+        if isinstance(v, Parser):
+            yield v
+        elif isinstance(v, (list, tuple)):
+            stack.extend(v)
+        elif isinstance(v, dict):
+            stack.extend(v.values())
+
+
+def _remap(value, copies):
+    """
+    Returns value with the parsers in it replaced by their copies. Containers
+    without parsers are returned as they are.
+    """
+    if isinstance(value, Parser):
+        return copies.get(value, value)
+    if isinstance(value, (list, tuple, dict)) and any(True for _ in _parsers_in(value)):
+        if isinstance(value, dict):
+            return dict((k, _remap(v, copies)) for k, v in value.items())
+        res = [_remap(v, copies) for v in value]
+        return res if isinstance(value, list) else type(value)(res)
+    return value
+
+
+def _instrument(root):
+    """
+    Returns a copy of the grammar of root with every parser's process function
+    wrapped by ``_debug_hook``. The copies do their bookkeeping for the
+    parsers they were copied from, so the parser stack, memo keys, debug
+    settings, and recorders see the grammar's own parsers, while the original
+    grammar keeps running unwrapped in other parses.
+    """
+    copies = {}
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if node in copies:
+            continue
+        # copies aren't linked to the parents of the originals' children
+        dup = copies[node] = node.__class__.__new__(node.__class__)
+        dup.__dict__.update(node.__getstate__())
+        for v in node.__getstate__().values():
+            stack.extend(_parsers_in(v))
+
+    for node, dup in copies.items():
+        for k, v in list(dup.__dict__.items()):
+            dup.__dict__[k] = _remap(v, copies)
+        func = _debug_hook(_bind(type(node)._raw_process, dup))
+        if node._raises_failures:
+            func = _raise_failures(func)
+        dup.process = functools.partial(func, node)
+    return copies[root]
+
+
+def _convert_exceptions(func, children_raise):
+    """
+    Parsers written before :py:data:`FAIL` was introduced raise exceptions to
+    fail. _convert_exceptions wraps their process functions to return
+    :py:data:`FAIL` instead. If children_raise is True, ``ctx.raise_failures``
+    tells their children to raise when they fail while they run, since they
+    may catch the exceptions to backtrack.
+    """
+    @functools.wraps(func)
+    def inner(self, pos, data, ctx):
+        caller = ctx.raise_failures
+        ctx.raise_failures = children_raise
+        try:
+            return func(self, pos, data, ctx)
+        except FunctionError:
             raise
+        except Exception:
+            return FAIL
+        finally:
+            ctx.raise_failures = caller
+    return inner
+
+
+def _raise_failures(func):
+    """
+    Wraps the process functions of the children of parsers defined outside of
+    parsr that don't check for :py:data:`FAIL`, so they raise an exception
+    instead of returning :py:data:`FAIL` when one of those parsers calls
+    them. Other callers still get :py:data:`FAIL`.
+    """
+    @functools.wraps(func)
+    def inner(self, pos, data, ctx):
+        caller = ctx.raise_failures
+        ctx.raise_failures = False
+        try:
+            res = func(self, pos, data, ctx)
         finally:
-            ctx.parser_stack.pop()
+            ctx.raise_failures = caller
+        if res is FAIL and caller:
+            raise Exception()
+        return res
     return inner
 
 
+def _class_process(self, pos, data, ctx):
+    # the process function of the class, which enable_debug may change
+    return type(self).process(self, pos, data, ctx)
+
+
+def enable_debug():
+    """
+    Wraps the process function of every parser class with ``_debug_hook`` so
+    parsers maintain the active parser stack and can be memoized with
+    ``memo=True``. Diagnostic messages from parsers with
+    :py:meth:`Parser.debug` enabled then include every active parser.
+
+    Calls nest: the process functions are unwrapped once
+    :py:func:`disable_debug` has been called as many times as enable_debug.
+    """
+    with _ParserMeta.lock:
+        _ParserMeta.enabled += 1
+        if _ParserMeta.enabled == 1:
+            for cls in _ParserMeta.classes:
+                cls.process = _debug_hook(cls._raw_process)
+
+
+def disable_debug():
+    """
+    Undoes a call to :py:func:`enable_debug`.
+    """
+    with _ParserMeta.lock:
+        if _ParserMeta.enabled == 0:
+            return
+        _ParserMeta.enabled -= 1
+        if _ParserMeta.enabled == 0:
+            for cls in _ParserMeta.classes:
+                cls.process = cls._raw_process
+
+
+_timer = getattr(time, "perf_counter", time.time)
+
+# Called with a ParseEvent after every call to Parser.__call__.
+_call_hooks = []
+
+ParseEvent = namedtuple("ParseEvent", ["parser", "length", "seconds", "error", "rule"])
+ParseEvent.__doc__ = """
+Passed to call hooks after a parser is called. length is the length of the
+input, and seconds is how long the call took. error is None if the parse
+succeeded, ``"parse"`` if the input didn't match, or ``"function"`` if a
+mapped or lifted function raised an exception. rule is the name of the
+innermost parser named with ``%`` at the farthest failure, or of the
+:py:class:`Map` or :py:class:`Lift` whose function raised. The module level
+parsers in parsr, like :py:data:`WS` and :py:data:`Number`, don't count, so
+failures are attributed to the grammar's own rules. rule is None if none of
+them were active.
+"""
+
+
+def add_call_hook(hook):
+    """
+    Calls hook with a :py:class:`ParseEvent` after every call to
+    :py:meth:`Parser.__call__` in any thread until
+    :py:func:`remove_call_hook` is called. Hooks are called in the thread
+    that parsed, so they shouldn't block. See :py:mod:`parsr.metrics`.
+    """
+    with _ParserMeta.lock:
+        _call_hooks.append(hook)
+
+
+def remove_call_hook(hook):
+    """
+    Undoes a call to :py:func:`add_call_hook`.
+    """
+    with _ParserMeta.lock:
+        if hook in _call_hooks:
+            _call_hooks.remove(hook)
+
+
+def _failed_rule(ctx):
+    if ctx.function_error is not None:
+        # Map and Lift messages start with the parser's name
+        return "function", ctx.function_error[1].partition(" raised")[0]
+    for stack, _ in ctx.errors:
+        for p in reversed(stack):
+            if p._named:
+                return "parse", p.name
+    return "parse", None
+
+
+def _observe(parser, data, src, Ctx, memo):
+    """
+    Calls parser like :py:meth:`Parser.__call__` and reports the call to the
+    hooks in ``_call_hooks``.
+    """
+    contexts = []
+
+    def context(data, src=None):
+        ctx = Ctx(data, src=src)
+        contexts.append(ctx)
+        return ctx
+
+    start = _timer()
+    try:
+        value = parser._call(data, src, context, memo)
+    except Exception:
+        seconds = _timer() - start
+        error, rule = _failed_rule(contexts[-1]) if contexts else ("parse", None)
+        event = ParseEvent(parser, len(data), seconds, error, rule)
+        for hook in tuple(_call_hooks):
+            hook(event)
+        raise
+    event = ParseEvent(parser, len(data), _timer() - start, None, None)
+    for hook in tuple(_call_hooks):
+        hook(event)
+    return value
+
+
+class _Fail(object):
+    def __repr__(self):
+        return "FAIL"
+
+
+FAIL = _Fail()
+"""
+Returned by a parser's process method when it doesn't match. Failing by
+returning a sentinel is much cheaper than raising an exception.
+"""
+
+
 class Backtrack(Exception):
     """
     Mapped or Lifted functions should Backtrack if they want to fail without
@@ -152,27 +646,139 @@ class Backtrack(Exception):
     """
     def __init__(self, msg):
         super(Backtrack, self).__init__(msg)
+        self.msg = msg
+
+
+class FunctionError(Exception):
+    """
+    Raised by :py:class:`Map` and :py:class:`Lift` to stop parsing when their
+    functions raise something other than :py:class:`Backtrack`. The message
+    is kept in :py:attr:`Context.function_error`.
+    """
+    pass
 
 
-class Context(object):
+class _ContextMeta(type):
+    """
+    Contexts used to be made with ``Ctx(lines, orig, src=None)``, where lines
+    was the input as a list of characters and orig was the input. Parsers now
+    make them with ``Ctx(data, src=None)``. _ContextMeta passes the input as
+    both lines and orig to subclasses whose constructors still require both.
+    """
+    def __init__(cls, name, bases, clsdict):
+        super(_ContextMeta, cls).__init__(name, bases, clsdict)
+        init = clsdict.get("__init__")
+        code = getattr(init, "__code__", None)
+        if code is not None:
+            required = code.co_argcount - len(init.__defaults__ or ())
+            cls._legacy = required >= 3
+
+    def __call__(cls, data, *args, **kwargs):
+        if cls._legacy and not args:
+            args = (data,)
+        return super(_ContextMeta, cls).__call__(data, *args, **kwargs)
+
+
+class Context(with_metaclass(_ContextMeta, object)):
     """
     An instance of Context is threaded through the process call to every
     parser. It stores an indention stack to track hanging indents, a tag stack
     for grammars like xml or apache configuration, the active parser stack for
-    error reporting, and accumulated errors for the farthest position reached.
+    error reporting, accumulated errors for the farthest position reached, and
+    the memo table used by packrat parsing.
+
+    If diagnose is False, only the farthest position reached is recorded.
+    :py:meth:`Parser.__call__` parses that way first and only parses again
+    with diagnose set to collect error messages if the first parse fails.
+
+    If the data is part of a larger document, offset, line_offset, and
+    col_offset say where it starts so line numbers, columns, and the
+    positions in :py:class:`Mark` instances are relative to the document.
+
+    Data can be a string or any bytes-like object, like bytes, a memoryview,
+    or an mmap. Bytes are parsed as UTF-8 and only decoded for the values
+    parsers produce. Positions, offsets, and columns count bytes.
+
+    failures counts the calls to :py:meth:`set`, which parsers make when
+    they fail to match the input.
+
+    profile is a :py:class:`parsr.profiler.Recorder`, like a profile or a
+    trace, that's told about every call to a parser wrapped with
+    ``_debug_hook``.
+
+    raise_failures is True while a parser defined outside of parsr that
+    doesn't check for :py:data:`FAIL` runs, so its children raise when they
+    fail instead of returning :py:data:`FAIL`.
+
+    recursion counts the :py:class:`Forward` parsers that are active, which
+    is how deeply recursive rules are nested, and max_recursion is the most
+    that were active at once.
+
+    The old ``Context(lines, orig, src=None)`` signature still works but is
+    deprecated. lines is ignored and orig is parsed. Subclasses whose
+    constructors take (lines, orig) can still be passed as ``Ctx``.
     """
-    def __init__(self, lines, orig, src=None):
+    _legacy = False
+
+    def __init__(self, data, orig=None, src=None):
+        if orig is not None:
+            warnings.warn("Context(lines, orig, src) is deprecated. Use Context(data, src=src).",
+                          DeprecationWarning, stacklevel=2)
+            data = orig
         self.pos = -1
         self.indents = []
         self.tags = []
         self.src = src
-        self.orig = orig
-        self.lines = [i for i, x in enumerate(lines) if x == "\n"]
+        self.orig = data
+        self.binary = not isinstance(data, string_types)
+        self._lines = None
         self.parser_stack = []
         self.errors = []
         self.function_error = None
+        self.memoize = False
+        self.memo = {}
+        self.memo_hits = 0
+        self.memo_misses = 0
+        self.failures = 0
+        self.dispatch = True
+        self.diagnose = True
+        self.offset = 0
+        self.line_offset = 0
+        self.col_offset = 0
+        self.profile = None
+        self.raise_failures = False
+        self.recursion = 0
+        self.max_recursion = 0
+
+    def memo_key(self, parser, pos):
+        """
+        The memo table is keyed on the parser, the position, and the contents
+        of the indent and tag stacks since :py:class:`HangingString` and
+        :py:class:`EndTagName` can succeed or fail at the same position
+        depending on them.
+        """
+        return (parser, pos, tuple(self.indents), tuple(self.tags))
 
-    def set(self, pos, msg):
+    def recall(self, key):
+        """
+        Replays a memoized result. The tag stack is restored to its state after
+        the original evaluation.
+        """
+        self.memo_hits += 1
+        res, tags = self.memo[key]
+        self.tags[:] = tags
+        return res
+
+    @property
+    def memo_hit_rate(self):
+        """
+        The fraction of memoized parser invocations answered from the memo
+        table.
+        """
+        total = self.memo_hits + self.memo_misses
+        return float(self.memo_hits) / total if total else 0.0
+
+    def set(self, pos, msg, *args):
         """
         Every parser that encounters an error calls set with the current
         position and a message. If the error is at the farthest position
@@ -181,51 +787,243 @@ class Context(object):
         beyond any previous errors, the error list is cleared before the active
         stack and new error are recorded. This is the "farthest failure
         heurstic."
+
+        If args are given, msg is a format string for them. It's only
+        formatted if the error is recorded.
         """
+        self.failures += 1
+        if not self.diagnose:
+            if pos > self.pos:
+                self.pos = pos
+            return
+
         if pos > self.pos:
             self.errors = []
 
         if pos >= self.pos:
             self.pos = pos
+            if args:
+                msg = msg.format(*args)
             self.errors.append((list(self.parser_stack), msg))
 
+    @property
+    def lines(self):
+        """
+        The positions of every newline in the input. They're only found the
+        first time a line or column number is needed. Subclasses may set them
+        like they could before they were found lazily.
+        """
+        if self._lines is None:
+            lines = array("l")
+            data = self.orig
+            if self.binary:
+                lines.extend(m.start() for m in re.finditer(b"\n", data))
+            else:
+                pos = data.find("\n")
+                while pos != -1:
+                    lines.append(pos)
+                    pos = data.find("\n", pos + 1)
+            self._lines = lines
+        return self._lines
+
+    @lines.setter
+    def lines(self, lines):
+        self._lines = lines
+
     def line(self, pos):
-        return bisect_left(self.lines, pos)
+        return self.line_offset + bisect_left(self.lines, pos)
 
     def col(self, pos):
-        p = self.line(pos)
+        p = bisect_left(self.lines, pos)
         if p == 0:
-            return pos
+            return self.col_offset + pos
         return (pos - self.lines[p - 1] - 1)
 
 
 class _ParserMeta(type):
     """
-    ParserMeta wraps every parser subclass's process function with the
-    ``_debug_hook`` decorator.
+    ParserMeta keeps track of every parser class that defines a process
+    function so :py:func:`enable_debug` can wrap them with the ``_debug_hook``
+    decorator. Until then, process functions are called directly.
+
+    Parser classes defined outside of parsr may raise exceptions to fail, so
+    their process functions are wrapped to return :py:data:`FAIL` instead.
+    They may also catch their children's exceptions to backtrack, so their
+    children raise when they fail as they did before :py:data:`FAIL` unless
+    the class sets ``checks_for_fail``.
     """
+    classes = []
+    native = set(["parsr", "parsr.compiler", "parsr.fusion"])
+    enabled = 0
+    lock = threading.Lock()
+
     def __init__(cls, name, bases, clsdict):
-        orig = getattr(cls, "process")
-        setattr(cls, "process", _debug_hook(orig))
+        super(_ParserMeta, cls).__init__(name, bases, clsdict)
+        func = clsdict.get("process")
+        if func is None:
+            return
+        if cls.__module__ not in _ParserMeta.native:
+            cls._children_raise = not cls.checks_for_fail
+            func = _convert_exceptions(func, cls._children_raise)
+            cls.process = func
+        cls._raw_process = func
+        with _ParserMeta.lock:
+            _ParserMeta.classes.append(cls)
+            if _ParserMeta.enabled:
+                cls.process = _debug_hook(func)
 
 
 class Parser(with_metaclass(_ParserMeta, Node)):
     """
     Parser is the common base class of all Parsers.
+
+    Subclasses implement :py:meth:`process`. It returns a tuple of the
+    position after the match and its value, or :py:data:`FAIL` if the input
+    doesn't match. Parsers defined outside of parsr may still raise an
+    exception to fail, and the exception is converted to :py:data:`FAIL`.
+
+    Combinators defined outside of parsr may catch their children's
+    exceptions to backtrack, like they did before :py:data:`FAIL`, so their
+    children raise an exception instead of returning :py:data:`FAIL` when
+    they fail. Combinators that check each result with ``res is FAIL`` should
+    set ``checks_for_fail`` to ``True`` so their children return
+    :py:data:`FAIL` to them, which is much cheaper.
     """
+    # Set by % and InSet's name, but not for the module level parsers
+    _named = False
+
+    # Set on combinator classes defined outside of parsr that check their
+    # children's results for FAIL instead of catching exceptions
+    checks_for_fail = False
+
+    # Set by add_child for the children of parsers whose children raise
+    _raises_failures = False
+
     def __init__(self):
         super(Parser, self).__init__()
         self.name = None
         self._debug = False
+        self._memo = False
 
     def debug(self, d=True):
         """
         Set to ``True`` to enable diagnostic messages before and after the
-        parser is invoked.
+        parser is invoked. Use :py:func:`enable_debug` to include every
+        active parser in the messages.
         """
+        self._check_mutable()
         self._debug = d
+        self._hook()
         return self
 
+    def memo(self, m=True):
+        """
+        Set to ``True`` to memoize the results of the parser by input position
+        even when the whole grammar isn't run with ``memo=True``. Use it on
+        rules that are tried several times at the same position because of
+        backtracking.
+        """
+        self._check_mutable()
+        self._memo = m
+        self._hook()
+        return self
+
+    def _hook(self):
+        """
+        Wraps this instance's process function with ``_debug_hook`` if it's
+        being debugged or memoized and with ``_raise_failures`` if it's the
+        child of a parser that catches exceptions to backtrack. It's unwrapped
+        otherwise.
+        """
+        func = None
+        if self._debug or self._memo:
+            func = _debug_hook(type(self)._raw_process)
+        if self._raises_failures:
+            func = _raise_failures(func or _class_process)
+        if func is not None:
+            self.process = functools.partial(func, self)
+        else:
+            self.__dict__.pop("process", None)
+
+    def __getstate__(self):
+        # wrapped process functions are recreated by __setstate__, and
+        # instrumented copies by _instrumented
+        state = self.__dict__.copy()
+        state.pop("process", None)
+        state.pop("_instrumented_copy", None)
+        # copies are linked to their own parents by __setstate__
+        state.pop("_parents", None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        for c in self.children:
+            c._link(self)
+        self._hook()
+
+    def freeze(self):
+        """
+        Makes the grammar of the current parser immutable and returns the
+        parser. Everything parsers would otherwise compute and cache the
+        first time they run is computed now, including the copy of the
+        grammar that failed, memoized, and profiled parses run, so parsing
+        never changes a frozen grammar. Changing its children, names, or debug and memo
+        settings raises an exception.
+
+        The module level parsers in parsr, like :py:data:`WS`,
+        :py:data:`EOF`, and :py:data:`Number`, are shared by every grammar,
+        so their caches are filled but they aren't frozen. Copies of them,
+        like the ones in a ``copy.deepcopy`` of a grammar, belong to the
+        grammar and are frozen with it. Other parsers the grammar shares with
+        grammars that aren't frozen are frozen too, so deep copy a grammar
+        before freezing it if its parts are used elsewhere.
+        """
+        stack = [self]
+        seen = set()
+        while stack:
+            node = stack.pop()
+            if node in seen:
+                continue
+            seen.add(node)
+            stack.extend(node._freeze())
+            stack.extend(node.children)
+            if node in _SHARED:
+                continue
+            node.children = tuple(node.children)
+            node._frozen = True
+        if self._frozen:
+            self.__dict__["_instrumented_copy"] = (self._stamp, _instrument(self))
+        return self
+
+    def _freeze(self):
+        """
+        Fills the parser's caches before it's frozen and returns any parsers
+        it uses besides its children.
+        """
+        return []
+
+    def first(self, seen=None):
+        """
+        Returns the FIRST set of the parser and whether it's nullable. The
+        FIRST set is the set of characters the parser can start with, or
+        ``None`` if it's unknown or any character is possible. A parser is
+        nullable if it can succeed without consuming input. The analysis is
+        conservative: a parser can fail on characters in its FIRST set, but
+        it never succeeds by consuming a character outside of it.
+        """
+        seen = set() if seen is None else seen
+        if self in seen:
+            # left recursion
+            return None, True
+        seen.add(self)
+        try:
+            return self._first(seen)
+        finally:
+            seen.discard(self)
+
+    def _first(self, seen):
+        return None, True
+
     @staticmethod
     def _accumulate(first, rest):
         results = [first] if first else []
@@ -233,6 +1031,67 @@ class Parser(with_metaclass(_ParserMeta, Node)):
             results.extend(rest)
         return results
 
+    def compile(self):
+        """
+        Return a :py:class:`parsr.compiler.Compiled` parser that does the same
+        work as the current parser with specialized closures instead of
+        ``process`` calls. Compile a grammar after all of its parts are
+        defined since later changes to it won't be seen.
+        """
+        from parsr.compiler import Compiled
+        return Compiled(self)
+
+    def optimize(self):
+        """
+        Return a :py:class:`parsr.fusion.Optimized` parser that matches the
+        regular parts of the current parser's grammar with fused regular
+        expressions. Like :py:meth:`compile`, optimize a grammar after all of
+        its parts are defined.
+        """
+        from parsr.fusion import Optimized
+        return Optimized(self)
+
+    def iterparse(self, fileobj, item, src=None, chunk_size=65536, lookahead=4096):
+        """
+        Parse a document shaped like ``Many(item) + EOF`` from a file object
+        in chunks, yielding the value of each item as soon as it's been
+        parsed. Only the current item and the chunk it's in are kept in
+        memory. After the last item, the current parser checks the rest of
+        the input and raises the usual exception if it doesn't match. A
+        syntax error in the middle of the file is raised once lookahead
+        characters past it have been read, without reading the rest.
+
+        An item is only accepted once lookahead characters past everything it
+        looked at have been read, so literals and regular expressions in it
+        must be shorter than that. See :py:mod:`parsr.stream`.
+        """
+        from parsr.stream import iterparse
+        return iterparse(self, fileobj, item, src=src, chunk_size=chunk_size,
+                         lookahead=lookahead)
+
+    def push_parser(self, callback, item=None, src=None, lookahead=4096):
+        """
+        Return a :py:class:`parsr.stream.PushParser` for input that arrives in
+        pieces. Give it each piece with ``feed`` and call ``close`` at the
+        end. If item is given, the value of each item is passed to callback
+        as soon as it's been parsed like with :py:meth:`iterparse`.
+        Otherwise, the current parser's value is passed to callback when the
+        push parser is closed.
+        """
+        from parsr.stream import PushParser
+        return PushParser(self, callback, item=item, src=src, lookahead=lookahead)
+
+    def parse_with_stats(self, data, src=None, Ctx=Context, memo=False, detail=False):
+        """
+        Parse data like :py:meth:`__call__` and return a tuple of the value
+        and a :py:class:`parsr.stats.ParseStats` that describes the parse. If
+        detail is ``True``, every parser is instrumented to also count calls
+        and stack depths, which makes parsing a few times slower. See
+        :py:mod:`parsr.stats`.
+        """
+        from parsr.stats import parse_with_stats
+        return parse_with_stats(self, data, src=src, Ctx=Ctx, memo=memo, detail=detail)
+
     def sep_by(self, sep):
         """
         Return a parser that matches zero or more instances of the current
@@ -314,13 +1173,21 @@ class Parser(with_metaclass(_ParserMeta, Node)):
         Gives the current parser a human friendly name for display in error
         messages and PEG rendering.
         """
+        self._check_mutable()
         self.name = name
+        self._named = True
         return self
 
     def process(self, pos, data, ctx):
+        """
+        Matches the input in data starting at pos. Returns a tuple of the
+        position after the match and the value it produced, or
+        :py:data:`FAIL` after recording why the match failed with
+        ``ctx.set``.
+        """
         raise NotImplementedError()
 
-    def __call__(self, data, src=None, Ctx=Context):
+    def __call__(self, data, src=None, Ctx=Context, memo=False):
         """
         Invoke the parser like a function on a regular string of characters.
 
@@ -328,16 +1195,74 @@ class Parser(with_metaclass(_ParserMeta, Node)):
         the Context instance. You also can provide a Context subclass if your
         parsers have particular needs not covered by the default
         implementation that provides significant indent and tag stacks.
+
+        Set ``memo`` to ``True`` to memoize every parser's result by input
+        position. This is packrat parsing: each parser runs at most once per
+        position, so grammars that backtrack heavily parse in linear time at
+        the cost of memory for the memo table. Parsers marked with
+        :py:meth:`Parser.memo` are memoized regardless.
+
+        If the parse fails, it runs again to collect error messages, so
+        functions given to :py:meth:`map` and :py:class:`Lift` are called
+        again for the input before the failure.
+
+        Hooks added with :py:func:`add_call_hook` are told about the call.
         """
-        chars = list(data)
-        chars.append(None)  # add a terminal so we don't overrun
-        ctx = Ctx(chars, data, src=src)
+        if _call_hooks:
+            return _observe(self, data, src, Ctx, memo)
+        return self._call(data, src, Ctx, memo)
 
+    def parse_file(self, path, src=None, Ctx=Context, memo=False):
+        """
+        Parse the file at path without reading it into memory. The file is
+        memory mapped and parsed as UTF-8 bytes, so only the values parsers
+        produce are decoded, and the operating system's page cache does the
+        I/O. Positions and columns count bytes instead of characters.
+        """
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                # empty files can't be mapped
+                return self(b"", src=src, Ctx=Ctx, memo=memo)
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
         try:
-            _, ret = self.process(0, chars, ctx)
-            return ret
-        except Exception:
-            pass
+            return self(data, src=src, Ctx=Ctx, memo=memo)
+        finally:
+            data.close()
+
+    def _call(self, data, src, Ctx, memo, start=(0, 0, 0)):
+        """
+        Does the work of :py:meth:`__call__`. start is the offset, line, and
+        column in a larger document where data begins.
+        """
+        def context():
+            ctx = Ctx(data, src=src)
+            ctx.memoize = memo
+            ctx.offset, ctx.line_offset, ctx.col_offset = start
+            return ctx
+
+        ctx = context()
+        ctx.diagnose = False
+
+        # memoizing every parser needs them all wrapped with _debug_hook
+        res = self._parse(data, ctx, memo)
+        if ctx.memo_hits or ctx.memo_misses:
+            log.debug("Memo hits: {0} misses: {1} rate: {2:.2%}".format(ctx.memo_hits,
+                                                                        ctx.memo_misses,
+                                                                        ctx.memo_hit_rate))
+        if res is not FAIL and ctx.function_error is None:
+            return res[1]
+
+        if ctx.function_error is None:
+            # The first parse only tracked how far it got. Parse again to
+            # collect error messages. Choices skip alternatives that can't
+            # match the next character, so this time they try every
+            # alternative to report what each of them expected, and every
+            # parser is wrapped with _debug_hook to maintain the parser stack.
+            ctx = context()
+            ctx.dispatch = False
+            res = self._parse(data, ctx, True)
+            if res is not FAIL and ctx.function_error is None:
+                return res[1]
 
         if ctx.function_error is not None:
             pos, msg = ctx.function_error
@@ -351,10 +1276,12 @@ class Parser(with_metaclass(_ParserMeta, Node)):
         lineno = ctx.line(ctx.pos) + 1
         colno = ctx.col(ctx.pos) + 1
         msg = "At line {0} column {1}:"
-        print(msg.format(lineno, colno, ctx.lines), file=err)
+        print(msg.format(lineno, colno), file=err)
+        v = data[ctx.pos:ctx.pos + 1] if 0 <= ctx.pos < len(data) else "EOF"
+        if ctx.binary and v != "EOF":
+            v = _decode(v)
         for parsers, msg in ctx.errors:
             names = " -> ".join([p.name for p in parsers if p.name])
-            v = data[ctx.pos] or "EOF"
             print(names, file=err)
             print("    {0} Got {1!r}.".format(msg, v), file=err)
         err.seek(0)
@@ -362,18 +1289,46 @@ class Parser(with_metaclass(_ParserMeta, Node)):
         err.close()
         raise Exception(content)
 
+    def _parse(self, data, ctx, hook):
+        parser = self._instrumented() if hook or ctx.profile is not None else self
+        try:
+            return parser.process(0, data, ctx)
+        except FunctionError:
+            return FAIL
+
+    def _instrumented(self):
+        """
+        Returns the copy of the grammar made by ``_instrument`` for parses
+        that need every parser wrapped. It's kept until the children of a
+        parser in the grammar change. Frozen grammars get theirs from
+        :py:meth:`freeze`, and parsers frozen as part of a larger grammar
+        make a new one for each parse instead of caching it.
+        """
+        cached = self.__dict__.get("_instrumented_copy")
+        if cached is None or cached[0] != self._stamp:
+            if self._frozen:
+                return _instrument(self)
+            cached = self.__dict__["_instrumented_copy"] = (self._stamp, _instrument(self))
+        return cached[1]
+
     def __repr__(self):
         return self.name or self.__class__.__name__
 
 
 class AnyChar(Parser):
+    def _first(self, seen):
+        return None, False
+
     def process(self, pos, data, ctx):
-        c = data[pos]
-        if c is not None:
-            return (pos + 1, c)
-        msg = "Expected any character."
-        ctx.set(pos, msg)
-        raise Exception(msg)
+        if pos < len(data):
+            if not ctx.binary:
+                return (pos + 1, data[pos])
+            c = data[pos]
+            if c < 0x80:
+                return (pos + 1, _ASCII[c])
+            return _utf8_char(data, pos)
+        ctx.set(pos, "Expected any character.")
+        return FAIL
 
 
 class Char(Parser):
@@ -390,14 +1345,25 @@ class Char(Parser):
     def __init__(self, char):
         super(Char, self).__init__()
         self.char = char
+        # bytes input is compared with the code of ASCII characters and the
+        # UTF-8 encoding of others
+        self.code = ord(char) if ord(char) < 128 else None
+        self.encoded = None if self.code is not None else char.encode("utf-8")
         self.name = "Char({0!r})".format(self.char)
 
+    def _first(self, seen):
+        return set([self.char]), False
+
     def process(self, pos, data, ctx):
-        if data[pos] == self.char:
-            return (pos + 1, self.char)
-        msg = "Expected {0!r}.".format(self.char)
-        ctx.set(pos, msg)
-        raise Exception(msg)
+        if pos < len(data):
+            c = data[pos]
+            if c == self.char or c == self.code:
+                return (pos + 1, self.char)
+            encoded = self.encoded
+            if encoded is not None and ctx.binary and data[pos:pos + len(encoded)] == encoded:
+                return (pos + len(encoded), self.char)
+        ctx.set(pos, "Expected {0!r}.", self.char)
+        return FAIL
 
     def __repr__(self):
         return self.name
@@ -421,15 +1387,29 @@ class InSet(Parser):
     def __init__(self, s, name=None):
         super(InSet, self).__init__()
         self.values = set(s)
+        # maps characters and the codes of ASCII characters in bytes input
+        # to the values they produce. Other characters in bytes input are
+        # decoded and looked up in values.
+        self._table = dict((c, c) for c in self.values)
+        self._table.update((ord(c), c) for c in self.values if ord(c) < 128)
+        self._wide = any(ord(c) >= 128 for c in self.values)
         self.name = name
+        self._named = name is not None
+
+    def _first(self, seen):
+        return set(self.values), False
 
     def process(self, pos, data, ctx):
-        c = data[pos]
-        if c in self.values:
-            return (pos + 1, c)
-        msg = "Expected {0}.".format(self)
-        ctx.set(pos, msg)
-        raise Exception(msg)
+        if pos < len(data):
+            c = data[pos]
+            if c in self._table:
+                return (pos + 1, self._table[c])
+            if self._wide and ctx.binary and c >= 0x80:
+                end, c = _utf8_char(data, pos)
+                if c in self.values:
+                    return (end, c)
+        ctx.set(pos, "Expected {0}.", self)
+        return FAIL
 
     def __repr__(self):
         if self.name is None:
@@ -457,13 +1437,57 @@ class String(Parser):
         self.chars = set(chars)
         self.echars = set(echars) if echars else set()
         self.min_length = min_length
+        self._bytes_regex = None
+
+    def _freeze(self):
+        self._binary()
+        return []
+
+    def _first(self, seen):
+        chars = set(self.chars)
+        if self.echars:
+            chars.add("\\")
+        return chars, self.min_length == 0
+
+    def _binary(self):
+        """
+        Returns the regular expression that matches the string in bytes
+        input, which is also used by compiled grammars.
+        """
+        if self._bytes_regex is None:
+            # escapes, then ASCII characters, then the UTF-8 encodings of the
+            # others
+            parts = [re.escape(c.encode("utf-8")) for c in sorted(self.chars) if ord(c) >= 128]
+            parts.insert(0, _byte_class(self.chars))
+            if self.echars:
+                parts.insert(0, b"\\\\" + _byte_class(self.echars))
+            self._bytes_regex = re.compile(b"(?:" + b"|".join(parts) + b")*")
+        return self._bytes_regex
+
+    def _unescape(self, value):
+        if self.echars and "\\" in value:
+            def unescape(m):
+                return m.group(1) if m.group(1) in self.echars else m.group(0)
+            value = re.sub(r"(?s)\\(.)", unescape, value)
+        return value
+
+    def _match_bytes(self, pos, data, ctx):
+        end = self._binary().match(data, pos).end()
+        value = self._unescape(_decode(data[pos:end]))
+        if len(value) < self.min_length:
+            ctx.set(pos, "Expected {0} of {1}.", self.min_length, sorted(self.chars))
+            return FAIL
+        return end, value
 
     def process(self, pos, data, ctx):
+        if ctx.binary:
+            return self._match_bytes(pos, data, ctx)
         results = []
-        p = data[pos]
+        end = len(data)
         old = pos
-        while p in self.chars or p == "\\":
-            if p == "\\" and data[pos + 1] in self.echars:
+        while pos < end:
+            p = data[pos]
+            if p == "\\" and pos + 1 < end and data[pos + 1] in self.echars:
                 results.append(data[pos + 1])
                 pos += 2
             elif p in self.chars:
@@ -471,11 +1495,9 @@ class String(Parser):
                 pos += 1
             else:
                 break
-            p = data[pos]
         if len(results) < self.min_length:
-            msg = "Expected {0} of {1}.".format(self.min_length, sorted(self.chars))
-            ctx.set(old, msg)
-            raise Exception(msg)
+            ctx.set(old, "Expected {0} of {1}.", self.min_length, sorted(self.chars))
+            return FAIL
         return pos, "".join(results)
 
 
@@ -495,12 +1517,15 @@ class StringUntil(Parser):
         self.add_child(AnyChar.until(term, upper=upper).map(lambda x: "".join(x)) & term)
         self.lower = lower
 
+    def _first(self, seen):
+        return self.children[0].first(seen)
+
     def process(self, pos, data, ctx):
-        (newpos, res) = self.children[0].process(pos, data, ctx)
-        if self.lower is not None and len(res) < self.lower:
-            ctx.set(pos, "Expected at least {0} characters.".format(self.lower))
-            raise Exception()
-        return newpos, res
+        res = self.children[0].process(pos, data, ctx)
+        if res is not FAIL and self.lower is not None and len(res[1]) < self.lower:
+            ctx.set(pos, "Expected at least {0} characters.", self.lower)
+            return FAIL
+        return res
 
 
 class Regex(Parser):
@@ -513,6 +1538,12 @@ class Regex(Parser):
             identifier("abcd1") # returns "abcd1"
             identifier("1bcd1") # raises an exception
 
+    The pattern is matched in place, starting at the current position,
+    without copying the rest of the input. Patterns that use ``^``, ``\\A``,
+    or a lookbehind, and parsers with ``return_match`` set, are matched
+    against a copy of the rest of the input instead, so ``^`` matches at the
+    current position, lookbehinds can't see the text before it, and the spans
+    of the match objects are relative to it, as they always have been.
     """
     def __init__(self, pattern, flags=0, return_match=False):
         super(Regex, self).__init__()
@@ -520,16 +1551,51 @@ class Regex(Parser):
         self.flags = flags
         self.regex = re.compile(pattern, flags)
         self.return_match = return_match
+        # matched against the rest of the input instead of in place
+        self._sliced = return_match or _regex_anchored(pattern, flags)
+        self._first_set = None
+        self._bytes_regex = None
+
+    def _freeze(self):
+        self.first()
+        self._binary()
+        return []
+
+    def _first(self, seen):
+        if self._first_set is None:
+            self._first_set = _regex_first(self.pattern, self.flags)
+        return self._first_set
+
+    def _binary(self):
+        """
+        Returns the pattern compiled for bytes input.
+        """
+        if self._bytes_regex is None:
+            flags = self.flags & ~re.UNICODE
+            self._bytes_regex = re.compile(self.pattern.encode("utf-8"), flags)
+        return self._bytes_regex
 
     def process(self, pos, data, ctx):
-        try:
-            m = self.regex.match(ctx.orig[pos:])
-            start, end = m.span()
-            res = m if self.return_match else ctx.orig[pos:pos + end]
-            return pos + end, res
-        except:
-            ctx.set(pos, "Expected pattern {0!r} (flags={1}).".format(self.pattern, self.flags))
-            raise Exception()
+        regex = self._binary() if ctx.binary else self.regex
+        if self._sliced:
+            m = regex.match(data[pos:])
+            if m is not None:
+                end = pos + m.end()
+                if self.return_match:
+                    return end, m
+                return end, (_decode(data[pos:end]) if ctx.binary else data[pos:end])
+        elif ctx.binary:
+            m = regex.match(data, pos)
+            if m is not None:
+                end = m.end()
+                return end, _decode(data[pos:end])
+        else:
+            m = regex.match(data, pos)
+            if m is not None:
+                end = m.end()
+                return end, data[pos:end]
+        ctx.set(pos, "Expected pattern {0!r} (flags={1}).", self.pattern, self.flags)
+        return FAIL
 
 
 class Literal(Parser):
@@ -573,30 +1639,43 @@ class Literal(Parser):
         self.chars = chars if not ignore_case else chars.lower()
         self.value = value
         self.ignore_case = ignore_case
+        self.bytes = self.chars.encode("utf-8")
         self.name = "Literal{0!r}".format(self.chars)
 
+    def _first(self, seen):
+        if self.ignore_case:
+            # more than the upper and lower case versions can lower to a char
+            return None, True
+        if not self.chars:
+            return set(), True
+        return set([self.chars[0]]), False
+
     def process(self, pos, data, ctx):
-        old = pos
+        if ctx.binary:
+            size = len(self.bytes)
+            if not self.ignore_case:
+                if data[pos:pos + size] == self.bytes:
+                    return pos + size, (self.chars if self.value is self._NULL else self.value)
+                ctx.set(pos, "Expected {0!r}.", self.chars)
+                return FAIL
+            text = _decode(data[pos:pos + size])
+            if len(text) == len(self.chars) and text.lower() == self.chars:
+                return pos + size, (text if self.value is self._NULL else self.value)
+            ctx.set(pos, "Expected case insensitive {0!r}.", self.chars)
+            return FAIL
+
+        size = len(self.chars)
         if not self.ignore_case:
-            for c in self.chars:
-                if data[pos] == c:
-                    pos += 1
-                else:
-                    msg = "Expected {0!r}.".format(self.chars)
-                    ctx.set(old, msg)
-                    raise Exception(msg)
-            return pos, (self.chars if self.value is self._NULL else self.value)
+            if data.startswith(self.chars, pos):
+                return pos + size, (self.chars if self.value is self._NULL else self.value)
+            ctx.set(pos, "Expected {0!r}.", self.chars)
+            return FAIL
         else:
-            result = []
-            for c in self.chars:
-                if data[pos].lower() == c:
-                    result.append(data[pos])
-                    pos += 1
-                else:
-                    msg = "Expected case insensitive {0!r}.".format(self.chars)
-                    ctx.set(old, msg)
-                    raise Exception(msg)
-            return pos, ("".join(result) if self.value is self._NULL else self.value)
+            text = data[pos:pos + size]
+            if len(text) == size and text.lower() == self.chars:
+                return pos + size, (text if self.value is self._NULL else self.value)
+            ctx.set(pos, "Expected case insensitive {0!r}.", self.chars)
+            return FAIL
 
 
 class Wrapper(Parser):
@@ -609,6 +1688,9 @@ class Wrapper(Parser):
         super(Wrapper, self).__init__()
         self.add_child(parser)
 
+    def _first(self, seen):
+        return self.children[0].first(seen)
+
     def process(self, pos, data, ctx):
         return self.children[0].process(pos, data, ctx)
 
@@ -634,10 +1716,12 @@ class PosMarker(Wrapper):
     initial input position will be returned as a :py:class:`Mark`.
     """
     def process(self, pos, data, ctx):
-        lineno = ctx.line(pos) + 1
-        col = ctx.col(pos) + 1
-        newpos, result = super(PosMarker, self).process(pos, data, ctx)
-        return newpos, Mark(lineno, col, result, pos, newpos)
+        res = super(PosMarker, self).process(pos, data, ctx)
+        if res is FAIL:
+            return FAIL
+        newpos, result = res
+        start, end = pos + ctx.offset, newpos + ctx.offset
+        return newpos, Mark(ctx.line(pos) + 1, ctx.col(pos) + 1, result, start, end)
 
 
 class Sequence(Parser):
@@ -682,11 +1766,17 @@ class Sequence(Parser):
     def __add__(self, other):
         return self.add_child(other)
 
+    def _first(self, seen):
+        return _first_of(self.children, seen)
+
     def process(self, pos, data, ctx):
         results = []
         for p in self.children:
-            pos, res = p.process(pos, data, ctx)
-            results.append(res)
+            res = p.process(pos, data, ctx)
+            if res is FAIL:
+                return FAIL
+            pos, val = res
+            results.append(val)
         return pos, results
 
 
@@ -710,21 +1800,80 @@ class Choice(Parser):
             val = abc("b")    # parses a single "b"
             val = abc("c")    # parses a single "c"
             val = abc("d")    # raises an exception
+
+    The first time a choice runs, it uses the FIRST sets of its alternatives
+    to build a table from each character to the alternatives that can start
+    with it. After that it only tries those alternatives, in their original
+    order, along with any that can match without consuming input or whose
+    FIRST sets are unknown. The table is rebuilt if the choice or any parser
+    below it changes.
     """
     def __init__(self, children):
         super(Choice, self).__init__()
+        self._table = None
+        self._table_version = -1
         self.set_children(children)
 
     def __or__(self, other):
         return self.add_child(other)
 
-    def process(self, pos, data, ctx):
+    def _first(self, seen):
+        chars = set()
+        nullable = False
         for c in self.children:
-            try:
-                return c.process(pos, data, ctx)
-            except:
-                pass
-        raise Exception()
+            first, n = c.first(seen)
+            if first is None:
+                return None, True
+            chars |= first
+            nullable = nullable or n
+        return chars, nullable
+
+    def _dispatch(self):
+        """
+        Returns a dictionary from characters to the alternatives that can
+        start with them and the list of alternatives to try for other
+        characters.
+        """
+        # the children of a frozen choice can't change, so its table is kept
+        if self._table_version != self._stamp and not (self._frozen and self._table):
+            self._build_table()
+        return self._table
+
+    def _freeze(self):
+        self._dispatch()
+        return []
+
+    def _build_table(self):
+        firsts = []
+        for c in self.children:
+            first, nullable = c.first()
+            firsts.append(None if nullable else first)
+
+        table = {}
+        for char in set().union(*[f for f in firsts if f is not None]):
+            table[char] = [c for c, f in zip(self.children, firsts) if f is None or char in f]
+        # bytes input is dispatched on the codes of ASCII characters. Other
+        # bytes are part of UTF-8 sequences, so every alternative is tried.
+        for char in list(table):
+            if ord(char) < 128:
+                table[ord(char)] = table[char]
+        for code in range(128, 256):
+            table[code] = list(self.children)
+        default = [c for c, f in zip(self.children, firsts) if f is None]
+        self._table = (table, default)
+        self._table_version = self._stamp
+
+    def process(self, pos, data, ctx):
+        alternatives = self.children
+        if ctx.dispatch and pos < len(data):
+            table, default = self._dispatch()
+            alternatives = table.get(data[pos], default)
+
+        for c in alternatives:
+            res = c.process(pos, data, ctx)
+            if res is not FAIL:
+                return res
+        return FAIL
 
 
 class Many(Parser):
@@ -766,27 +1915,27 @@ class Many(Parser):
         self.lower = lower
         self.upper = upper
 
+    def _first(self, seen):
+        first, nullable = self.children[0].first(seen)
+        return first, nullable or self.lower == 0
+
     def process(self, pos, data, ctx):
         orig = pos
         results = []
         p = self.children[0]
         while True:
-            try:
-                pos, res = p.process(pos, data, ctx)
-                results.append(res)
-            except Exception:
+            res = p.process(pos, data, ctx)
+            if res is FAIL:
                 break
+            pos, val = res
+            results.append(val)
         if len(results) < self.lower:
-            child = self.children[0]
-            msg = "Expected at least {0} of {1}.".format(self.lower, child)
-            ctx.set(orig, msg)
-            raise Exception()
+            ctx.set(orig, "Expected at least {0} of {1}.", self.lower, self.children[0])
+            return FAIL
 
         if self.upper is not None and len(results) > self.upper:
-            child = self.children[0]
-            msg = "Expected at most {0} of {1}.".format(self.upper, child)
-            ctx.set(orig, msg)
-            raise Exception()
+            ctx.set(orig, "Expected at most {0} of {1}.", self.upper, self.children[0])
+            return FAIL
 
         return pos, results
 
@@ -824,25 +1973,22 @@ class Until(Parser):
         self.set_children([parser, predicate])
         self.upper = upper
 
+    def _first(self, seen):
+        return self.children[0].first(seen)[0], True
+
     def process(self, pos, data, ctx):
         bound = self.upper
         parser, pred = self.children
         results = []
-        while True:
-            try:
-                pred.process(pos, data, ctx)
-            except Exception:
-                try:
-                    pos, res = parser.process(pos, data, ctx)
-                    results.append(res)
-                except Exception:
-                    break
-                if bound is not None and len(results) > bound:
-                    msg = "{0} matched more than {1}.".format(parser, bound)
-                    ctx.set(pos, msg)
-                    raise Exception()
-            else:
+        while pred.process(pos, data, ctx) is FAIL:
+            res = parser.process(pos, data, ctx)
+            if res is FAIL:
                 break
+            pos, val = res
+            results.append(val)
+            if bound is not None and len(results) > bound:
+                ctx.set(pos, "{0} matched more than {1}.", parser, bound)
+                return FAIL
         return pos, results
 
 
@@ -867,11 +2013,22 @@ class FollowedBy(Parser):
         super(FollowedBy, self).__init__()
         self.set_children([child, follow])
 
+    def _first(self, seen):
+        left, right = self.children
+        first, nullable = left.first(seen)
+        if first is None or not nullable:
+            return first, nullable
+        other, nullable = right.first(seen)
+        if other is None:
+            return None, True
+        return first | other, nullable
+
     def process(self, pos, data, ctx):
         left, right = self.children
-        new, res = left.process(pos, data, ctx)
-        right.process(new, data, ctx)
-        return new, res
+        res = left.process(pos, data, ctx)
+        if res is FAIL or right.process(res[0], data, ctx) is FAIL:
+            return FAIL
+        return res
 
 
 class NotFollowedBy(Parser):
@@ -894,17 +2051,19 @@ class NotFollowedBy(Parser):
         super(NotFollowedBy, self).__init__()
         self.set_children([child, follow])
 
+    def _first(self, seen):
+        return self.children[0].first(seen)
+
     def process(self, pos, data, ctx):
         left, right = self.children
-        new, res = left.process(pos, data, ctx)
-        try:
-            right.process(new, data, ctx)
-        except Exception:
-            return new, res
-        else:
-            msg = "{0} can't follow {1}".format(right, left)
-            ctx.set(new, msg)
-            raise Exception()
+        res = left.process(pos, data, ctx)
+        if res is FAIL:
+            return FAIL
+        new = res[0]
+        if right.process(new, data, ctx) is FAIL:
+            return res
+        ctx.set(new, "{0} can't follow {1}", right, left)
+        return FAIL
 
 
 class KeepLeft(Parser):
@@ -927,11 +2086,19 @@ class KeepLeft(Parser):
         super(KeepLeft, self).__init__()
         self.set_children([left, right])
 
+    def _first(self, seen):
+        return _first_of(self.children, seen)
+
     def process(self, pos, data, ctx):
         left, right = self.children
-        pos, res = left.process(pos, data, ctx)
-        pos, _ = right.process(pos, data, ctx)
-        return pos, res
+        res = left.process(pos, data, ctx)
+        if res is FAIL:
+            return FAIL
+        pos, val = res
+        res = right.process(pos, data, ctx)
+        if res is FAIL:
+            return FAIL
+        return res[0], val
 
 
 class KeepRight(Parser):
@@ -954,10 +2121,15 @@ class KeepRight(Parser):
         super(KeepRight, self).__init__()
         self.set_children([left, right])
 
+    def _first(self, seen):
+        return _first_of(self.children, seen)
+
     def process(self, pos, data, ctx):
         left, right = self.children
-        pos, _ = left.process(pos, data, ctx)
-        return right.process(pos, data, ctx)
+        res = left.process(pos, data, ctx)
+        if res is FAIL:
+            return FAIL
+        return right.process(res[0], data, ctx)
 
 
 class Opt(Parser):
@@ -985,11 +2157,14 @@ class Opt(Parser):
         self.add_child(p)
         self.default = default
 
+    def _first(self, seen):
+        return self.children[0].first(seen)[0], True
+
     def process(self, pos, data, ctx):
-        try:
-            return self.children[0].process(pos, data, ctx)
-        except Exception:
+        res = self.children[0].process(pos, data, ctx)
+        if res is FAIL:
             return pos, self.default
+        return res
 
 
 class Map(Parser):
@@ -1005,24 +2180,34 @@ class Map(Parser):
             Digits = Many(Digit, lower=1)
             Number = Digits.map(lambda x: int("".join(x)))
 
+    The function can be called more than once for the same input. Backtracking
+    throws away values it already built, and a parse that fails runs again to
+    collect error messages, calling it again for everything before the
+    failure. It shouldn't have side effects.
     """
     def __init__(self, child, func):
         super(Map, self).__init__()
         self.add_child(child)
         self.func = func
 
+    def _first(self, seen):
+        return self.children[0].first(seen)
+
     def process(self, pos, data, ctx):
-        pos, res = self.children[0].process(pos, data, ctx)
+        res = self.children[0].process(pos, data, ctx)
+        if res is FAIL:
+            return FAIL
+        pos, val = res
         try:
-            return pos, self.func(res)
+            return pos, self.func(val)
         except Backtrack as bt:
             ctx.set(pos, bt.msg)
-            raise
-        except:
+            return FAIL
+        except Exception:
             tb = traceback.format_exc()
             msg = (self.name or "Map") + " raised{l}{tb}".format(l=os.linesep, tb=tb)
             ctx.function_error = (pos, msg)
-            raise
+            raise FunctionError(msg)
 
     def __repr__(self):
         if not self.name:
@@ -1059,6 +2244,8 @@ class Lift(Parser):
             val = p("xyz")  # would return "xyz"
             val = p("xyx")  # raises an exception. nothing would be consumed
 
+    Like the function :py:class:`Map` wraps, the function can be called more
+    than once for the same input and shouldn't have side effects.
     """
     def __init__(self, func):
         super(Lift, self).__init__()
@@ -1067,22 +2254,28 @@ class Lift(Parser):
     def __mul__(self, other):
         return self.add_child(other)
 
+    def _first(self, seen):
+        return _first_of(self.children, seen)
+
     def process(self, pos, data, ctx):
         results = []
         for c in self.children:
-            pos, res = c.process(pos, data, ctx)
-            results.append(res)
+            res = c.process(pos, data, ctx)
+            if res is FAIL:
+                return FAIL
+            pos, val = res
+            results.append(val)
         try:
             return pos, self.func(*results)
         except Backtrack as bt:
             ctx.set(pos, bt.msg)
-            raise
-        except:
+            return FAIL
+        except Exception:
             tb = traceback.format_exc()
             msg = (self.name or "Lift") + " raised{l}{tb}".format(l=os.linesep, tb=tb)
             ctx.set(pos, msg)
             ctx.function_error = (pos, msg)
-            raise
+            raise FunctionError(msg)
 
 
 class Forward(Parser):
@@ -1109,8 +2302,21 @@ class Forward(Parser):
     def __le__(self, delegate):
         self.set_children([delegate])
 
+    def _first(self, seen):
+        if not self.children:
+            return None, True
+        return self.children[0].first(seen)
+
     def process(self, pos, data, ctx):
-        return self.children[0].process(pos, data, ctx)
+        # grammars can only recurse through Forward, so this is how deeply
+        # they nest
+        n = ctx.recursion = ctx.recursion + 1
+        if n > ctx.max_recursion:
+            ctx.max_recursion = n
+        try:
+            return self.children[0].process(pos, data, ctx)
+        finally:
+            ctx.recursion = n - 1
 
 
 class EOF(Parser):
@@ -1124,12 +2330,15 @@ class EOF(Parser):
             Top = Expr << EOF
 
     """
+    def _first(self, seen):
+        # EOF never matches when there's a next character
+        return set(), False
+
     def process(self, pos, data, ctx):
-        if data[pos] is None:
+        if pos >= len(data):
             return pos, None
-        msg = "Expected end of input."
-        ctx.set(pos, msg)
-        raise Exception(msg)
+        ctx.set(pos, "Expected end of input.")
+        return FAIL
 
 
 class EnclosedComment(Parser):
@@ -1149,6 +2358,9 @@ class EnclosedComment(Parser):
         p = Start >> AnyChar.until(End).map(lambda x: "".join(x)) << End
         self.add_child(p)
 
+    def _first(self, seen):
+        return self.children[0].first(seen)
+
     def process(self, pos, data, ctx):
         return self.children[0].process(pos, data, ctx)
 
@@ -1169,6 +2381,9 @@ class OneLineComment(Parser):
         p = Literal(s) >> Opt(AnyChar.until(InSet("\r\n")), "")
         self.add_child(p)
 
+    def _first(self, seen):
+        return self.children[0].first(seen)
+
     def process(self, pos, data, ctx):
         return self.children[0].process(pos, data, ctx)
 
@@ -1192,8 +2407,11 @@ class WithIndent(Wrapper):
             KVPair = WithIndent(Key + Opt(Sep >> Value))
 
     """
+    def _first(self, seen):
+        return _first_of([WS, self.children[0]], seen)
+
     def process(self, pos, data, ctx):
-        new, _ = WS.process(pos, data, ctx)
+        new = WS.process(pos, data, ctx)[0]
         try:
             ctx.indents.append(ctx.col(new))
             return self.children[0].process(new, data, ctx)
@@ -1218,21 +2436,23 @@ class HangingString(Parser):
         p = String(chars, echars=echars, min_length=min_length)
         self.add_child(p << (EOL | EOF))
 
+    def _first(self, seen):
+        return self.children[0].first(seen)[0], True
+
     def process(self, pos, data, ctx):
         old = pos
         results = []
-        while True:
-            try:
-                if ctx.col(pos) > ctx.indents[-1]:
-                    pos, res = self.children[0].process(pos, data, ctx)
-                    results.append(res.rstrip(" \\"))
-                else:
-                    pos = old
-                    break
-                old = pos
-                pos, _ = WS.process(pos, data, ctx)
-            except Exception:
+        while ctx.indents:
+            if ctx.col(pos) <= ctx.indents[-1]:
+                pos = old
+                break
+            res = self.children[0].process(pos, data, ctx)
+            if res is FAIL:
                 break
+            pos, val = res
+            results.append(val.rstrip(" \\"))
+            old = pos
+            pos = WS.process(pos, data, ctx)[0]
         ret = " ".join(results)
         return pos, ret
 
@@ -1243,10 +2463,17 @@ class StartTagName(Wrapper):
     etc. The tag result is captured and put onto a tag stack in the
     :py:class:`Context` object.
     """
+    def _first(self, seen):
+        first, nullable = self.children[0].first(seen)
+        # nullable tags change the tag stack without consuming input
+        return (None, True) if nullable else (first, nullable)
+
     def process(self, pos, data, ctx):
-        pos, res = self.children[0].process(pos, data, ctx)
-        ctx.tags.append(res)
-        return pos, res
+        res = self.children[0].process(pos, data, ctx)
+        if res is FAIL:
+            return FAIL
+        ctx.tags.append(res[1])
+        return res
 
 
 class EndTagName(Wrapper):
@@ -1260,8 +2487,15 @@ class EndTagName(Wrapper):
         super(EndTagName, self).__init__(parser)
         self.ignore_case = ignore_case
 
+    def _first(self, seen):
+        first, nullable = self.children[0].first(seen)
+        return (None, True) if nullable else (first, nullable)
+
     def process(self, pos, data, ctx):
-        pos, res = self.children[0].process(pos, data, ctx)
+        res = self.children[0].process(pos, data, ctx)
+        if res is FAIL or not ctx.tags:
+            return FAIL
+        pos, res = res
         expect = ctx.tags.pop()
 
         r, e = res, expect
@@ -1271,9 +2505,8 @@ class EndTagName(Wrapper):
             e = expect.lower()
 
         if r != e:
-            msg = "Expected {0!r}. Got {1!r}.".format(expect, res)
-            ctx.set(pos, msg)
-            raise Exception(msg)
+            ctx.set(pos, "Expected {0!r}. Got {1!r}.", expect, res)
+            return FAIL
         return pos, res
 
 
@@ -1282,11 +2515,23 @@ def skip_none(x):
 
 
 class Space(Parser):
+    def _first(self, seen):
+        return set(_whitespace()), False
+
     def process(self, pos, data, ctx):
-        if data[pos].isspace():
-            return pos + 1, data[pos]
+        if pos < len(data):
+            c = data[pos]
+            if ctx.binary:
+                if c in _ASCII_SPACE:
+                    return pos + 1, _ASCII_SPACE[c]
+                if c >= 0x80:
+                    end, c = _utf8_char(data, pos)
+                    if c.isspace():
+                        return end, c
+            elif c.isspace():
+                return pos + 1, c
         ctx.set(pos, "Expected whitespace character.")
-        raise Exception()
+        return FAIL
 
 
 EOF = EOF() % "EOF"
@@ -1318,3 +2563,17 @@ Number = Regex(r"-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?").map(float) % "Num
 SingleQuotedString = Char("'") >> String(set(string.printable) - set("'"), "'") << Char("'")
 DoubleQuotedString = Char('"') >> String(set(string.printable) - set('"'), '"') << Char('"')
 QuotedString = Wrapper(DoubleQuotedString | SingleQuotedString) % "quoted string"
+
+# The parsers above and their children are shared by every grammar that uses
+# them, so freezing a grammar leaves them alone. Their names are for error
+# messages. Call hooks attribute failures to the rules of the grammars that
+# use them.
+_SHARED = set()
+_stack = [p for p in globals().values() if isinstance(p, Parser)]
+while _stack:
+    _p = _stack.pop()
+    if _p not in _SHARED:
+        _SHARED.add(_p)
+        _p.__dict__.pop("_named", None)
+        _stack.extend(_p.children)
+del _p, _stack
@@ -0,0 +1,104 @@
+"""
+aio parses files from asyncio code without blocking the event loop. Files are
+read and parsed in an executor, the loop's default thread pool unless another
+is given, while the loop keeps serving everything else.
+
+    .. code-block:: python
+
+        from parsr import aio
+        from parsr.examples import nginx_conf
+
+        conf = await aio.parse_file(nginx_conf.loads, "/etc/nginx/nginx.conf")
+
+        async for res in aio.parse_files(nginx_conf.loads, paths, concurrency=8):
+            if res.error is None:
+                await store(res.path, res.value)
+
+The grammar can be a parser or any function that takes the contents of a
+file. Parsing holds the GIL, so use a
+:py:class:`concurrent.futures.ProcessPoolExecutor` to parse on several cores.
+Grammars usually can't be pickled, so name them with a ``"module:attribute"``
+reference for process pools, like with :py:func:`parsr.batch.parse_many`.
+
+:py:func:`parse_files` only parses concurrency files at a time, and it doesn't
+start more until the ones it's finished have been consumed. Cancelling the
+task that's iterating over it, or closing it early, cancels the parses that
+haven't started yet. Parses that are already running in the executor can't be
+interrupted, so they finish in the background and their values are dropped.
+"""
+import asyncio
+import io
+
+from parsr.batch import resolve, Result
+
+# Grammars resolved from references in this process.
+_resolved = {}
+
+# get_running_loop is new in python 3.7. Inside a coroutine, get_event_loop
+# returns the same loop on 3.6.
+_running_loop = getattr(asyncio, "get_running_loop", asyncio.get_event_loop)
+
+
+def _parse_path(grammar, path, encoding):
+    if isinstance(grammar, str):
+        if grammar not in _resolved:
+            _resolved[grammar] = resolve(grammar)
+        grammar = _resolved[grammar]
+    with io.open(path, encoding=encoding) as f:
+        data = f.read()
+    return grammar(data)
+
+
+async def parse_file(grammar, path, executor=None, encoding="utf-8"):
+    """
+    Reads and parses the file at path with grammar in executor and returns
+    its value. Exceptions from reading or parsing the file are raised.
+    """
+    loop = _running_loop()
+    return await loop.run_in_executor(executor, _parse_path, grammar, path, encoding)
+
+
+async def _paths(paths):
+    if hasattr(paths, "__aiter__"):
+        async for path in paths:
+            yield path
+    else:
+        for path in paths:
+            yield path
+
+
+async def parse_files(grammar, paths, concurrency=4, executor=None, encoding="utf-8"):
+    """
+    Parses the files at paths, which can be an iterable or an async
+    iterable, with grammar in executor, concurrency files at a time. Yields a
+    :py:class:`parsr.batch.Result` for each file as soon as it's been parsed.
+    """
+    pending = {}
+    paths = _paths(paths)
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(pending) < concurrency:
+                try:
+                    path = await paths.__anext__()
+                except StopAsyncIteration:
+                    exhausted = True
+                    break
+                task = asyncio.ensure_future(parse_file(grammar, path, executor, encoding))
+                pending[task] = path
+
+            if not pending:
+                break
+
+            done, _ = await asyncio.wait(list(pending), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                path = pending.pop(task)
+                ex = task.exception()
+                res = Result(path, None, ex) if ex is not None else Result(path, task.result(), None)
+                yield res
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        await paths.aclose()
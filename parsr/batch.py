@@ -0,0 +1,129 @@
+"""
+batch parses many files with a pool of processes. Grammars usually contain
+lambdas and can't be pickled, so they're named by reference instead, like
+``"parsr.examples.nginx_conf:Top"``. Each worker imports the grammar once and
+then parses the files it's given in chunks.
+
+    .. code-block:: python
+
+        from parsr.batch import parse_many
+
+        for res in parse_many("parsr.examples.nginx_conf:loads", paths, workers=8):
+            if res.error is None:
+                index(res.path, res.value)
+            else:
+                log.warning("%s: %s", res.path, res.error)
+
+A reference is a module and an attribute in it separated by a colon. The
+attribute can be a parser or any function that takes the contents of a file,
+like the ``loads`` functions of the examples.
+
+Results are yielded in the same order as the paths as soon as the chunk
+they're in has been parsed. Only a few chunks per worker are queued at a time,
+so a long list of paths doesn't have to be read into memory first.
+"""
+import importlib
+import io
+import multiprocessing
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+# Chunks in flight for each worker.
+QUEUED_PER_WORKER = 2
+
+Result = namedtuple("Result", ["path", "value", "error"])
+Result.__doc__ = """
+The value parsed from the file at path, or the exception that kept it from
+being parsed.
+"""
+
+# Grammars resolved from references in a worker process.
+_resolved = {}
+
+
+def resolve(ref):
+    """
+    Returns the object named by a ``"module:attribute"`` reference. The
+    attribute can be dotted.
+    """
+    module, sep, attr = ref.partition(":")
+    if not sep or not attr:
+        raise Exception("Grammar reference {0!r} isn't like 'module:attribute'.".format(ref))
+    obj = importlib.import_module(module)
+    for name in attr.split("."):
+        obj = getattr(obj, name)
+    return obj
+
+
+def parse_path(grammar, path, encoding="utf-8"):
+    """
+    Parses the file at path with grammar and returns a :py:class:`Result`.
+    """
+    try:
+        with io.open(path, encoding=encoding) as f:
+            data = f.read()
+        return Result(path, grammar(data), None)
+    except Exception as ex:
+        return Result(path, None, ex)
+
+
+def _parse_chunk(ref, paths, encoding):
+    # the reference is sent with each chunk instead of to an initializer,
+    # which ProcessPoolExecutor doesn't take before python 3.7
+    if ref not in _resolved:
+        _resolved[ref] = resolve(ref)
+    grammar = _resolved[ref]
+    return [parse_path(grammar, p, encoding) for p in paths]
+
+
+def _chunks(paths, chunksize):
+    chunk = []
+    for path in paths:
+        chunk.append(path)
+        if len(chunk) == chunksize:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _results(chunk, future):
+    try:
+        return future.result()
+    except Exception as ex:
+        # the values couldn't be sent back or the worker died
+        return [Result(path, None, ex) for path in chunk]
+
+
+def parse_many(grammar_ref, paths, workers=None, chunksize=64, encoding="utf-8", mp_context=None):
+    """
+    Parses each of paths with the grammar named by grammar_ref in a pool of
+    workers processes and yields a :py:class:`Result` for each of them.
+    workers defaults to the number of CPUs, and each worker is given
+    chunksize paths at a time. If workers is 1, the files are parsed in this
+    process. mp_context needs python 3.7 or later.
+    """
+    # fail here instead of in every worker if the reference is wrong
+    grammar = resolve(grammar_ref)
+    workers = workers or multiprocessing.cpu_count()
+    if workers == 1:
+        for path in paths:
+            yield parse_path(grammar, path, encoding)
+        return
+
+    pending = deque()
+    options = {"mp_context": mp_context} if mp_context is not None else {}
+    with ProcessPoolExecutor(max_workers=workers, **options) as pool:
+        try:
+            for chunk in _chunks(paths, chunksize):
+                pending.append((chunk, pool.submit(_parse_chunk, grammar_ref, chunk, encoding)))
+                if len(pending) >= workers * QUEUED_PER_WORKER:
+                    for res in _results(*pending.popleft()):
+                        yield res
+            while pending:
+                for res in _results(*pending.popleft()):
+                    yield res
+        finally:
+            # the caller stopped early
+            for _, future in pending:
+                future.cancel()
@@ -0,0 +1,992 @@
+"""
+codegen writes a parser graph out as a standalone python module. The module
+has a function for every named or shared rule in the grammar with the
+character tests and loops of the rest inlined into them, and it has a
+``parse(data, src=None)`` function that works like invoking the original
+grammar. Importing it doesn't construct any :py:class:`parsr.Parser` objects.
+
+    .. code-block:: python
+
+        from parsr import codegen
+        from parsr.examples.nginx_conf import Top
+
+        with open("nginx_parser.py", "w") as f:
+            f.write(codegen.generate(Top))
+
+        import nginx_parser
+        val = nginx_parser.parse(data)
+
+It's also available from the command line.
+
+    .. code-block:: bash
+
+        python -m parsr.codegen parsr.examples.nginx_conf:Top -o nginx_parser.py
+
+Functions given to :py:meth:`parsr.Parser.map` and :py:class:`parsr.Lift`
+are copied into the module from their source along with any functions they
+call. Classes and modules they use are imported. Functions that close over
+local variables can't be copied, so grammars that use them can't be
+generated.
+
+Generation is deterministic. The module's ``FINGERPRINT`` is a hash of its
+source, and :py:func:`fingerprint` computes it for a grammar without writing
+anything, so generated modules can be cached and regenerated only when their
+grammar changes.
+
+Error messages from generated modules report the farthest position reached
+and what was expected there, but they don't include the names of the rules
+that were active like the original grammar's do.
+"""
+from __future__ import print_function
+import argparse
+import ast
+import hashlib
+import importlib
+import inspect
+import io
+import linecache
+import os
+import re
+import sys
+import textwrap
+import tokenize
+import traceback
+import types
+from bisect import bisect_left
+
+import parsr
+from parsr import (Char, Choice, EnclosedComment, EndTagName, FollowedBy,
+        Forward, HangingString, InSet, KeepLeft, KeepRight, Lift, Literal,
+        Many, Map, NotFollowedBy, OneLineComment, Opt, Parser, PosMarker,
+        Regex, Sequence, StartTagName, String, StringUntil, Until, WithIndent,
+        Wrapper)
+from parsr.batch import resolve
+from parsr.compiler import AnyCharType, char_class, EOFType, SpaceType
+from parsr.fusion import Fused, Optimized
+
+try:
+    import builtins
+except ImportError:  # pragma: no cover
+    import __builtin__ as builtins
+
+# Composite parsers nested deeper than this are moved into their own
+# functions to stay under python's limit on nested blocks.
+MAX_DEPTH = 12
+
+HEADER = '''"""
+Generated by parsr.codegen from {source}. Don't edit it by hand.
+"""
+'''
+
+RUNTIME = '''
+class Mark(object):
+    def __init__(self, lineno, col, value, start, end):
+        self.lineno = lineno
+        self.col = col
+        self.value = value
+        self.start = start
+        self.end = end
+
+
+class State(object):
+    __slots__ = ("data", "src", "far", "expected", "indents", "tags", "lines", "function_error")
+
+    def __init__(self, data, src):
+        self.data = data
+        self.src = src
+        self.far = -1
+        self.expected = []
+        self.indents = []
+        self.tags = []
+        self.lines = None
+        self.function_error = None
+
+
+class FunctionError(Exception):
+    pass
+
+
+def _line(st, pos):
+    if st.lines is None:
+        st.lines = [m.start() for m in re.finditer("\\n", st.data)]
+    return bisect_left(st.lines, pos)
+
+
+def _col(st, pos):
+    p = _line(st, pos)
+    if p == 0:
+        return pos
+    return pos - st.lines[p - 1] - 1
+
+
+def _expect(st, pos, msg):
+    if pos > st.far:
+        st.far = pos
+        st.expected = []
+    st.expected.append(msg)
+
+
+def _action_failed(st, pos, name):
+    # Mapped and lifted functions fail without stopping the parse by raising
+    # parsr.Backtrack. parsr is only checked if it's already been imported.
+    ex = sys.exc_info()[1]
+    p = sys.modules.get("parsr")
+    if p is not None and isinstance(ex, p.Backtrack):
+        return -1
+    msg = name + " raised" + os.linesep + traceback.format_exc()
+    st.function_error = (pos, msg)
+    raise FunctionError(msg)
+
+
+def parse(data, src=None):
+    st = State(data, src)
+    try:
+        res = {entry}(data, 0, st)
+    except FunctionError:
+        pos, msg = st.function_error
+        lineno = _line(st, pos) + 1
+        colno = _col(st, pos) + 1
+        raise Exception("At line {{0}} column {{1}}: {{2}}".format(lineno, colno, msg))
+
+    if res is not None:
+        return res[1]
+
+    pos = max(st.far, 0)
+    lines = ["At line {{0}} column {{1}}:".format(_line(st, pos) + 1, _col(st, pos) + 1)]
+    got = data[pos] if pos < len(data) else "EOF"
+    for msg in st.expected:
+        lines.append("    {{0}} Got {{1!r}}.".format(msg, got))
+    raise Exception(os.linesep.join(lines))
+'''
+
+
+# Names defined by the runtime of every generated module. Functions copied
+# into a module can use the modules and functions under the same names, but
+# they can't define any of the others.
+RESERVED = {
+    "os": os,
+    "re": re,
+    "sys": sys,
+    "traceback": traceback,
+    "bisect_left": bisect_left,
+    "Mark": None,
+    "State": None,
+    "FunctionError": None,
+    "FINGERPRINT": None,
+    "parse": None,
+    "_line": None,
+    "_col": None,
+    "_expect": None,
+    "_action_failed": None,
+}
+GENERATED = re.compile(r"^(rule\d+_|_C\d+$|_lambda\d+$)")
+
+
+def _global_names(code):
+    """
+    Returns the names of globals a code object and any nested code objects
+    use.
+    """
+    import dis
+    names = set()
+    for ins in dis.get_instructions(code):
+        if ins.opname in ("LOAD_GLOBAL", "LOAD_NAME", "STORE_GLOBAL"):
+            names.add(ins.argval)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= _global_names(const)
+    return names
+
+
+def _literal(value):
+    """
+    Returns source for value if it's a simple constant that round trips
+    through ``repr``.
+    """
+    if isinstance(value, (bool, int, float, str, type(None), list, tuple, dict)):
+        text = repr(value)
+        try:
+            if ast.literal_eval(text) == value:
+                return text
+        except Exception:
+            pass
+    raise Exception("Can't generate code for the value {0!r}.".format(value))
+
+
+def _lambda_source(func):
+    """
+    Finds the source of a lambda by searching its module's syntax tree for
+    lambdas on the same line that compile to the same code.
+    """
+    code = func.__code__
+    lines = linecache.getlines(code.co_filename)
+    if not lines:
+        raise Exception("Can't find the source for {0!r}.".format(func))
+    source = "".join(lines)
+    for node in ast.walk(ast.parse(source)):
+        if isinstance(node, ast.Lambda) and node.lineno == code.co_firstlineno:
+            segment = _source_segment(source, node)
+            candidate = compile("(" + segment + ")", code.co_filename, "eval")
+            for const in candidate.co_consts:
+                if isinstance(const, types.CodeType) and const.co_code == code.co_code \
+                        and const.co_consts == code.co_consts and const.co_names == code.co_names:
+                    return segment
+    raise Exception("Can't find the source for {0!r}.".format(func))
+
+
+def _source_segment(source, node):
+    """
+    Returns the source of a lambda node in source. Python 3.8 records where
+    nodes end, and ast.get_source_segment uses that.
+    """
+    if getattr(node, "end_lineno", None) is not None:
+        return ast.get_source_segment(source, node)
+    return _lambda_segment(source, node)
+
+
+def _lambda_segment(source, node):
+    """
+    Finds the end of a lambda without the end positions python 3.8 records.
+    Its body ends at the first comma, closing bracket, or end of line that
+    isn't nested in brackets.
+    """
+    lines = source.splitlines(True)
+    # col_offset counts UTF-8 bytes
+    first = lines[node.lineno - 1].encode("utf-8")[node.col_offset:].decode("utf-8")
+    text = "".join([first] + lines[node.lineno:])
+    offsets = [0]
+    for line in text.splitlines(True):
+        offsets.append(offsets[-1] + len(line))
+
+    depth = 0
+    body = False
+    end = None
+    try:
+        for kind, string, start, stop, _ in tokenize.generate_tokens(io.StringIO(text).readline):
+            if kind == tokenize.OP and string in "([{":
+                depth += 1
+            elif kind == tokenize.OP and string in ")]}":
+                if not depth:
+                    break
+                depth -= 1
+            elif kind == tokenize.OP and string == ":" and not depth:
+                body = True
+            elif kind == tokenize.OP and string == "," and not depth and body:
+                break
+            elif kind in (tokenize.NEWLINE, tokenize.COMMENT, tokenize.ENDMARKER) and not depth:
+                break
+            end = stop
+    except tokenize.TokenError:
+        pass
+    if end is None:
+        raise Exception("Can't find the end of the lambda on line {0}.".format(node.lineno))
+    return text[:offsets[end[0] - 1] + end[1]]
+
+
+class Actions(object):
+    """
+    Actions collects the source for the functions a grammar calls and the
+    imports they need.
+    """
+    def __init__(self):
+        self.bound = {}
+        self.imports = []
+        self.defs = []
+        self.count = 0
+
+    def _bind(self, name, value, line):
+        if name in RESERVED or GENERATED.match(name):
+            if RESERVED.get(name) is not value or value is None:
+                raise Exception("The name {0!r} is used by generated modules.".format(name))
+            return name
+        if name in self.bound:
+            if self.bound[name] is not value:
+                raise Exception("{0!r} refers to different objects in the grammar's functions.".format(name))
+            return name
+        self.bound[name] = value
+        line(name)
+        return name
+
+    def ref(self, func):
+        """
+        Returns the name generated code can use to call func.
+        """
+        for name, value in self.bound.items():
+            if value is func:
+                return name
+
+        name = getattr(func, "__name__", None)
+        if name and getattr(builtins, name, None) is func:
+            return name
+
+        if isinstance(func, types.FunctionType) and name == "<lambda>":
+            self.check_closure(func)
+            self.count += 1
+            name = "_lambda{0}".format(self.count)
+            self.bound[name] = func
+            source = _lambda_source(func)
+            self.add_globals(func)
+            self.defs.append("{0} = {1}\n".format(name, source))
+            return name
+        return self.bind(name, func)
+
+    def bind(self, name, value):
+        """
+        Makes value available to generated code under name.
+        """
+        if isinstance(value, types.ModuleType):
+            if name == value.__name__:
+                return self._bind(name, value, lambda n: self.imports.append("import {0}".format(n)))
+            stmt = "import {0} as {1}".format(value.__name__, name)
+            return self._bind(name, value, lambda n: self.imports.append(stmt))
+
+        if isinstance(value, types.FunctionType):
+            self.check_closure(value)
+            self._bind(name, value, lambda n: None)
+            source = textwrap.dedent(inspect.getsource(value))
+            self.add_globals(value)
+            self.defs.append(source)
+            if name != value.__name__:
+                self.defs.append("{0} = {1}\n".format(name, value.__name__))
+            return name
+
+        if isinstance(value, Parser):
+            raise Exception("Functions in generated grammars can't use the parser {0!r}.".format(value))
+
+        module = getattr(value, "__module__", None)
+        qualname = getattr(value, "__qualname__", getattr(value, "__name__", None))
+        if module and qualname and "." not in qualname:
+            try:
+                found = getattr(importlib.import_module(module), qualname)
+            except Exception:
+                found = None
+            if found is value:
+                stmt = "from {0} import {1}".format(module, qualname)
+                if name != qualname:
+                    stmt += " as {0}".format(name)
+                return self._bind(name, value, lambda n: self.imports.append(stmt))
+
+        source = _literal(value)
+        return self._bind(name, value, lambda n: self.defs.append("{0} = {1}\n".format(n, source)))
+
+    def check_closure(self, func):
+        if func.__closure__:
+            raise Exception("Can't generate code for {0!r} because it uses local variables from "
+                            "an enclosing function.".format(func))
+
+    def add_globals(self, func):
+        for name in sorted(_global_names(func.__code__)):
+            if name in func.__globals__:
+                self.bind(name, func.__globals__[name])
+
+
+class Generator(object):
+    """
+    Generator writes the source for a grammar.
+    """
+    def __init__(self, root):
+        self.root = root
+        self.actions = Actions()
+        self.consts = []
+        self.const_names = {}
+        self.functions = []
+        self.rules = {}
+        self.pending = []
+        self.refs = {}
+        self.count_refs(root)
+        self.emitters = {
+            AnyCharType: self.any_char,
+            Char: self.char,
+            Choice: self.choice,
+            EnclosedComment: self.delegate,
+            EndTagName: self.end_tag_name,
+            EOFType: self.eof,
+            FollowedBy: self.followed_by,
+            Forward: self.delegate,
+            Fused: self.fused,
+            HangingString: self.hanging_string,
+            InSet: self.in_set,
+            KeepLeft: self.keep_left,
+            KeepRight: self.keep_right,
+            Lift: self.lift,
+            Literal: self.literal,
+            Many: self.many,
+            Map: self.map,
+            NotFollowedBy: self.not_followed_by,
+            OneLineComment: self.delegate,
+            Optimized: self.delegate,
+            Opt: self.opt,
+            PosMarker: self.pos_marker,
+            Regex: self.regex,
+            Sequence: self.sequence,
+            SpaceType: self.space,
+            StartTagName: self.start_tag_name,
+            String: self.string,
+            StringUntil: self.string_until,
+            Until: self.until,
+            WithIndent: self.with_indent,
+            Wrapper: self.delegate,
+        }
+
+    def count_refs(self, root):
+        stack = [root]
+        seen = set()
+        while stack:
+            node = stack.pop()
+            if node in seen:
+                continue
+            seen.add(node)
+            for c in node.children:
+                self.refs[c] = self.refs.get(c, 0) + 1
+                stack.append(c)
+
+    def is_rule(self, node):
+        if node is self.root or isinstance(node, Forward):
+            return True
+        if not node.children:
+            return False
+        return bool(node.name) or self.refs.get(node, 0) > 1
+
+    def rule_name(self, node):
+        if node not in self.rules:
+            label = re.sub(r"\W+", "_", node.name or type(node).__name__).strip("_")
+            self.rules[node] = "rule{0}_{1}".format(len(self.rules), label)
+            self.pending.append(node)
+        return self.rules[node]
+
+    def const(self, key, source):
+        if key not in self.const_names:
+            name = "_C{0}".format(len(self.const_names))
+            self.const_names[key] = name
+            self.consts.append("{0} = {1}".format(name, source))
+        return self.const_names[key]
+
+    def regex_const(self, pattern, flags=0):
+        return self.const(("re", pattern, flags), "re.compile({0!r}, {1})".format(pattern, flags))
+
+    def set_const(self, chars):
+        text = "".join(sorted(chars))
+        return self.const(("set", text), "frozenset({0!r})".format(text))
+
+    # helpers for writing function bodies
+    def w(self, line):
+        self.lines.append("    " * self.indent + line)
+
+    def tmp(self, prefix):
+        self.temps += 1
+        return "{0}{1}".format(prefix, self.temps)
+
+    def fail(self, pos, msg):
+        self.w("if {0} >= st.far:".format(pos))
+        self.w("    _expect(st, {0}, {1!r})".format(pos, msg))
+        self.w("{0} = -1".format(pos))
+
+    def block(self):
+        gen = self
+
+        class Block(object):
+            def __enter__(self):
+                gen.indent += 1
+
+            def __exit__(self, *args):
+                gen.indent -= 1
+        return Block()
+
+    def loop(self):
+        gen = self
+
+        class Loop(object):
+            def __enter__(self):
+                gen.indent += 1
+                gen.depth += 1
+
+            def __exit__(self, *args):
+                gen.indent -= 1
+                gen.depth -= 1
+        return Loop()
+
+    def generate(self):
+        entry = self.rule_name(self.root)
+        while self.pending:
+            self.function(self.pending.pop(0))
+
+        out = [HEADER.format(source=getattr(self, "source", repr(self.root)))]
+        out.append("import os\nimport re\nimport sys\nimport traceback\nfrom bisect import bisect_left\n")
+        imports = sorted(set(self.actions.imports))
+        if imports:
+            out.append("\n".join(imports) + "\n")
+        out.append(RUNTIME.format(entry=entry))
+        if self.consts:
+            out.append("\n" + "\n".join(self.consts) + "\n")
+        for d in self.actions.defs:
+            out.append("\n\n" + d)
+        for f in self.functions:
+            out.append("\n\n" + f)
+        return "".join(out)
+
+    def function(self, node):
+        self.lines = []
+        self.indent = 1
+        self.depth = 0
+        self.temps = 0
+        name = self.rules[node]
+        self.lines.append("def {0}(data, pos, st):".format(name))
+        self.lines.append("    # {0}".format(repr(node).replace("\n", " ")))
+        self.w("n = len(data)")
+        val = self.emit_inline(node, "pos")
+        self.w("if pos < 0:")
+        self.w("    return None")
+        self.w("return pos, {0}".format(val))
+        self.functions.append("\n".join(self.lines) + "\n")
+
+    def emit(self, node, pos):
+        """
+        Writes code that matches node starting at the position in the
+        variable pos. Afterward, pos holds the new position or -1 if the
+        match failed. Returns an expression for the value.
+        """
+        if self.is_rule(node) or (node.children and self.depth >= MAX_DEPTH):
+            return self.call(node, pos)
+        return self.emit_inline(node, pos)
+
+    def emit_inline(self, node, pos):
+        emitter = self.emitters.get(type(node))
+        if emitter is None:
+            raise Exception("Can't generate code for {0!r} ({1}).".format(node, type(node).__name__))
+        return emitter(node, pos)
+
+    def call(self, node, pos):
+        res = self.tmp("r")
+        val = self.tmp("v")
+        self.w("{0} = {1}(data, {2}, st)".format(res, self.rule_name(node), pos))
+        self.w("if {0} is None:".format(res))
+        self.w("    {0} = -1".format(pos))
+        self.w("else:")
+        self.w("    {0}, {1} = {2}".format(pos, val, res))
+        return val
+
+    def delegate(self, node, pos):
+        return self.emit(node.children[0], pos)
+
+    def fused(self, node, pos):
+        # the functions that build fused values can't be written out
+        return self.emit(node.original, pos)
+
+    def any_char(self, node, pos):
+        val = self.tmp("v")
+        self.w("if {0} < n:".format(pos))
+        self.w("    {0} = data[{1}]".format(val, pos))
+        self.w("    {0} += 1".format(pos))
+        self.w("else:")
+        with self.block():
+            self.fail(pos, "Expected any character.")
+        return val
+
+    def char(self, node, pos):
+        self.w("if {0} < n and data[{0}] == {1!r}:".format(pos, node.char))
+        self.w("    {0} += 1".format(pos))
+        self.w("else:")
+        with self.block():
+            self.fail(pos, "Expected {0!r}.".format(node.char))
+        return repr(node.char)
+
+    def in_set(self, node, pos):
+        val = self.tmp("v")
+        self.w("if {0} < n and data[{0}] in {1}:".format(pos, self.set_const(node.values)))
+        self.w("    {0} = data[{1}]".format(val, pos))
+        self.w("    {0} += 1".format(pos))
+        self.w("else:")
+        with self.block():
+            self.fail(pos, "Expected {0}.".format(node))
+        return val
+
+    def space(self, node, pos):
+        val = self.tmp("v")
+        self.w("if {0} < n and data[{0}].isspace():".format(pos))
+        self.w("    {0} = data[{1}]".format(val, pos))
+        self.w("    {0} += 1".format(pos))
+        self.w("else:")
+        with self.block():
+            self.fail(pos, "Expected whitespace character.")
+        return val
+
+    def eof(self, node, pos):
+        self.w("if {0} < n:".format(pos))
+        with self.block():
+            self.fail(pos, "Expected end of input.")
+        return "None"
+
+    def string(self, node, pos):
+        val = self.tmp("v")
+        m = self.tmp("m")
+        chars = char_class(node.chars)
+        minimum = "{%d,}" % node.min_length
+        if node.echars:
+            echars = char_class(node.echars)
+            regex = self.regex_const(r"(?:\\%s|%s)%s" % (echars, chars, minimum))
+            escape = self.regex_const(r"\\(%s)" % echars)
+            value = "{0}.sub(r'\\1', {1}.group())".format(escape, m)
+        else:
+            regex = self.regex_const(chars + minimum)
+            value = "{0}.group()".format(m)
+        msg = "Expected {0} of {1}.".format(node.min_length, sorted(node.chars))
+        self.w("{0} = {1}.match(data, {2})".format(m, regex, pos))
+        self.w("if {0} is None:".format(m))
+        with self.block():
+            self.fail(pos, msg)
+        self.w("else:")
+        self.w("    {0} = {1}".format(val, value))
+        self.w("    {0} = {1}.end()".format(pos, m))
+        return val
+
+    def string_until(self, node, pos):
+        start = self.tmp("s")
+        self.w("{0} = {1}".format(start, pos))
+        val = self.emit(node.children[0], pos)
+        if node.lower is not None:
+            self.w("if {0} >= 0 and len({1}) < {2}:".format(pos, val, node.lower))
+            with self.block():
+                self.w("{0} = {1}".format(pos, start))
+                self.fail(pos, "Expected at least {0} characters.".format(node.lower))
+        return val
+
+    def regex(self, node, pos):
+        val = self.tmp("v")
+        m = self.tmp("m")
+        regex = self.regex_const(node.pattern, node.flags)
+        if node._sliced:
+            # matched against the rest of the input like the interpreted parser
+            self.w("{0} = {1}.match(data[{2}:])".format(m, regex, pos))
+        else:
+            self.w("{0} = {1}.match(data, {2})".format(m, regex, pos))
+        self.w("if {0} is None:".format(m))
+        with self.block():
+            self.fail(pos, "Expected pattern {0!r} (flags={1}).".format(node.pattern, node.flags))
+        self.w("else:")
+        if node._sliced:
+            end = "{0} + {1}.end()".format(pos, m)
+        else:
+            end = "{0}.end()".format(m)
+        if node.return_match:
+            self.w("    {0} = {1}".format(val, m))
+        else:
+            self.w("    {0} = data[{1}:{2}]".format(val, pos, end))
+        self.w("    {0} = {1}".format(pos, end))
+        return val
+
+    def literal(self, node, pos):
+        size = len(node.chars)
+        if not node.ignore_case:
+            value = node.chars if node.value is Literal._NULL else node.value
+            self.w("if data.startswith({0!r}, {1}):".format(node.chars, pos))
+            self.w("    {0} += {1}".format(pos, size))
+            self.w("else:")
+            with self.block():
+                self.fail(pos, "Expected {0!r}.".format(node.chars))
+            return _literal(value)
+
+        val = self.tmp("v")
+        self.w("{0} = data[{1}:{1} + {2}]".format(val, pos, size))
+        self.w("if len({0}) == {1} and {0}.lower() == {2!r}:".format(val, size, node.chars))
+        self.w("    {0} += {1}".format(pos, size))
+        self.w("else:")
+        with self.block():
+            self.fail(pos, "Expected case insensitive {0!r}.".format(node.chars))
+        if node.value is Literal._NULL:
+            return val
+        return _literal(node.value)
+
+    def sequence(self, node, pos):
+        vals = self.all_of(node.children, pos)
+        val = self.tmp("v")
+        self.w("if {0} >= 0:".format(pos))
+        self.w("    {0} = [{1}]".format(val, ", ".join(vals)))
+        return val
+
+    def all_of(self, children, pos):
+        # Each child runs only if the previous ones succeeded. The values are
+        # only meaningful if pos isn't negative afterward.
+        vals = []
+        self.w("while True:")
+        with self.loop():
+            for c in children:
+                vals.append(self.emit(c, pos))
+                self.w("if {0} < 0:".format(pos))
+                self.w("    break")
+            self.w("break")
+        return vals
+
+    def choice(self, node, pos):
+        start = self.tmp("s")
+        val = self.tmp("v")
+        self.w("{0} = {1}".format(start, pos))
+        self.w("while True:")
+        with self.loop():
+            for i, c in enumerate(node.children):
+                if i:
+                    self.w("{0} = {1}".format(pos, start))
+                v = self.emit(c, pos)
+                self.w("if {0} >= 0:".format(pos))
+                self.w("    {0} = {1}".format(val, v))
+                self.w("    break")
+            self.w("break")
+        return val
+
+    def many(self, node, pos):
+        child = node.children[0]
+        start = self.tmp("s")
+        val = self.tmp("v")
+        self.w("{0} = {1}".format(start, pos))
+
+        cls = self._char_class_source(child)
+        if cls is not None:
+            # repetitions of a single character are matched all at once
+            m = self.tmp("m")
+            regex = self.regex_const(cls + "*")
+            self.w("{0} = {1}.match(data, {2})".format(m, regex, pos))
+            self.w("{0} = list({1}.group())".format(val, m))
+            self.w("{0} = {1}.end()".format(pos, m))
+            # the interpreted child records why it stopped matching
+            self.w("if {0} >= st.far:".format(pos))
+            self.w("    _expect(st, {0}, {1!r})".format(pos, self.expected(child)))
+        else:
+            other = self.tmp("p")
+            self.w("{0} = []".format(val))
+            self.w("while True:")
+            with self.loop():
+                self.w("{0} = {1}".format(other, pos))
+                v = self.emit(child, other)
+                self.w("if {0} < 0:".format(other))
+                self.w("    break")
+                self.w("{0}.append({1})".format(val, v))
+                self.w("{0} = {1}".format(pos, other))
+
+        if node.lower:
+            self.w("if len({0}) < {1}:".format(val, node.lower))
+            with self.block():
+                self.w("{0} = {1}".format(pos, start))
+                self.fail(pos, "Expected at least {0} of {1}.".format(node.lower, child))
+        if node.upper is not None:
+            self.w("if {0} >= 0 and len({1}) > {2}:".format(pos, val, node.upper))
+            with self.block():
+                self.w("{0} = {1}".format(pos, start))
+                self.fail(pos, "Expected at most {0} of {1}.".format(node.upper, child))
+        return val
+
+    def expected(self, node):
+        if type(node) is Char:
+            return "Expected {0!r}.".format(node.char)
+        if type(node) is InSet:
+            return "Expected {0}.".format(node)
+        return "Expected whitespace character."
+
+    def _char_class_source(self, node):
+        # the regular expression class matching the same characters as a
+        # single character parser, or None if node is something else
+        if node.children or node._debug:
+            return None
+        if type(node) is Char:
+            return char_class(node.char)
+        if type(node) is InSet:
+            return char_class(node.values)
+        if type(node) is SpaceType:
+            return r"\s"
+        return None
+
+    def until(self, node, pos):
+        parser, pred = node.children
+        val = self.tmp("v")
+        other = self.tmp("p")
+        self.w("{0} = []".format(val))
+        self.w("while True:")
+        with self.loop():
+            self.w("{0} = {1}".format(other, pos))
+            self.emit(pred, other)
+            self.w("if {0} >= 0:".format(other))
+            self.w("    break")
+            self.w("{0} = {1}".format(other, pos))
+            v = self.emit(parser, other)
+            self.w("if {0} < 0:".format(other))
+            self.w("    break")
+            self.w("{0}.append({1})".format(val, v))
+            self.w("{0} = {1}".format(pos, other))
+            if node.upper is not None:
+                self.w("if len({0}) > {1}:".format(val, node.upper))
+                with self.block():
+                    self.fail(pos, "{0} matched more than {1}.".format(parser, node.upper))
+                    self.w("break")
+        return val
+
+    def followed_by(self, node, pos):
+        left, right = node.children
+        other = self.tmp("p")
+        val = self.emit(left, pos)
+        self.w("if {0} >= 0:".format(pos))
+        with self.block():
+            self.w("{0} = {1}".format(other, pos))
+            self.emit(right, other)
+            self.w("if {0} < 0:".format(other))
+            self.w("    {0} = -1".format(pos))
+        return val
+
+    def not_followed_by(self, node, pos):
+        left, right = node.children
+        other = self.tmp("p")
+        val = self.emit(left, pos)
+        self.w("if {0} >= 0:".format(pos))
+        with self.block():
+            self.w("{0} = {1}".format(other, pos))
+            self.emit(right, other)
+            self.w("if {0} >= 0:".format(other))
+            with self.block():
+                self.fail(pos, "{0} can't follow {1}".format(right, left))
+        return val
+
+    def keep_left(self, node, pos):
+        return self.all_of(node.children, pos)[0]
+
+    def keep_right(self, node, pos):
+        return self.all_of(node.children, pos)[1]
+
+    def opt(self, node, pos):
+        other = self.tmp("p")
+        val = self.tmp("v")
+        self.w("{0} = {1}".format(other, pos))
+        v = self.emit(node.children[0], other)
+        self.w("if {0} < 0:".format(other))
+        self.w("    {0} = {1}".format(val, _literal(node.default)))
+        self.w("else:")
+        self.w("    {0} = {1}".format(pos, other))
+        self.w("    {0} = {1}".format(val, v))
+        return val
+
+    def map(self, node, pos):
+        func = self.actions.ref(node.func)
+        val = self.tmp("v")
+        v = self.emit(node.children[0], pos)
+        self.w("if {0} >= 0:".format(pos))
+        with self.block():
+            self.apply(pos, val, "{0}({1})".format(func, v), node.name or "Map")
+        return val
+
+    def lift(self, node, pos):
+        func = self.actions.ref(node.func)
+        val = self.tmp("v")
+        vals = self.all_of(node.children, pos)
+        self.w("if {0} >= 0:".format(pos))
+        with self.block():
+            self.apply(pos, val, "{0}({1})".format(func, ", ".join(vals)), node.name or "Lift")
+        return val
+
+    def apply(self, pos, val, call, name):
+        self.w("try:")
+        self.w("    {0} = {1}".format(val, call))
+        self.w("except Exception:")
+        self.w("    {0} = _action_failed(st, {0}, {1!r})".format(pos, name))
+
+    def pos_marker(self, node, pos):
+        start = self.tmp("s")
+        val = self.tmp("v")
+        self.w("{0} = {1}".format(start, pos))
+        v = self.emit(node.children[0], pos)
+        self.w("if {0} >= 0:".format(pos))
+        self.w("    {0} = Mark(_line(st, {1}) + 1, _col(st, {1}) + 1, {2}, {1}, {3})".format(val, start, v, pos))
+        return val
+
+    def with_indent(self, node, pos):
+        self.emit(parsr.WS, pos)
+        self.w("st.indents.append(_col(st, {0}))".format(pos))
+        self.w("try:")
+        with self.loop():
+            val = self.emit(node.children[0], pos)
+        self.w("finally:")
+        self.w("    st.indents.pop()")
+        return val
+
+    def hanging_string(self, node, pos):
+        old = self.tmp("o")
+        other = self.tmp("p")
+        results = self.tmp("v")
+        self.w("{0} = {1}".format(old, pos))
+        self.w("{0} = []".format(results))
+        self.w("while st.indents:")
+        with self.loop():
+            self.w("if _col(st, {0}) <= st.indents[-1]:".format(pos))
+            self.w("    {0} = {1}".format(pos, old))
+            self.w("    break")
+            self.w("{0} = {1}".format(other, pos))
+            v = self.emit(node.children[0], other)
+            self.w("if {0} < 0:".format(other))
+            self.w("    break")
+            self.w("{0}.append({1}.rstrip(' \\\\'))".format(results, v))
+            self.w("{0} = {1}".format(old, other))
+            self.emit(parsr.WS, other)
+            self.w("{0} = {1}".format(pos, other))
+        return "' '.join({0})".format(results)
+
+    def start_tag_name(self, node, pos):
+        val = self.emit(node.children[0], pos)
+        self.w("if {0} >= 0:".format(pos))
+        self.w("    st.tags.append({0})".format(val))
+        return val
+
+    def end_tag_name(self, node, pos):
+        expect = self.tmp("e")
+        val = self.emit(node.children[0], pos)
+        self.w("if {0} >= 0:".format(pos))
+        with self.block():
+            self.w("if not st.tags:")
+            self.w("    {0} = -1".format(pos))
+            self.w("else:")
+            with self.block():
+                self.w("{0} = st.tags.pop()".format(expect))
+                if node.ignore_case:
+                    self.w("if {0}.lower() != {1}.lower():".format(val, expect))
+                else:
+                    self.w("if {0} != {1}:".format(val, expect))
+                with self.block():
+                    self.w("if {0} >= st.far:".format(pos))
+                    self.w("    _expect(st, {0}, 'Expected {{0!r}}. Got {{1!r}}.'.format({1}, {2}))".format(pos, expect, val))
+                    self.w("{0} = -1".format(pos))
+        return val
+
+
+def generate(parser, source=None):
+    """
+    Returns the source of a python module that parses the same language as
+    parser. The optional source is a description of where the grammar came
+    from for the module's docstring.
+    """
+    gen = Generator(parser)
+    gen.source = source or repr(parser)
+    body = gen.generate()
+    digest = hashlib.sha256(body.encode("utf-8")).hexdigest()
+    return body + '\n\nFINGERPRINT = "{0}"\n'.format(digest)
+
+
+def fingerprint(parser, source=None):
+    """
+    Returns the fingerprint of the module :py:func:`generate` would create for
+    parser.
+    """
+    gen = Generator(parser)
+    gen.source = source or repr(parser)
+    return hashlib.sha256(gen.generate().encode("utf-8")).hexdigest()
+
+
+def main(args=None):
+    p = argparse.ArgumentParser(description="Generate a python module from a parsr grammar.")
+    p.add_argument("grammar", help="The grammar to generate like package.module:name.")
+    p.add_argument("-o", "--output", help="File to write. Defaults to standard out.")
+    args = p.parse_args(args)
+
+    source = generate(resolve(args.grammar), source=args.grammar)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(source)
+    else:
+        sys.stdout.write(source)
+
+
+if __name__ == "__main__":
+    main()
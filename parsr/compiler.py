@@ -0,0 +1,689 @@
+"""
+The compiler turns a parser graph into a tree of nested closures that does the
+same work as the graph's ``process`` methods without going through
+``_debug_hook`` for every call. The closures don't maintain the parser stack,
+don't record errors, and don't raise exceptions to signal failure. Each one
+takes the input, a position, and the :py:class:`parsr.Context` and returns a
+``(pos, value)`` tuple on success or ``None`` on failure.
+
+Use :py:meth:`parsr.Parser.compile` to get a :py:class:`Compiled` parser that
+can be invoked like any other.
+
+    .. code-block:: python
+
+        from parsr.examples.nginx_conf import Top
+
+        fast = Top.compile()
+        val = fast(data)
+
+Bytes input, like the memory mapped files parsed by
+:py:meth:`parsr.Parser.parse_file`, gets its own closures that compare byte
+codes and only decode the values they produce. They're built the first time
+the compiled parser sees bytes.
+
+Repetitions of parsers that match a single character, like ``Many(Space)``,
+are matched with one regular expression instead of a call per character.
+
+If the compiled closures fail, the original parsers are run again on the same
+input so error messages are the same as if the grammar hadn't been compiled.
+
+Parsers with :py:meth:`parsr.Parser.debug` enabled and parser classes the
+compiler doesn't know about are called through their regular ``process``
+methods. Parsers marked with :py:meth:`parsr.Parser.memo` are memoized, but
+``memo=True`` only applies to the parts of a grammar that aren't compiled.
+"""
+import re
+
+import parsr
+from parsr import (_ASCII, _ASCII_SPACE, _decode, _utf8_char, Backtrack, Char, Choice,
+        EnclosedComment, EndTagName, FAIL, FollowedBy, Forward, HangingString,
+        InSet, KeepLeft, KeepRight, Lift, Literal, Many, Map, Mark,
+        NotFollowedBy, OneLineComment, Opt, PosMarker, Regex, Sequence,
+        StartTagName, String, StringUntil, Until, WithIndent, Wrapper)
+
+# The module level instances shadow these classes in parsr.
+AnyCharType = type(parsr.AnyChar)
+EOFType = type(parsr.EOF)
+SpaceType = type(parsr.Space)
+
+
+class Abort(Exception):
+    """
+    Raised by compiled closures when a mapped or lifted function fails with
+    something other than :py:class:`parsr.Backtrack`.
+    """
+    pass
+
+
+def char_class(chars):
+    """
+    Returns a regular expression character class that matches any of the
+    characters in chars.
+    """
+    if not chars:
+        return "(?!)"
+    return "[" + "".join(re.escape(c) for c in sorted(chars)) + "]"
+
+
+class Compiler(object):
+    """
+    Compiler walks a parser graph and builds a closure for every node. The
+    closure for each node is built once, so shared subgraphs share closures.
+    If binary is True, the closures compare the codes in bytes input and
+    decode only the values they produce.
+    """
+    def __init__(self, binary=False):
+        # fusion uses char_class from this module
+        from parsr.fusion import Fused, Optimized
+
+        self.binary = binary
+        self.funcs = {}
+        self.builders = {
+            AnyCharType: self.any_char,
+            Char: self.char,
+            Choice: self.choice,
+            EnclosedComment: self.delegate,
+            EndTagName: self.end_tag_name,
+            EOFType: self.eof,
+            FollowedBy: self.followed_by,
+            Forward: self.forward,
+            Fused: self.fused,
+            HangingString: self.hanging_string,
+            InSet: self.in_set,
+            KeepLeft: self.keep_left,
+            KeepRight: self.keep_right,
+            Lift: self.lift,
+            Literal: self.literal,
+            Many: self.many,
+            Map: self.map,
+            NotFollowedBy: self.not_followed_by,
+            OneLineComment: self.delegate,
+            Optimized: self.optimized,
+            Opt: self.opt,
+            PosMarker: self.pos_marker,
+            Regex: self.regex,
+            Sequence: self.sequence,
+            SpaceType: self.space,
+            StartTagName: self.start_tag_name,
+            String: self.string,
+            StringUntil: self.string_until,
+            Until: self.until,
+            WithIndent: self.with_indent,
+            Wrapper: self.delegate,
+        }
+        if binary:
+            self.builders.update({
+                AnyCharType: self.any_char_bytes,
+                Char: self.char_bytes,
+                InSet: self.in_set_bytes,
+                Literal: self.literal_bytes,
+                Regex: self.regex_bytes,
+                SpaceType: self.space_bytes,
+                String: self.string_bytes,
+            })
+
+    def build(self, node):
+        if node in self.funcs:
+            return self.funcs[node]
+
+        builder = self.builders.get(type(node))
+        if builder is None or node._debug:
+            func = self.funcs[node] = self.interpreted(node)
+            return func
+
+        if not node._memo and type(node) is not Forward:
+            func = self.funcs[node] = builder(node)
+            return func
+
+        # Grammars can only recurse through these nodes, so they get a
+        # trampoline that's used until their own closures are built.
+        cell = []
+        self.funcs[node] = lambda data, pos, ctx: cell[0](data, pos, ctx)
+        func = builder(node)
+        if node._memo:
+            func = self.memoized(node, func)
+        cell.append(func)
+        self.funcs[node] = func
+        return func
+
+    def interpreted(self, node):
+        def process(data, pos, ctx):
+            res = node.process(pos, data, ctx)
+            return None if res is FAIL else res
+        return process
+
+    def memoized(self, node, func):
+        def process(data, pos, ctx):
+            key = ctx.memo_key(node, pos)
+            if key in ctx.memo:
+                res = ctx.recall(key)
+                return None if res is FAIL else res
+            ctx.memo_misses += 1
+            res = func(data, pos, ctx)
+            ctx.memo[key] = (FAIL if res is None else res, tuple(ctx.tags))
+            return res
+        return process
+
+    def delegate(self, node):
+        return self.build(node.children[0])
+
+    def forward(self, node):
+        func = self.build(node.children[0])
+
+        def process(data, pos, ctx):
+            n = ctx.recursion = ctx.recursion + 1
+            if n > ctx.max_recursion:
+                ctx.max_recursion = n
+            try:
+                return func(data, pos, ctx)
+            finally:
+                ctx.recursion = n - 1
+        return process
+
+    def optimized(self, node):
+        return self.build(node.bytes_fused() if self.binary else node.fused)
+
+    def fused(self, node):
+        regex = node.regex
+        build = node.build
+
+        def process(data, pos, ctx):
+            m = regex.match(data, pos)
+            if m is not None:
+                return m.end(), (build(m, ctx) if build is not None else None)
+        return process
+
+    def any_char(self, node):
+        def process(data, pos, ctx):
+            if pos < len(data):
+                return pos + 1, data[pos]
+        return process
+
+    def char(self, node):
+        char = node.char
+
+        def process(data, pos, ctx):
+            if pos < len(data) and data[pos] == char:
+                return pos + 1, char
+        return process
+
+    def in_set(self, node):
+        values = node.values
+
+        def process(data, pos, ctx):
+            if pos < len(data) and data[pos] in values:
+                return pos + 1, data[pos]
+        return process
+
+    def space(self, node):
+        def process(data, pos, ctx):
+            if pos < len(data) and data[pos].isspace():
+                return pos + 1, data[pos]
+        return process
+
+    def eof(self, node):
+        def process(data, pos, ctx):
+            if pos >= len(data):
+                return pos, None
+        return process
+
+    def string(self, node):
+        # Strings are the most common primitive, so they're matched with a
+        # regular expression.
+        chars = char_class(node.chars)
+        minimum = "{%d,}" % node.min_length
+        if not node.echars:
+            regex = re.compile(chars + minimum)
+
+            def process(data, pos, ctx):
+                m = regex.match(data, pos)
+                if m is not None:
+                    return m.end(), m.group()
+            return process
+
+        echars = char_class(node.echars)
+        regex = re.compile(r"(?:\\%s|%s)%s" % (echars, chars, minimum))
+        escape = re.compile(r"\\(%s)" % echars)
+
+        def process(data, pos, ctx):
+            m = regex.match(data, pos)
+            if m is not None:
+                return m.end(), escape.sub(r"\1", m.group())
+        return process
+
+    def string_until(self, node):
+        func = self.build(node.children[0])
+        lower = node.lower
+
+        def process(data, pos, ctx):
+            res = func(data, pos, ctx)
+            if res is not None and (lower is None or len(res[1]) >= lower):
+                return res
+        return process
+
+    def regex(self, node):
+        regex = node.regex
+        return_match = node.return_match
+
+        if node._sliced:
+            def process(data, pos, ctx):
+                m = regex.match(data[pos:])
+                if m is not None:
+                    end = pos + m.end()
+                    return end, (m if return_match else data[pos:end])
+            return process
+
+        def process(data, pos, ctx):
+            m = regex.match(data, pos)
+            if m is not None:
+                end = m.end()
+                return end, data[pos:end]
+        return process
+
+    def literal(self, node):
+        chars = node.chars
+        size = len(chars)
+        value = node.value
+
+        if not node.ignore_case:
+            value = chars if value is Literal._NULL else value
+
+            def process(data, pos, ctx):
+                if data.startswith(chars, pos):
+                    return pos + size, value
+            return process
+
+        def process(data, pos, ctx):
+            text = data[pos:pos + size]
+            if len(text) == size and text.lower() == chars:
+                return pos + size, (text if value is Literal._NULL else value)
+        return process
+
+    def any_char_bytes(self, node):
+        def process(data, pos, ctx):
+            if pos < len(data):
+                c = data[pos]
+                if c < 0x80:
+                    return pos + 1, _ASCII[c]
+                return _utf8_char(data, pos)
+        return process
+
+    def char_bytes(self, node):
+        char = node.char
+        code = node.code
+        if code is None:
+            encoded = node.encoded
+            size = len(encoded)
+
+            def process(data, pos, ctx):
+                if data[pos:pos + size] == encoded:
+                    return pos + size, char
+            return process
+
+        def process(data, pos, ctx):
+            if pos < len(data) and data[pos] == code:
+                return pos + 1, char
+        return process
+
+    def in_set_bytes(self, node):
+        table = dict((ord(c), c) for c in node.values if ord(c) < 128)
+        if node._wide:
+            values = node.values
+
+            def process(data, pos, ctx):
+                if pos < len(data):
+                    c = data[pos]
+                    if c in table:
+                        return pos + 1, table[c]
+                    if c >= 0x80:
+                        end, c = _utf8_char(data, pos)
+                        if c in values:
+                            return end, c
+            return process
+
+        def process(data, pos, ctx):
+            if pos < len(data) and data[pos] in table:
+                return pos + 1, table[data[pos]]
+        return process
+
+    def space_bytes(self, node):
+        def process(data, pos, ctx):
+            if pos < len(data):
+                c = data[pos]
+                if c in _ASCII_SPACE:
+                    return pos + 1, _ASCII_SPACE[c]
+                if c >= 0x80:
+                    end, c = _utf8_char(data, pos)
+                    if c.isspace():
+                        return end, c
+        return process
+
+    def string_bytes(self, node):
+        regex = node._binary()
+        unescape = node._unescape
+        lower = node.min_length
+
+        def process(data, pos, ctx):
+            end = regex.match(data, pos).end()
+            value = unescape(_decode(data[pos:end]))
+            if len(value) >= lower:
+                return end, value
+        return process
+
+    def regex_bytes(self, node):
+        regex = node._binary()
+        return_match = node.return_match
+
+        if node._sliced:
+            def process(data, pos, ctx):
+                m = regex.match(data[pos:])
+                if m is not None:
+                    end = pos + m.end()
+                    return end, (m if return_match else _decode(data[pos:end]))
+            return process
+
+        def process(data, pos, ctx):
+            m = regex.match(data, pos)
+            if m is not None:
+                end = m.end()
+                return end, _decode(data[pos:end])
+        return process
+
+    def literal_bytes(self, node):
+        chars = node.chars
+        expected = node.bytes
+        size = len(expected)
+        value = node.value
+
+        if not node.ignore_case:
+            value = chars if value is Literal._NULL else value
+
+            def process(data, pos, ctx):
+                if data[pos:pos + size] == expected:
+                    return pos + size, value
+            return process
+
+        def process(data, pos, ctx):
+            text = _decode(data[pos:pos + size])
+            if len(text) == len(chars) and text.lower() == chars:
+                return pos + size, (text if value is Literal._NULL else value)
+        return process
+
+    def sequence(self, node):
+        funcs = [self.build(c) for c in node.children]
+
+        def process(data, pos, ctx):
+            results = []
+            for func in funcs:
+                res = func(data, pos, ctx)
+                if res is None:
+                    return None
+                pos, val = res
+                results.append(val)
+            return pos, results
+        return process
+
+    def choice(self, node):
+        funcs = [self.build(c) for c in node.children]
+        table, default = node._dispatch()
+        built = dict(zip(node.children, funcs))
+        table = dict((k, [built[c] for c in v]) for k, v in table.items())
+        default = [built[c] for c in default]
+
+        def process(data, pos, ctx):
+            alternatives = table.get(data[pos], default) if pos < len(data) else funcs
+            for func in alternatives:
+                res = func(data, pos, ctx)
+                if res is not None:
+                    return res
+        return process
+
+    def single_char(self, node):
+        # Returns a character class for nodes that match one character and
+        # produce it, or None.
+        if self.binary or node._debug or node._memo:
+            return None
+        if type(node) is SpaceType:
+            # matches the same characters as str.isspace
+            return r"\s"
+        if type(node) is Char:
+            return re.escape(node.char)
+        if type(node) is InSet:
+            return char_class(node.values)
+        return None
+
+    def many(self, node):
+        lower = node.lower
+        upper = node.upper
+        chars = self.single_char(node.children[0])
+        if chars is not None:
+            # Runs of whitespace and the like are matched with one regular
+            # expression instead of a call for every character.
+            regex = re.compile(chars + "*", re.UNICODE)
+
+            def process(data, pos, ctx):
+                end = regex.match(data, pos).end()
+                size = end - pos
+                if size < lower or (upper is not None and size > upper):
+                    return None
+                return end, list(data[pos:end])
+            return process
+
+        func = self.build(node.children[0])
+
+        def process(data, pos, ctx):
+            results = []
+            res = func(data, pos, ctx)
+            while res is not None:
+                pos, val = res
+                results.append(val)
+                res = func(data, pos, ctx)
+            if len(results) < lower:
+                return None
+            if upper is not None and len(results) > upper:
+                return None
+            return pos, results
+        return process
+
+    def until(self, node):
+        func, pred = [self.build(c) for c in node.children]
+        bound = node.upper
+
+        def process(data, pos, ctx):
+            results = []
+            while pred(data, pos, ctx) is None:
+                res = func(data, pos, ctx)
+                if res is None:
+                    break
+                pos, val = res
+                results.append(val)
+                if bound is not None and len(results) > bound:
+                    return None
+            return pos, results
+        return process
+
+    def followed_by(self, node):
+        left, right = [self.build(c) for c in node.children]
+
+        def process(data, pos, ctx):
+            res = left(data, pos, ctx)
+            if res is not None and right(data, res[0], ctx) is not None:
+                return res
+        return process
+
+    def not_followed_by(self, node):
+        left, right = [self.build(c) for c in node.children]
+
+        def process(data, pos, ctx):
+            res = left(data, pos, ctx)
+            if res is not None and right(data, res[0], ctx) is None:
+                return res
+        return process
+
+    def keep_left(self, node):
+        left, right = [self.build(c) for c in node.children]
+
+        def process(data, pos, ctx):
+            res = left(data, pos, ctx)
+            if res is not None:
+                other = right(data, res[0], ctx)
+                if other is not None:
+                    return other[0], res[1]
+        return process
+
+    def keep_right(self, node):
+        left, right = [self.build(c) for c in node.children]
+
+        def process(data, pos, ctx):
+            res = left(data, pos, ctx)
+            if res is not None:
+                return right(data, res[0], ctx)
+        return process
+
+    def opt(self, node):
+        func = self.build(node.children[0])
+        default = node.default
+
+        def process(data, pos, ctx):
+            res = func(data, pos, ctx)
+            return (pos, default) if res is None else res
+        return process
+
+    def map(self, node):
+        func = self.build(node.children[0])
+        transform = node.func
+
+        def process(data, pos, ctx):
+            res = func(data, pos, ctx)
+            if res is not None:
+                try:
+                    return res[0], transform(res[1])
+                except Backtrack:
+                    return None
+                except Exception:
+                    raise Abort()
+        return process
+
+    def lift(self, node):
+        funcs = [self.build(c) for c in node.children]
+        transform = node.func
+
+        def process(data, pos, ctx):
+            results = []
+            for func in funcs:
+                res = func(data, pos, ctx)
+                if res is None:
+                    return None
+                pos, val = res
+                results.append(val)
+            try:
+                return pos, transform(*results)
+            except Backtrack:
+                return None
+            except Exception:
+                raise Abort()
+        return process
+
+    def pos_marker(self, node):
+        func = self.build(node.children[0])
+
+        def process(data, pos, ctx):
+            res = func(data, pos, ctx)
+            if res is not None:
+                newpos, val = res
+                mark = Mark(ctx.line(pos) + 1, ctx.col(pos) + 1, val, pos + ctx.offset,
+                            newpos + ctx.offset)
+                return newpos, mark
+        return process
+
+    def with_indent(self, node):
+        ws = self.build(parsr.WS)
+        func = self.build(node.children[0])
+
+        def process(data, pos, ctx):
+            new = ws(data, pos, ctx)[0]
+            ctx.indents.append(ctx.col(new))
+            try:
+                return func(data, new, ctx)
+            finally:
+                ctx.indents.pop()
+        return process
+
+    def hanging_string(self, node):
+        ws = self.build(parsr.WS)
+        func = self.build(node.children[0])
+
+        def process(data, pos, ctx):
+            old = pos
+            results = []
+            while ctx.indents:
+                if ctx.col(pos) <= ctx.indents[-1]:
+                    pos = old
+                    break
+                res = func(data, pos, ctx)
+                if res is None:
+                    break
+                pos, val = res
+                results.append(val.rstrip(" \\"))
+                old = pos
+                pos = ws(data, pos, ctx)[0]
+            return pos, " ".join(results)
+        return process
+
+    def start_tag_name(self, node):
+        func = self.build(node.children[0])
+
+        def process(data, pos, ctx):
+            res = func(data, pos, ctx)
+            if res is not None:
+                ctx.tags.append(res[1])
+            return res
+        return process
+
+    def end_tag_name(self, node):
+        func = self.build(node.children[0])
+        ignore_case = node.ignore_case
+
+        def process(data, pos, ctx):
+            res = func(data, pos, ctx)
+            if res is not None and ctx.tags:
+                r = res[1]
+                e = ctx.tags.pop()
+                if ignore_case:
+                    r = r.lower()
+                    e = e.lower()
+                if r == e:
+                    return res
+        return process
+
+
+class Compiled(Wrapper):
+    """
+    Compiled wraps a parser and runs the closures built from it by the
+    :py:class:`Compiler`. Closures for bytes input are built the first time
+    bytes are parsed. The closures don't record errors, so the wrapped parser
+    is run instead when the context is collecting errors.
+    """
+    def __init__(self, parser):
+        super(Compiled, self).__init__(parser)
+        self.func = Compiler().build(parser)
+        self.bytes_func = None
+
+    def _freeze(self):
+        if self.bytes_func is None:
+            self.bytes_func = Compiler(binary=True).build(self.children[0])
+        return []
+
+    def process(self, pos, data, ctx):
+        if ctx.diagnose:
+            return self.children[0].process(pos, data, ctx)
+        func = self.func
+        if ctx.binary:
+            func = self.bytes_func
+            if func is None:
+                func = self.bytes_func = Compiler(binary=True).build(self.children[0])
+        try:
+            res = func(data, pos, ctx)
+        except Abort:
+            return FAIL
+        return FAIL if res is None else res
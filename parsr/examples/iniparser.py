@@ -6,7 +6,44 @@ from parsr import (EOF, HangingString, InSet, LeftBracket, Lift, LineEnd,
 from parsr.query import Directive, Entry, eq, Section
 
 
-def parse_doc(content, ctx):
+def loads(data):
+    return parse_doc(data, None)
+
+
+def load(f):
+    return loads(f.read())
+
+
+def apply_defaults(cfg):
+    if "DEFAULT" not in cfg:
+        return cfg
+
+    defaults = cfg["DEFAULT"]
+    not_defaults = cfg[~eq("DEFAULT")]
+    for c in not_defaults:
+        for d in defaults.grandchildren:
+            if d.name not in c:
+                c.children.append(d)
+
+    cfg.children = list(not_defaults)
+    return cfg
+
+
+def grammar(ctx=None):
+    """
+    Returns a parser for a document that produces a list of its sections.
+    Sections start with their headers, so a document can be split in front of
+    any of them and the pieces parsed separately.
+    """
+    return rules(ctx)[0]
+
+
+def rules(ctx=None):
+    """
+    Returns the parser :py:func:`grammar` returns and the parser for one of
+    its top level statements, a section or a comment, so a document can be
+    streamed with ``Top.iterparse(f, item=Stmt)``. Comments are None.
+    """
     def to_directive(x):
         name, rest = x
         rest = [rest] if rest is not None else []
@@ -15,20 +52,6 @@ def parse_doc(content, ctx):
     def to_section(name, rest):
         return Section(name=name.value.strip(), children=rest, lineno=name.lineno, src=ctx)
 
-    def apply_defaults(cfg):
-        if "DEFAULT" not in cfg:
-            return cfg
-
-        defaults = cfg["DEFAULT"]
-        not_defaults = cfg[~eq("DEFAULT")]
-        for c in not_defaults:
-            for d in defaults.grandchildren:
-                if d.name not in c:
-                    c.children.append(d)
-
-        cfg.children = list(not_defaults)
-        return cfg
-
     header_chars = (set(string.printable) - set(string.whitespace) - set("[]")) | set(" ")
     sep_chars = set("=:")
     key_chars = header_chars - sep_chars
@@ -51,8 +74,17 @@ def parse_doc(content, ctx):
 
     Line = Comment | KVPair.map(to_directive)
     Sect = Lift(to_section) * Header * Many(Line).map(skip_none)
-    Doc = Many(Comment | Sect).map(skip_none)
-    Top = Doc << WS << EOF
+    Stmt = Comment | Sect
+    Doc = Many(Stmt).map(skip_none)
+    return (Doc << WS << EOF) % "ini", Stmt
+
+
+# the grammar for documents without a context, built once so loads doesn't
+# build a new one for every call
+Top, Stmt = rules()
 
-    res = Entry(children=Top(content), src=ctx)
+
+def parse_doc(content, ctx):
+    Doc = Top if ctx is None else grammar(ctx)
+    res = Entry(children=Doc(content), src=ctx)
     return apply_defaults(res)
@@ -5,6 +5,16 @@ keys without values and skips blank lines and single line comments.
 You can configure the k/v separator character and the comment start character.
 
 It returns a dictionary. The last definition for a given key sets its value.
+
+Large files can be streamed one line at a time with ``Line``. Comments and
+blank lines are None, and pairs are tuples of the key's mark and the value.
+
+    .. code-block:: python
+
+        kv = KVPairs()
+        with open(path) as f:
+            for pair in kv.Top.iterparse(f, item=kv.Line):
+                ...
 """
 import operator
 import string
@@ -15,6 +25,8 @@ from parsr.query import Entry
 
 
 def loads(s, sep_chars="=:", comment_chars="#;"):
+    if sep_chars == "=:" and comment_chars == "#;":
+        return DEFAULT.loads(s)
     return KVPairs(sep_chars=sep_chars, comment_chars=comment_chars).loads(s)
 
 
@@ -44,12 +56,17 @@ class KVPairs:
         Sep = InSet(sep_chars)
         Value = WS >> (Num | String(value_chars).map(lambda x: x.strip()))
         KVPair = (Key + Opt(Sep + Value, default=[None, None])).map(lambda a: (a[0], a[1][1]))
-        Line = Comment | KVPair | EOL.map(lambda x: None)
-        Doc = Many(Line).map(skip_none).map(to_entry)
-        self.Top = Doc + EOF
+        self.Line = Comment | KVPair | EOL.map(lambda x: None)
+        Doc = Many(self.Line).map(skip_none).map(to_entry)
+        self.Top = (Doc + EOF) % "kvpairs"
 
     def loads(self, s):
         return self.Top(s)[0]
 
     def load(self, f):
         return self.loads(f.read())
+
+
+# the grammar for the default separators and comments, built once so loads
+# doesn't build a new one for every call
+DEFAULT = KVPairs()
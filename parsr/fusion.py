@@ -0,0 +1,440 @@
+"""
+fusion finds parts of a grammar that only use regular combinators and replaces
+each of them with a single regular expression that matches the same input and
+builds the same value. Lexical rules like quoted strings, comments, and
+whitespace then run inside ``re`` instead of as dozens of ``process`` calls
+per token.
+
+Use :py:meth:`parsr.Parser.optimize` to get an :py:class:`Optimized` parser
+that can be invoked like any other.
+
+    .. code-block:: python
+
+        from parsr.examples.nginx_conf import Top
+
+        fast = Top.optimize()
+        val = fast(data)
+
+These parsers can be fused: :py:class:`parsr.Char`, :py:class:`parsr.InSet`,
+:py:class:`parsr.String`, :py:class:`parsr.Literal` when it's case sensitive,
+:py:data:`parsr.AnyChar`, :py:data:`parsr.Space`, :py:data:`parsr.EOF`,
+:py:class:`parsr.Sequence`, :py:class:`parsr.Choice`,
+:py:class:`parsr.Many`, :py:class:`parsr.Until`, :py:class:`parsr.Opt`,
+:py:class:`parsr.KeepLeft`, :py:class:`parsr.KeepRight`,
+:py:class:`parsr.FollowedBy`, :py:class:`parsr.NotFollowedBy`,
+:py:class:`parsr.PosMarker`, and wrappers around them. Every part of a fused
+pattern is an atomic group, so it never backtracks into a part that has
+already matched. That's how PEGs behave.
+
+:py:class:`parsr.Many` and :py:class:`parsr.Until` are only fused if their
+values are single characters or aren't used. Parsers with debugging enabled or
+that are memoized are left alone.
+
+Atomic groups and possessive quantifiers were added to ``re`` in python
+3.11. On older versions, they're emulated with a lookahead that captures what
+it matches followed by a backreference to the capture, like
+``(?=(?P<a1>...))(?P=a1)``. The regular expression engine never backtracks
+into a lookahead, so the result is the same, but it's slower.
+
+Bytes input gets its own copy of the grammar whose patterns match UTF-8
+bytes. Like the interpreted parsers, they match characters that aren't ASCII
+by their UTF-8 encodings, so every parser produces the same values for bytes
+as for the decoded string.
+
+The optimized grammar is a copy, so the original is unchanged. If it fails,
+the original grammar is run on the same input so error messages are the same
+as if the grammar hadn't been optimized.
+"""
+import re
+import sys
+
+from parsr import (_decode, _whitespace, Char, Choice, FAIL, FollowedBy, InSet,
+        KeepLeft, KeepRight, Literal, Many, Mark, NotFollowedBy,
+        OneLineComment, Opt, Parser, PosMarker, Sequence, String, Until,
+        Wrapper)
+from parsr.compiler import AnyCharType, char_class, EOFType, SpaceType
+
+# Atomic groups and possessive quantifiers were added to re in python 3.11.
+# They're emulated on older versions.
+ATOMIC = sys.version_info >= (3, 11)
+
+# Parsers whose values are the single character they matched.
+SINGLE = (Char, InSet, AnyCharType, SpaceType)
+
+# Parsers whose values are only made of their children's values, so the
+# children's values aren't needed if theirs isn't.
+STRUCTURAL = (Choice, FollowedBy, KeepLeft, KeepRight, Many, NotFollowedBy,
+              OneLineComment, Opt, PosMarker, Sequence, Until, Wrapper)
+
+
+class Fusion(object):
+    """
+    Fusion builds the regular expression for a subgraph along with a function
+    that creates the subgraph's value from a match.
+
+    If binary is True, the expression matches UTF-8 bytes. It's built as a
+    string with a character for each byte, like latin-1, so it can be put
+    together the same way as one for text.
+    """
+    def __init__(self, binary=False):
+        self.binary = binary
+        self.groups = 0
+        self.patterns = {
+            AnyCharType: self.any_char,
+            Char: self.char,
+            Choice: self.choice,
+            EOFType: self.eof,
+            FollowedBy: self.followed_by,
+            InSet: self.in_set,
+            KeepLeft: self.keep_left,
+            KeepRight: self.keep_right,
+            Literal: self.literal,
+            Many: self.many,
+            NotFollowedBy: self.not_followed_by,
+            OneLineComment: self.delegate,
+            Opt: self.opt,
+            PosMarker: self.pos_marker,
+            Sequence: self.sequence,
+            SpaceType: self.space,
+            String: self.string,
+            Until: self.until,
+            Wrapper: self.delegate,
+        }
+
+    def fusable(self, node):
+        return type(node) in self.patterns and not node._debug and not node._memo
+
+    def pattern(self, node, need):
+        """
+        Returns a regular expression for node and a function of the match and
+        context that returns node's value. The function is None if need is
+        False. Raises ``TypeError`` if the subgraph can't be fused.
+        """
+        if not self.fusable(node):
+            raise TypeError(node)
+        return self.patterns[type(node)](node, need)
+
+    def group(self, pattern):
+        self.groups += 1
+        name = "g{0}".format(self.groups)
+        return name, "(?P<{0}>{1})".format(name, pattern)
+
+    def atomic(self, pattern):
+        """
+        Returns a pattern that matches what pattern does without ever
+        backtracking into it.
+        """
+        if ATOMIC:
+            return "(?>%s)" % pattern
+        self.groups += 1
+        name = "a{0}".format(self.groups)
+        # grouped so it can be quantified like an atomic group
+        return "(?:(?=(?P<{0}>{1}))(?P={0}))".format(name, pattern)
+
+    def possessive(self, pattern, quantifier):
+        """
+        Returns a pattern that repeats pattern as often as quantifier allows
+        without giving any repetitions back. Pattern must be a single item,
+        like a group or a character class.
+        """
+        if ATOMIC:
+            return pattern + quantifier + "+"
+        return self.atomic(pattern + quantifier)
+
+    def text(self, pattern, need, func=None):
+        """
+        Returns a pattern that captures what it matches if need is True and a
+        function that returns the capture, transformed by func if given.
+        """
+        if not need:
+            return pattern, None
+        name, pattern = self.group(pattern)
+        if self.binary:
+            if func is None:
+                return pattern, lambda m, ctx: _decode(m.group(name))
+            return pattern, lambda m, ctx: func(_decode(m.group(name)))
+        if func is None:
+            return pattern, lambda m, ctx: m.group(name)
+        return pattern, lambda m, ctx: func(m.group(name))
+
+    def escape(self, chars):
+        """
+        Returns a pattern that matches chars literally.
+        """
+        if self.binary:
+            chars = chars.encode("utf-8").decode("latin-1")
+        return re.escape(chars)
+
+    def char_class(self, chars, utf8=False):
+        """
+        Returns a pattern that matches any one of chars. In bytes, characters
+        that aren't ASCII are matched by their UTF-8 encodings if utf8 is
+        True. Only string escapes leave it False, like the interpreted
+        parsers.
+        """
+        if not self.binary:
+            return char_class(chars)
+        ascii = char_class([c for c in chars if ord(c) < 128])
+        if not utf8:
+            return ascii
+        others = [self.escape(c) for c in sorted(chars) if ord(c) >= 128]
+        if not others:
+            return ascii
+        return "(?:%s)" % "|".join([ascii] + others)
+
+    def delegate(self, node, need):
+        return self.pattern(node.children[0], need)
+
+    def any_char(self, node, need):
+        if self.binary:
+            # a whole UTF-8 sequence
+            utf8 = u"(?s:[\x00-\x7f]|[\x80-\xdf].|[\xe0-\xef]..|[\xf0-\xff]...)"
+            return self.text(utf8, need)
+        return self.text("(?s:.)", need)
+
+    def char(self, node, need):
+        char = node.char
+        return self.char_class(char, utf8=True), (lambda m, ctx: char) if need else None
+
+    def in_set(self, node, need):
+        return self.text(self.char_class(node.values, utf8=True), need)
+
+    def space(self, node, need):
+        if self.binary:
+            return self.text(self.char_class(_whitespace(), utf8=True), need)
+        return self.text(r"\s", need)
+
+    def eof(self, node, need):
+        return r"\Z", (lambda m, ctx: None) if need else None
+
+    def string(self, node, need):
+        chars = self.char_class(node.chars, utf8=True)
+        minimum = "{%d,}" % node.min_length
+        if not node.echars:
+            return self.text(self.possessive(chars, minimum), need)
+        echars = char_class(node.echars)
+        pattern = self.possessive(r"(?:\\%s|%s)" % (self.char_class(node.echars), chars), minimum)
+        escape = re.compile(r"\\(%s)" % echars)
+        return self.text(pattern, need, lambda s: escape.sub(r"\1", s))
+
+    def literal(self, node, need):
+        if node.ignore_case:
+            # str.lower and re.IGNORECASE disagree about some characters
+            raise TypeError(node)
+        value = node.chars if node.value is Literal._NULL else node.value
+        return self.escape(node.chars), (lambda m, ctx: value) if need else None
+
+    def sequence(self, node, need):
+        parts = [self.pattern(c, need) for c in node.children]
+        pattern = "".join(self.atomic(p) for p, _ in parts)
+        if not need:
+            return pattern, None
+        funcs = [f for _, f in parts]
+        return pattern, lambda m, ctx: [f(m, ctx) for f in funcs]
+
+    def choice(self, node, need):
+        parts = [self.pattern(c, need) for c in node.children]
+        if not need:
+            return self.atomic("|".join(p for p, _ in parts)), None
+        alternatives = []
+        names = []
+        for p, f in parts:
+            name, p = self.group(p)
+            alternatives.append(p)
+            names.append((name, f))
+
+        def build(m, ctx):
+            for name, f in names:
+                if m.group(name) is not None:
+                    return f(m, ctx)
+        return self.atomic("|".join(alternatives)), build
+
+    def many(self, node, need):
+        child = node.children[0]
+        if need and type(child) not in SINGLE:
+            raise TypeError(node)
+        p, _ = self.pattern(child, False)
+        lower, upper = node.lower, node.upper
+        if upper is None:
+            pattern = self.possessive(self.atomic(p), "{%d,}" % lower)
+        else:
+            pattern = self.possessive(self.atomic(p), "{%d,%d}" % (lower, upper)) + "(?!%s)" % p
+        return self.text(pattern, need, list)
+
+    def until(self, node, need):
+        parser, pred = node.children
+        if need and type(parser) not in SINGLE:
+            raise TypeError(node)
+        p, _ = self.pattern(parser, False)
+        q, _ = self.pattern(pred, False)
+        step = "(?!%s)%s" % (q, self.atomic(p))
+        if node.upper is None:
+            pattern = self.possessive("(?:%s)" % step, "*")
+        else:
+            pattern = self.possessive("(?:%s)" % step, "{0,%d}" % node.upper) + "(?!%s)" % step
+        return self.text(pattern, need, list)
+
+    def opt(self, node, need):
+        p, f = self.pattern(node.children[0], need)
+        if not need:
+            return self.possessive("(?:%s)" % p, "?"), None
+        name, p = self.group(p)
+        default = node.default
+        return self.possessive(p, "?"), lambda m, ctx: f(m, ctx) if m.group(name) is not None else default
+
+    def keep_left(self, node, need):
+        left, right = node.children
+        p, f = self.pattern(left, need)
+        q, _ = self.pattern(right, False)
+        return self.atomic(p) + self.atomic(q), f
+
+    def keep_right(self, node, need):
+        left, right = node.children
+        p, _ = self.pattern(left, False)
+        q, f = self.pattern(right, need)
+        return self.atomic(p) + self.atomic(q), f
+
+    def followed_by(self, node, need):
+        left, right = node.children
+        p, f = self.pattern(left, need)
+        q, _ = self.pattern(right, False)
+        return self.atomic(p) + "(?=%s)" % q, f
+
+    def not_followed_by(self, node, need):
+        left, right = node.children
+        p, f = self.pattern(left, need)
+        q, _ = self.pattern(right, False)
+        return self.atomic(p) + "(?!%s)" % q, f
+
+    def pos_marker(self, node, need):
+        p, f = self.pattern(node.children[0], need)
+        if not need:
+            return p, None
+        name, p = self.group(p)
+
+        def build(m, ctx):
+            start, end = m.span(name)
+            return Mark(ctx.line(start) + 1, ctx.col(start) + 1, f(m, ctx),
+                        start + ctx.offset, end + ctx.offset)
+        return p, build
+
+
+class Fused(Parser):
+    """
+    Fused matches a regular expression built from a subgraph of a grammar and
+    returns the value the subgraph would have. If binary is True, pattern is
+    for bytes input and is encoded a character per byte.
+    """
+    def __init__(self, original, pattern, build, binary=False):
+        super(Fused, self).__init__()
+        self.original = original
+        self.name = original.name
+        self.pattern = pattern
+        self.regex = re.compile(pattern.encode("latin-1") if binary else pattern)
+        self.build = build
+
+    def _first(self, seen):
+        return self.original.first(seen)
+
+    def _freeze(self):
+        return [self.original]
+
+    def process(self, pos, data, ctx):
+        m = self.regex.match(data, pos)
+        if m is None:
+            ctx.set(pos, "Expected {0}.", self.original)
+            return FAIL
+        return m.end(), (self.build(m, ctx) if self.build is not None else None)
+
+    def __repr__(self):
+        return "Fused({0!r})".format(self.original)
+
+
+def worth_fusing(node):
+    """
+    Single characters and literals are as fast as a regular expression, so
+    they're only fused as part of something bigger.
+    """
+    while type(node) in (Wrapper, OneLineComment):
+        node = node.children[0]
+    return bool(node.children) or type(node) is String
+
+
+def fuse(parser, binary=False):
+    """
+    Returns a copy of the grammar with its largest regular subgraphs replaced
+    by :py:class:`Fused` parsers. Values that are discarded by
+    :py:class:`parsr.KeepLeft`, :py:class:`parsr.KeepRight`,
+    :py:class:`parsr.FollowedBy`, or :py:class:`parsr.NotFollowedBy` aren't
+    built, which lets more of those subgraphs be fused. If binary is True,
+    the copy only parses bytes input.
+    """
+    copies = {}
+
+    def needs(node, need):
+        kind = type(node)
+        if kind in (KeepLeft, FollowedBy, NotFollowedBy):
+            keep = [True, False]
+        elif kind is KeepRight:
+            keep = [False, True]
+        else:
+            keep = [True] * len(node.children)
+        if kind in STRUCTURAL and not need:
+            keep = [False] * len(node.children)
+        return keep
+
+    def visit(node, need):
+        key = (node, need)
+        if key in copies:
+            return copies[key]
+
+        if worth_fusing(node):
+            try:
+                pattern, build = Fusion(binary).pattern(node, need)
+            except TypeError:
+                pass
+            else:
+                new = copies[key] = Fused(node, pattern, build, binary)
+                return new
+
+        # copied without __setstate__, so the originals' children aren't
+        # linked to the copy
+        new = copies[key] = node.__class__.__new__(node.__class__)
+        new.__dict__.update(node.__getstate__())
+        # copies of a frozen grammar can be changed until they're frozen
+        new._frozen = False
+        new.set_children([visit(c, n) for c, n in zip(node.children, needs(node, need))])
+        new._hook()
+        return new
+
+    return visit(parser, True)
+
+
+class Optimized(Wrapper):
+    """
+    Optimized wraps a parser and runs the copy of it made by :py:func:`fuse`.
+    The copy for bytes input is made the first time bytes are parsed. Fused
+    parsers only report what their original expected, so the wrapped parser
+    is run instead when the context is collecting errors.
+    """
+    def __init__(self, parser):
+        super(Optimized, self).__init__(parser)
+        self.fused = fuse(parser)
+        self._bytes_fused = None
+
+    def bytes_fused(self):
+        """
+        Returns the copy of the grammar that's fused for bytes input.
+        """
+        if self._bytes_fused is None:
+            self._bytes_fused = fuse(self.children[0], binary=True)
+        return self._bytes_fused
+
+    def _freeze(self):
+        return [self.fused, self.bytes_fused()]
+
+    def process(self, pos, data, ctx):
+        if ctx.diagnose:
+            return self.children[0].process(pos, data, ctx)
+        fused = self.bytes_fused() if ctx.binary else self.fused
+        return fused.process(pos, data, ctx)
@@ -0,0 +1,335 @@
+"""
+metrics counts parses for dashboards. A :py:class:`Registry` is a call hook
+that keeps, for each grammar:
+
+- parses by outcome: ok, parse_error, or function_error
+- failed parses by the rule named with ``%`` at the farthest failure
+- :py:class:`parsr.Map` and :py:class:`parsr.Lift` functions that raised, by
+  rule
+- characters parsed, or bytes for bytes input
+- histograms of parse durations and input sizes
+
+and exports them in the Prometheus text format.
+
+    .. code-block:: python
+
+        from parsr.examples import httpd_conf, nginx_conf
+        from parsr.metrics import Registry
+
+        registry = Registry(grammars={"httpd": httpd_conf.Top, "nginx": nginx_conf.Top})
+        registry.install()
+
+        # for node_exporter's textfile collector
+        registry.write("/var/lib/node_exporter/parsr.prom")
+
+        # or for scraping
+        server = registry.serve(port=9464)
+
+Grammars are labeled with their names in grammars, or with the name given to
+the parser with ``%``. Other grammars are labeled with the class of the
+parser, like ``KeepLeft``, so every unnamed grammar of the same class shares a
+series. A warning is logged the first time each of those labels is used, so
+name every grammar that matters. Parses are counted where
+:py:meth:`parsr.Parser.__call__` is called, so calling a ``loads`` function
+counts a parse of the grammar it calls. Failures outside of any rule named
+with ``%`` have an empty rule label.
+
+Each thread counts into its own set of metrics, so observing a parse never
+takes a lock. The lock is only taken the first time a thread reports a parse,
+and when a thread exits and its metrics are added to the totals. Exports add
+the threads' metrics up and may miss parses that finish while they run.
+"""
+import logging
+import os
+import threading
+import weakref
+from bisect import bisect_left
+
+from six.moves import BaseHTTPServer
+
+from parsr import add_call_hook, remove_call_hook
+
+DURATION_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+SIZE_BUCKETS = tuple(float(4 ** i * 1024) for i in range(9))
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+log = logging.getLogger(__name__)
+
+
+class Histogram(object):
+    """
+    Histogram counts observations in buckets by their upper bounds.
+    """
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # the last count is for observations above every bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def add(self, other):
+        for i, n in enumerate(other.counts):
+            self.counts[i] += n
+        self.sum += other.sum
+        self.count += other.count
+
+
+class GrammarMetrics(object):
+    """
+    GrammarMetrics has the metrics for one grammar.
+    """
+    def __init__(self, duration_buckets=DURATION_BUCKETS, size_buckets=SIZE_BUCKETS):
+        self.ok = 0
+        self.failures = {}
+        self.function_errors = {}
+        self.length = 0
+        self.duration = Histogram(duration_buckets)
+        self.size = Histogram(size_buckets)
+
+    def observe(self, event):
+        if event.error is None:
+            self.ok += 1
+        elif event.error == "function":
+            self.function_errors[event.rule] = self.function_errors.get(event.rule, 0) + 1
+        else:
+            self.failures[event.rule] = self.failures.get(event.rule, 0) + 1
+        self.length += event.length
+        self.duration.observe(event.seconds)
+        self.size.observe(event.length)
+
+    def add(self, other):
+        self.ok += other.ok
+        for mine, theirs in ((self.failures, other.failures),
+                             (self.function_errors, other.function_errors)):
+            for rule, n in list(theirs.items()):
+                mine[rule] = mine.get(rule, 0) + n
+        self.length += other.length
+        self.duration.add(other.duration)
+        self.size.add(other.size)
+
+
+class _Owner(object):
+    """
+    Held only by a thread's local storage so a weak reference to it tells
+    when the thread has exited.
+    """
+    pass
+
+
+class Registry(object):
+    """
+    Registry keeps :py:class:`GrammarMetrics` for every grammar that's
+    parsed while it's installed. grammars maps names to the parsers they
+    label.
+    """
+    def __init__(self, grammars=None, duration_buckets=DURATION_BUCKETS, size_buckets=SIZE_BUCKETS):
+        self.names = dict((p, n) for n, p in (grammars or {}).items())
+        self.duration_buckets = duration_buckets
+        self.size_buckets = size_buckets
+        self._local = threading.local()
+        # {grammar: GrammarMetrics} of each running thread by a weak
+        # reference to its owner, and the sum of the ones that exited
+        self._shards = {}
+        self._total = {}
+        self._lock = threading.Lock()
+        # labels of unnamed grammars that have been warned about
+        self._unnamed = set()
+
+    def install(self):
+        """
+        Starts observing parses.
+        """
+        add_call_hook(self)
+        return self
+
+    def uninstall(self):
+        """
+        Stops observing parses.
+        """
+        remove_call_hook(self)
+
+    def __enter__(self):
+        return self.install()
+
+    def __exit__(self, *args):
+        self.uninstall()
+
+    def __call__(self, event):
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._start_thread()
+        name = self.names.get(event.parser)
+        if name is None:
+            name = self._label(event.parser)
+        metrics = shard.get(name)
+        if metrics is None:
+            metrics = shard[name] = GrammarMetrics(self.duration_buckets, self.size_buckets)
+        metrics.observe(event)
+
+    def _start_thread(self):
+        owner = _Owner()
+        shard = {}
+        with self._lock:
+            self._shards[weakref.ref(owner, self._end_thread)] = shard
+        self._local.owner = owner
+        self._local.shard = shard
+        return shard
+
+    def _end_thread(self, ref):
+        # the thread's local storage was cleared, so nothing else adds to
+        # its shard
+        with self._lock:
+            shard = self._shards.pop(ref, {})
+            self._add(self._total, shard)
+
+    def _label(self, parser):
+        if parser._named:
+            return parser.name
+        # grammars built for each parse, like the ones loads functions
+        # build, share a label instead of adding a series for every parse
+        name = parser.__class__.__name__
+        if name not in self._unnamed:
+            # threads that race here may both warn, which is harmless
+            self._unnamed.add(name)
+            log.warning("Counting parses of unnamed grammars like %r as %r. Name them in "
+                        "grammars or with %% to count them separately.", parser, name)
+        return name
+
+    def _add(self, res, shard):
+        for name, metrics in list(shard.items()):
+            if name not in res:
+                res[name] = GrammarMetrics(self.duration_buckets, self.size_buckets)
+            res[name].add(metrics)
+
+    def collect(self):
+        """
+        Returns a dictionary of grammar names to their
+        :py:class:`GrammarMetrics` summed over every thread.
+        """
+        res = {}
+        with self._lock:
+            shards = list(self._shards.values())
+            self._add(res, self._total)
+        for shard in shards:
+            self._add(res, shard)
+        return res
+
+    def exposition(self):
+        """
+        Returns the metrics in the Prometheus text format.
+        """
+        grammars = sorted(self.collect().items())
+        out = []
+
+        def family(name, kind, doc):
+            out.append("# HELP {0} {1}".format(name, doc))
+            out.append("# TYPE {0} {1}".format(name, kind))
+
+        def sample(name, labels, value):
+            text = ",".join('{0}="{1}"'.format(k, _escape(v)) for k, v in labels)
+            out.append("{0}{{{1}}} {2}".format(name, text, _number(value)))
+
+        family("parsr_parses_total", "counter", "Documents parsed by outcome.")
+        for g, m in grammars:
+            sample("parsr_parses_total", [("grammar", g), ("outcome", "ok")], m.ok)
+            sample("parsr_parses_total", [("grammar", g), ("outcome", "parse_error")],
+                   sum(m.failures.values()))
+            sample("parsr_parses_total", [("grammar", g), ("outcome", "function_error")],
+                   sum(m.function_errors.values()))
+
+        family("parsr_parse_failures_total", "counter",
+               "Failed parses by the rule at the farthest failure.")
+        for g, m in grammars:
+            for rule, n in sorted(m.failures.items(), key=lambda i: str(i[0])):
+                sample("parsr_parse_failures_total", [("grammar", g), ("rule", rule or "")], n)
+
+        family("parsr_function_errors_total", "counter",
+               "Mapped and lifted functions that raised by rule.")
+        for g, m in grammars:
+            for rule, n in sorted(m.function_errors.items(), key=lambda i: str(i[0])):
+                sample("parsr_function_errors_total", [("grammar", g), ("rule", rule or "")], n)
+
+        family("parsr_input_total", "counter", "Characters, or bytes for bytes input, parsed.")
+        for g, m in grammars:
+            sample("parsr_input_total", [("grammar", g)], m.length)
+
+        for name, attr, doc in (("parsr_parse_duration_seconds", "duration", "Parse durations."),
+                                ("parsr_input_size", "size", "Input sizes in characters or bytes.")):
+            family(name, "histogram", doc)
+            for g, m in grammars:
+                h = getattr(m, attr)
+                total = 0
+                for bound, n in zip(h.buckets + (float("inf"),), h.counts):
+                    total += n
+                    sample(name + "_bucket", [("grammar", g), ("le", bound)], total)
+                sample(name + "_sum", [("grammar", g)], h.sum)
+                sample(name + "_count", [("grammar", g)], h.count)
+        return "\n".join(out) + "\n"
+
+    def write(self, path):
+        """
+        Writes the exposition to path. The file is replaced all at once, so
+        collectors never read part of it.
+        """
+        tmp = "{0}.tmp.{1}".format(path, os.getpid())
+        with open(tmp, "w") as f:
+            f.write(self.exposition())
+        os.rename(tmp, path)
+
+    def serve(self, host="127.0.0.1", port=0):
+        """
+        Serves the exposition over HTTP from a daemon thread and returns the
+        :py:class:`MetricsServer`. Port 0 picks a free port.
+        """
+        return MetricsServer(self, (host, port)).start()
+
+
+class MetricsServer(object):
+    """
+    MetricsServer answers every GET with the exposition of a
+    :py:class:`Registry`. It stands in for an exporter in tests and small
+    deployments.
+    """
+    def __init__(self, registry, address):
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.exposition().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = BaseHTTPServer.HTTPServer(address, Handler)
+        self.address = self.httpd.server_address
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="parsr-metrics")
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self._thread.join()
+
+
+def _escape(value):
+    if isinstance(value, float):
+        return "+Inf" if value == float("inf") else repr(value)
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _number(value):
+    return repr(value) if isinstance(value, float) else str(value)
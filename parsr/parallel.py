@@ -0,0 +1,276 @@
+"""
+parallel parses one large document on several cores. A splitter finds places
+where the document can be cut without breaking a statement, each piece is
+parsed in its own process, and the values of the pieces are merged.
+
+    .. code-block:: python
+
+        from parsr.examples.kvpairs import KVPairs
+        from parsr.parallel import lines, parse_parallel
+
+        top = parse_parallel(KVPairs().Top, data, lines, workers=8)
+
+Each piece is parsed as if it were at its place in the whole document, so line
+numbers, columns, and :py:class:`parsr.Mark` positions are the same as they
+would be in a serial parse.
+
+A splitter is a function of the data, the start of the current piece, and a
+position. It returns the first place at or after the position where the next
+piece can start, or the length of the data if there isn't one. These are
+included:
+
+* :py:func:`lines` cuts at the start of any line, for formats like key/value
+  pairs where every line stands alone.
+* :py:func:`starts` makes a splitter that cuts in front of lines that match a
+  regular expression. :py:data:`sections` cuts in front of ``[section]``
+  headers at the start of a line, like the ones in INI files. Indented
+  headers aren't cut in front of since they can't be told apart from
+  continued values.
+* :py:func:`blocks` makes a splitter that cuts at the start of lines that
+  aren't inside any braces, for formats like nginx and corosync.
+
+Splitters only look at the text, so braces in comments or quoted strings can
+fool them. If any piece fails to parse, the whole document is parsed serially
+instead. A cut that leaves pieces that parse by themselves but mean something
+else, like a continued value taken for a new statement, isn't caught, so a
+splitter must only cut where the grammar starts a new statement.
+
+Grammars usually contain lambdas and can't be pickled, so on platforms that
+can fork, the workers inherit the grammar from the parent process. Elsewhere,
+the grammar must be picklable.
+"""
+import multiprocessing
+import re
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from six import string_types
+
+from parsr import Context, Sequence, Wrapper
+from parsr.compiler import Compiled, EOFType
+from parsr.fusion import Optimized
+from parsr.query import Entry
+
+# Pieces smaller than this aren't worth sending to another process.
+MIN_CHUNK_SIZE = 64 * 1024
+
+# Each worker gets about this many pieces, so a slow piece doesn't leave the
+# others idle.
+CHUNKS_PER_WORKER = 4
+
+# The grammar in a worker process.
+_grammar = None
+
+# ProcessPoolExecutor takes an initializer and a multiprocessing context on
+# python 3.7 and later.
+_INITIALIZER = sys.version_info >= (3, 7)
+
+
+def _newline(data):
+    return "\n" if isinstance(data, string_types) else b"\n"
+
+
+def _line_start(data, pos):
+    """
+    Returns the start of the first line at or after pos.
+    """
+    newline = _newline(data)
+    if pos <= 0 or data[pos - 1:pos] == newline:
+        return max(pos, 0)
+    end = data.find(newline, pos)
+    return len(data) if end == -1 else end + 1
+
+
+def _pattern(pattern, data):
+    return pattern if isinstance(data, string_types) else pattern.encode("utf-8")
+
+
+def lines(data, start, pos):
+    """
+    Splits data at the start of any line.
+    """
+    return _line_start(data, pos)
+
+
+def starts(pattern):
+    """
+    Returns a splitter that splits data in front of lines that match pattern.
+    """
+    regexes = {}
+
+    def split(data, start, pos):
+        kind = type(_newline(data))
+        if kind not in regexes:
+            regexes[kind] = re.compile(_pattern("(?m)^(?:%s)" % pattern, data))
+        m = regexes[kind].search(data, _line_start(data, pos))
+        return len(data) if m is None else m.start()
+    return split
+
+
+# Only headers at the start of a line. Indented lines that start with a
+# bracket may continue the value on the line before.
+sections = starts(r"\[")
+
+
+def blocks(open="{", close="}"):
+    """
+    Returns a splitter that splits data at the start of lines that aren't
+    between open and close.
+    """
+    regexes = {}
+
+    def split(data, start, pos):
+        kind = type(_newline(data))
+        if kind not in regexes:
+            regexes[kind] = re.compile(_pattern("[%s%s]" % (re.escape(open), re.escape(close)), data))
+        regex = regexes[kind]
+        opener = _pattern(open, data)
+        size = len(data)
+        depth = 0
+        line = _line_start(data, pos)
+        while line < size:
+            for m in regex.finditer(data, start, line):
+                depth += 1 if m.group() == opener else -1
+            start = line
+            if depth == 0:
+                return line
+            for m in regex.finditer(data, start):
+                depth += 1 if m.group() == opener else -1
+                if depth == 0:
+                    start = m.end()
+                    break
+            else:
+                return size
+            line = _line_start(data, start)
+        return size
+    return split
+
+
+def chunks(data, splitter, chunk_size):
+    """
+    Cuts data into pieces of at least chunk_size with splitter and returns a
+    list of each piece along with the offset, line, and column where it
+    starts.
+    """
+    newline = _newline(data)
+    results = []
+    offset, line, col = 0, 0, 0
+    start = 0
+    while start < len(data):
+        end = splitter(data, start, start + chunk_size)
+        chunk = data[start:end]
+        results.append((chunk, (offset, line, col)))
+        count = chunk.count(newline)
+        if count:
+            line += count
+            col = len(chunk) - chunk.rfind(newline) - 1
+        else:
+            col += len(chunk)
+        offset = start = end
+    return results
+
+
+def _unwrap(parser):
+    while type(parser) in (Compiled, Optimized, Wrapper):
+        parser = parser.children[0]
+    return parser
+
+
+def merge_values(values):
+    """
+    Merges the values of the pieces of a document. Entries become one entry
+    with all of their children, and lists are joined.
+    """
+    first = values[0]
+    if isinstance(first, Entry):
+        children = [c for v in values for c in v.children]
+        return Entry(name=first._name, attrs=first.attrs, children=children,
+                     lineno=first.lineno, src=first.src)
+    if isinstance(first, list):
+        return [v for value in values for v in value]
+    raise Exception("Can't merge values of type {0}.".format(type(first).__name__))
+
+
+def merge(grammar, values, merge_values=merge_values):
+    """
+    Merges the values grammar produced for the pieces of a document. Grammars
+    shaped like ``Doc + EOF`` have the values of their ``Doc`` merged.
+    """
+    top = _unwrap(grammar)
+    if type(top) is Sequence and len(top.children) == 2 and type(_unwrap(top.children[1])) is EOFType:
+        return [merge_values([v[0] for v in values]), None]
+    return merge_values(values)
+
+
+def _init(grammar):
+    global _grammar
+    _grammar = grammar
+
+
+def _parse(chunk, start):
+    return _grammar._call(chunk, None, Context, False, start)
+
+
+def _context():
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context()
+
+
+# Held while _grammar is set for workers that are about to be forked.
+_forking = threading.Lock()
+
+
+def _submit(grammar, pieces, workers):
+    """
+    Starts a pool of workers that have grammar and submits the pieces to it.
+    Returns the pool and the futures of the pieces.
+
+    Without an initializer, the workers are forked while the pieces are
+    submitted, and they inherit grammar from ``_grammar`` in this process
+    while it's set.
+    """
+    if _INITIALIZER:
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=_context(),
+                                   initializer=_init, initargs=(grammar,))
+        return pool, [pool.submit(_parse, chunk, start) for chunk, start in pieces]
+
+    with _forking:
+        _init(grammar)
+        try:
+            pool = ProcessPoolExecutor(max_workers=workers)
+            return pool, [pool.submit(_parse, chunk, start) for chunk, start in pieces]
+        finally:
+            _init(None)
+
+
+def parse_parallel(grammar, data, splitter, workers=None, chunk_size=None, merge_values=merge_values):
+    """
+    Parses data with grammar in pieces found by splitter, using a pool of
+    workers processes, and returns the merged value. workers defaults to the
+    number of CPUs, and pieces are at least chunk_size long.
+
+    merge_values is called with the list of the pieces' values, or the values
+    of their ``Doc`` if grammar is shaped like ``Doc + EOF``, and returns
+    their combination.
+    """
+    workers = workers or multiprocessing.cpu_count()
+    if chunk_size is None:
+        chunk_size = max(MIN_CHUNK_SIZE, len(data) // (workers * CHUNKS_PER_WORKER))
+    pieces = chunks(data, splitter, chunk_size)
+    if workers == 1 or len(pieces) < 2:
+        return grammar(data)
+
+    pool, futures = _submit(grammar, pieces, workers)
+    with pool:
+        try:
+            values = [f.result() for f in futures]
+        except Exception:
+            values = None
+
+    if values is None:
+        # a bad split or an error in the document. The serial parse has the
+        # right answer either way.
+        return grammar(data)
+    return merge(grammar, values, merge_values)
@@ -0,0 +1,183 @@
+"""
+profiler measures where a grammar spends its time. A :py:class:`Profile` runs
+parses with every parser wrapped by ``_debug_hook`` and keeps statistics for
+each parser in the grammar:
+
+calls, ok, fail
+    How many times the parser was called and how many of those calls matched
+    or failed.
+self, total
+    Seconds spent in the parser itself and including the parsers it called.
+    Recursive calls are only counted once in total.
+consumed
+    Characters the parser matched when it succeeded.
+backtracked
+    Characters the parser's children matched during calls that failed
+    anyway, so the work was thrown away.
+
+    .. code-block:: python
+
+        from parsr import render
+        from parsr.examples import httpd_conf
+        from parsr.profiler import Profile
+
+        prof = Profile()
+        prof.run(httpd_conf.Top, data)
+        print(prof.report(limit=10))
+        render(httpd_conf.Top, stats=prof)
+
+Only the first parse of each call is profiled, not the second one that
+collects error messages if it fails. Calls answered from the memo table aren't
+counted. Compiled and optimized parsers run their grammars as closures, so
+they show up as one rule. Timing every call makes parsing several times
+slower, and the cost of the timer is included in self time, so compare rules
+to each other rather than to an unprofiled parse.
+"""
+import time
+
+from parsr import Context, FAIL
+
+timer = getattr(time, "perf_counter", time.time)
+
+
+class RuleStats(object):
+    """
+    The statistics a :py:class:`Profile` keeps for one parser.
+    """
+    def __init__(self):
+        self.calls = 0
+        self.successes = 0
+        self.failures = 0
+        self.time = 0.0
+        self.cumulative = 0.0
+        self.consumed = 0
+        self.backtracked = 0
+
+    def __str__(self):
+        return ("calls={0} ok={1} fail={2} self={3:.3f}ms total={4:.3f}ms "
+                "consumed={5} backtracked={6}").format(self.calls, self.successes,
+                                                       self.failures, self.time * 1000,
+                                                       self.cumulative * 1000, self.consumed,
+                                                       self.backtracked)
+
+    __repr__ = __str__
+
+
+class Recorder(object):
+    """
+    Recorder is the base class of objects that ``_debug_hook`` reports
+    parser calls to. Subclasses implement :py:meth:`call`. A recorder
+    shouldn't run parses in several threads at once. Only the parses it runs
+    are instrumented, so parses in other threads run at full speed.
+    """
+    def run(self, parser, data, src=None, Ctx=Context, memo=False):
+        """
+        Parses data with parser like :py:meth:`parsr.Parser.__call__` while
+        recording every call and returns the value.
+        """
+        contexts = []
+
+        def context(data, src=None):
+            ctx = Ctx(data, src=src)
+            if not contexts:
+                ctx.profile = self
+            contexts.append(ctx)
+            return ctx
+
+        try:
+            return parser(data, src=src, Ctx=context, memo=memo)
+        finally:
+            self._reset()
+
+    def _reset(self):
+        """
+        Called after each parse, even if it failed part way through.
+        """
+        pass
+
+    def call(self, func, parser, pos, data, ctx):
+        """
+        Calls func, the unwrapped process function of parser, and records the
+        call. ``_debug_hook`` calls it.
+        """
+        raise NotImplementedError()
+
+
+class Profile(Recorder):
+    """
+    Profile collects :py:class:`RuleStats` for every parser called during
+    the parses it runs. Statistics accumulate across parses.
+    """
+    def __init__(self):
+        self.stats = {}
+        # [time in children, farthest position a child matched to] for
+        # each active call
+        self._frames = []
+        # how many calls to each parser are active
+        self._active = {}
+
+    def get(self, parser):
+        """
+        Returns the :py:class:`RuleStats` for parser or None if it hasn't
+        been called.
+        """
+        return self.stats.get(parser)
+
+    def _reset(self):
+        self._frames = []
+        self._active = {}
+
+    def call(self, func, parser, pos, data, ctx):
+        stats = self.stats.get(parser)
+        if stats is None:
+            stats = self.stats[parser] = RuleStats()
+        frames = self._frames
+        active = self._active
+        frame = [0.0, pos]
+        frames.append(frame)
+        active[parser] = active.get(parser, 0) + 1
+
+        res = FAIL
+        start = timer()
+        try:
+            res = func(parser, pos, data, ctx)
+            return res
+        finally:
+            elapsed = timer() - start
+            frames.pop()
+            active[parser] -= 1
+
+            stats.calls += 1
+            stats.time += elapsed - frame[0]
+            if not active[parser]:
+                stats.cumulative += elapsed
+            if res is FAIL:
+                stats.failures += 1
+                stats.backtracked += frame[1] - pos
+            else:
+                stats.successes += 1
+                stats.consumed += res[0] - pos
+            if frames:
+                parent = frames[-1]
+                parent[0] += elapsed
+                if res is not FAIL and res[0] > parent[1]:
+                    parent[1] = res[0]
+
+    def report(self, limit=None, sort="time"):
+        """
+        Returns a table of the statistics for each parser, sorted on the
+        :py:class:`RuleStats` attribute named by sort from largest to
+        smallest. Only the first limit rows are included if it's given.
+        """
+        rows = sorted(self.stats.items(), key=lambda i: getattr(i[1], sort), reverse=True)
+        if limit is not None:
+            rows = rows[:limit]
+        fmt = "{0:>9} {1:>9} {2:>9} {3:>10} {4:>10} {5:>10} {6:>11}  {7}"
+        lines = [fmt.format("calls", "ok", "fail", "self(ms)", "total(ms)", "consumed",
+                            "backtracked", "rule")]
+        for parser, s in rows:
+            lines.append(fmt.format(s.calls, s.successes, s.failures,
+                                    "{0:.3f}".format(s.time * 1000),
+                                    "{0:.3f}".format(s.cumulative * 1000),
+                                    s.consumed, s.backtracked, parser))
+        return "\n".join(lines)
@@ -50,6 +50,11 @@ class Entry(object):
         Allows queries based on attribute access so long as they don't conflict
         with members of the Entry class itself.
         """
+        # protocol lookups like __setstate__ happen before unpickled entries
+        # have children to query.
+        if name.startswith("__"):
+            raise AttributeError(name)
+
         if name == "name" and self._name is not None:
             return self._name
 
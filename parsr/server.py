@@ -0,0 +1,345 @@
+"""
+server keeps a pool of pre-forked worker processes with every registered
+grammar already imported and built, listening on a unix socket. Short-lived
+programs send it a file's path or contents and get the parsed value back
+without paying for interpreter startup and grammar construction themselves.
+
+Start a server from the command line:
+
+    .. code-block:: sh
+
+        python -m parsr.server /run/parsr.sock --workers 4
+
+and parse with a :py:class:`Client`:
+
+    .. code-block:: python
+
+        from parsr.server import Client
+
+        with Client("/run/parsr.sock") as client:
+            conf = client.parse("nginx", path="/etc/nginx/nginx.conf")
+            listens = client.parse("nginx", path="/etc/nginx/nginx.conf",
+                                   query=["http", "server", "listen"])
+
+Grammars are registered by name with ``"module:attribute"`` references like
+the ones :py:func:`parsr.batch.parse_many` takes. :py:data:`GRAMMARS` has the
+examples. A query is a list of keys that are applied to the value in turn,
+like ``value["http"]["server"]["listen"]``, so only the part of the tree that's
+needed is sent back. Values that are lists of entries are queried as the
+children of one :py:class:`parsr.query.Entry`.
+
+Messages are prefixed with their length. Requests are JSON, so a client can't
+make a worker run code, and data sent as bytes is decoded by the client.
+Responses are pickled, so clients must only connect to servers they trust.
+The socket is only accessible to the user that started the server, since
+workers read any path they're sent. Each worker handles one connection at a
+time, and the kernel hands new connections to whichever worker is waiting.
+The server restarts workers that die.
+"""
+from __future__ import print_function
+import argparse
+import json
+import os
+import pickle
+import signal
+import socket
+import struct
+
+from parsr.batch import resolve
+from parsr.query import Entry
+
+GRAMMARS = {
+    "arith": "parsr.examples.arith:Top",
+    "corosync": "parsr.examples.corosync_conf:loads",
+    "httpd": "parsr.examples.httpd_conf:loads",
+    "ini": "parsr.examples.iniparser:loads",
+    "json": "parsr.examples.json_parser:loads",
+    "kvpairs": "parsr.examples.kvpairs:loads",
+    "logrotate": "parsr.examples.logrotate_conf:loads",
+    "multipath": "parsr.examples.multipath_conf:loads",
+    "nginx": "parsr.examples.nginx_conf:loads",
+}
+
+_HEADER = struct.Struct("!I")
+
+
+def _recv_exactly(conn, size):
+    chunks = []
+    while size:
+        chunk = conn.recv(min(size, 1 << 20))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def _recv_frame(conn):
+    header = _recv_exactly(conn, _HEADER.size)
+    if header is None:
+        return None
+    return _recv_exactly(conn, _HEADER.unpack(header)[0])
+
+
+def pack_message(obj):
+    """
+    Returns obj pickled and prefixed with its length.
+    """
+    data = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+    return _HEADER.pack(len(data)) + data
+
+
+def send_message(conn, obj):
+    """
+    Sends obj pickled and prefixed with its length.
+    """
+    conn.sendall(pack_message(obj))
+
+
+def recv_message(conn):
+    """
+    Returns the next object sent with :py:func:`send_message`, or None if the
+    connection was closed. Only use it for messages from a trusted peer.
+    """
+    data = _recv_frame(conn)
+    if data is None:
+        return None
+    return pickle.loads(data)
+
+
+def send_request(conn, name, path=None, data=None, query=None):
+    """
+    Sends a request as JSON prefixed with its length. data must be text or
+    UTF-8 bytes.
+    """
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    if isinstance(data, bytes):
+        data = data.decode("utf-8")
+    body = json.dumps([name, path, data, query]).encode("utf-8")
+    conn.sendall(_HEADER.pack(len(body)) + body)
+
+
+def recv_request(conn):
+    """
+    Returns the arguments of the next request sent with
+    :py:func:`send_request` as a list, or None if the connection was closed.
+    Raises ValueError if the request is malformed.
+    """
+    body = _recv_frame(conn)
+    if body is None:
+        return None
+    request = json.loads(body.decode("utf-8"))
+    if not isinstance(request, list) or len(request) != 4:
+        raise ValueError("Malformed request.")
+    return request
+
+
+class ParseServer(object):
+    """
+    ParseServer listens on a unix socket at address and handles requests
+    with workers forked processes. grammars maps format names to
+    ``"module:attribute"`` references and defaults to :py:data:`GRAMMARS`.
+    """
+    def __init__(self, address, grammars=None, workers=4):
+        self.address = address
+        self.refs = dict(GRAMMARS if grammars is None else grammars)
+        self.workers = workers
+        self.grammars = {}
+        self.pids = set()
+        self.sock = None
+
+    def start(self):
+        """
+        Builds the grammars, binds the socket, and forks the workers.
+        """
+        self.grammars = dict((name, resolve(ref)) for name, ref in self.refs.items())
+        # the socket only appears at address once it's listening
+        tmp = "{0}.{1}".format(self.address, os.getpid())
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(tmp)
+        # only the server's user may connect, before anyone can find it
+        os.chmod(tmp, 0o600)
+        self.sock.listen(128)
+        os.rename(tmp, self.address)
+        for _ in range(self.workers):
+            self._fork()
+        return self
+
+    def stop(self):
+        """
+        Stops the workers and removes the socket.
+        """
+        for pid in self.pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+        for pid in self.pids:
+            try:
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+        self.pids = set()
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+            if os.path.exists(self.address):
+                os.unlink(self.address)
+
+    def serve_forever(self):
+        """
+        Starts the server and restarts workers that die until the process
+        gets SIGTERM or SIGINT.
+        """
+        def terminate(signum, frame):
+            raise SystemExit(0)
+
+        signal.signal(signal.SIGTERM, terminate)
+        self.start()
+        try:
+            while True:
+                pid, _ = os.wait()
+                if pid in self.pids:
+                    self.pids.discard(pid)
+                    self._fork()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _fork(self):
+        pid = os.fork()
+        if pid:
+            self.pids.add(pid)
+            return
+        # the worker must never return into the code that started the server
+        status = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            self._work()
+        except BaseException:
+            status = 1
+        finally:
+            os._exit(status)
+
+    def _work(self):
+        while True:
+            conn, _ = self.sock.accept()
+            try:
+                self._serve(conn)
+            except (IOError, OSError):
+                pass
+            finally:
+                conn.close()
+
+    def _serve(self, conn):
+        while True:
+            try:
+                request = recv_request(conn)
+            except ValueError:
+                # the rest of the connection can't be trusted to be framed
+                # correctly either
+                send_message(conn, ("error", "Malformed request."))
+                return
+            if request is None:
+                return
+            try:
+                message = pack_message(("ok", self.handle(*request)))
+            except Exception as ex:
+                # parse errors and values that can't be pickled
+                message = pack_message(("error", str(ex)))
+            conn.sendall(message)
+
+    def handle(self, name, path=None, data=None, query=None):
+        """
+        Parses the file at path or data, which is text or UTF-8 bytes, with
+        the grammar registered as name and applies the query to the value.
+        """
+        grammar = self.grammars.get(name)
+        if grammar is None:
+            raise Exception("Unknown format {0!r}.".format(name))
+        if path is not None:
+            with open(path, "rb") as f:
+                data = f.read()
+        if isinstance(data, bytes):
+            data = data.decode("utf-8")
+        value = grammar(data)
+        if query and isinstance(value, list):
+            # loads functions like nginx_conf's return the top level entries
+            value = Entry(children=value)
+        for key in query or []:
+            value = value[key]
+        return value
+
+
+class Client(object):
+    """
+    Client sends requests to a :py:class:`ParseServer` over one connection.
+    """
+    def __init__(self, address):
+        self.address = address
+        self.sock = None
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.address)
+        return self
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def __enter__(self):
+        return self.connect()
+
+    def __exit__(self, *args):
+        self.close()
+
+    def parse(self, name, path=None, data=None, query=None):
+        """
+        Parses the file at path, which the server must be able to read, or
+        data with the grammar registered as name and returns the value, or
+        the result of the query if one is given. Raises an exception with the
+        server's message if the request fails.
+        """
+        if self.sock is None:
+            self.connect()
+        send_request(self.sock, name, path, data, query)
+        response = recv_message(self.sock)
+        if response is None:
+            self.close()
+            raise Exception("The parse server closed the connection.")
+        status, value = response
+        if status != "ok":
+            raise Exception(value)
+        return value
+
+
+def main():
+    p = argparse.ArgumentParser(description="Serves parsr grammars on a unix socket.")
+    p.add_argument("address", help="Path of the unix socket.")
+    p.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1)
+    p.add_argument("-g", "--grammar", action="append", default=[], metavar="NAME=MODULE:ATTR",
+                   help="Register a grammar in addition to the examples.")
+    args = p.parse_args()
+
+    grammars = dict(GRAMMARS)
+    for g in args.grammar:
+        name, _, ref = g.partition("=")
+        grammars[name] = ref
+    ParseServer(args.address, grammars, args.workers).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""
+shards parses a corpus of files that's too big for one machine. A manifest
+lists the paths, and it's split into a fixed number of shards. Each shard is
+parsed by one node, and its values and errors are written to a result file.
+A merge step reads every result file and builds one index of the corpus.
+
+    .. code-block:: sh
+
+        # on node 3 of 8
+        python -m parsr.shards run parsr.examples.nginx_conf:loads manifest.txt out --shards 8 --only 3
+        # once every node is done
+        python -m parsr.shards merge out
+
+Without ``--only``, every shard is parsed by a local pool of processes, each
+standing in for a node. Results are written to a temporary file that's renamed
+once it's complete, so a crash never leaves a partial result behind. Running
+again skips the shards that already have results for the same grammar and
+paths, so only the ones that failed are parsed again.
+
+Result files start with a pickled header that describes the shard: the
+grammar reference, the shard number and count, the shard's paths and their
+digest, the message of the exception that kept each failed file from being
+parsed, and where each parsed file's value is. The values follow the header,
+each pickled on its own, so checking a shard or loading one value never
+unpickles the rest. Values are usually :py:class:`parsr.query.Entry` trees.
+"""
+from __future__ import print_function
+import argparse
+import hashlib
+import os
+import pickle
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from parsr.batch import parse_path, resolve
+
+FORMAT = "parsr-shard"
+INDEX_FORMAT = "parsr-index"
+VERSION = 2
+INDEX = "index.pickle"
+
+
+def read_manifest(path):
+    """
+    Returns the paths listed one per line in the manifest at path.
+    """
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def split(paths, shards):
+    """
+    Splits paths into shards lists of nearly the same size. The same paths
+    and number of shards always give the same split.
+    """
+    size = len(paths)
+    return [paths[size * i // shards:size * (i + 1) // shards] for i in range(shards)]
+
+
+def digest(paths):
+    return hashlib.sha1("\n".join(paths).encode("utf-8")).hexdigest()
+
+
+def result_path(outdir, shard, shards):
+    return os.path.join(outdir, "shard-{0:05d}-of-{1:05d}.pickle".format(shard, shards))
+
+
+def _dump(obj, path, values=None):
+    # readers never see a partial file
+    tmp = "{0}.tmp.{1}".format(path, os.getpid())
+    with open(tmp, "wb") as f:
+        pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL)
+        for v in values or ():
+            f.write(v)
+    os.rename(tmp, path)
+
+
+def _load(path, offset=0):
+    # reads only the pickle at offset: an index, or a result file's header or
+    # one of its values
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return pickle.load(f)
+
+
+def _header(path):
+    # returns a result file's header and the offset its values start at
+    with open(path, "rb") as f:
+        header = pickle.load(f)
+        return header, f.tell()
+
+
+def is_complete(grammar_ref, paths, outdir, shard, shards):
+    """
+    Returns True if the shard already has results for grammar_ref and paths.
+    """
+    path = result_path(outdir, shard, shards)
+    if not os.path.exists(path):
+        return False
+    try:
+        res = _load(path)
+    except Exception:
+        return False
+    return (res.get("format") == FORMAT and res.get("version") == VERSION and
+            res.get("grammar") == grammar_ref and res.get("digest") == digest(paths))
+
+
+def parse_shard(grammar_ref, paths, outdir, shard, shards):
+    """
+    Parses paths with the grammar named by grammar_ref and writes the shard's
+    result file. Returns the file's path.
+    """
+    grammar = resolve(grammar_ref)
+    started = time.time()
+    values = []
+    offsets = {}
+    errors = {}
+    size = 0
+    for p in paths:
+        res = parse_path(grammar, p)
+        if res.error is not None:
+            errors[p] = "{0}: {1}".format(type(res.error).__name__, res.error)
+            continue
+        value = pickle.dumps(res.value, pickle.HIGHEST_PROTOCOL)
+        offsets[p] = size
+        size += len(value)
+        values.append(value)
+    out = result_path(outdir, shard, shards)
+    _dump({
+        "format": FORMAT,
+        "version": VERSION,
+        "grammar": grammar_ref,
+        "shard": shard,
+        "shards": shards,
+        "paths": paths,
+        "digest": digest(paths),
+        "started": started,
+        "finished": time.time(),
+        # from the end of the header
+        "offsets": offsets,
+        "errors": errors,
+    }, out, values)
+    return out
+
+
+def run(grammar_ref, paths, outdir, shards, workers=None, only=None):
+    """
+    Splits paths into shards and parses the ones that don't have results yet
+    in a pool of workers processes, which defaults to one per shard. If only
+    is given, just that shard is parsed, in this process. Returns a dictionary
+    from each shard that was attempted to None if it succeeded or the
+    exception that stopped it.
+    """
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    parts = split(paths, shards)
+    todo = [i for i in (range(shards) if only is None else [only])
+            if not is_complete(grammar_ref, parts[i], outdir, i, shards)]
+
+    status = {}
+    if only is not None:
+        for i in todo:
+            try:
+                parse_shard(grammar_ref, parts[i], outdir, i, shards)
+                status[i] = None
+            except Exception as ex:
+                status[i] = ex
+        return status
+
+    if not todo:
+        return status
+    with ProcessPoolExecutor(max_workers=workers or len(todo)) as pool:
+        futures = dict((i, pool.submit(parse_shard, grammar_ref, parts[i], outdir, i, shards))
+                       for i in todo)
+        for i, future in futures.items():
+            try:
+                future.result()
+                status[i] = None
+            except Exception as ex:
+                # the worker crashed or couldn't write its results
+                status[i] = ex
+    return status
+
+
+def merge(outdir):
+    """
+    Reads every shard's results in outdir and writes an index of the corpus
+    to ``index.pickle`` in outdir. The index maps each path to the result file
+    that has its value, each path that parsed to where its value is in that
+    file, and each path that failed to its error. Only the headers of the
+    result files are read. Raises an exception if any shard is missing or if
+    they don't agree.
+    """
+    names = sorted(n for n in os.listdir(outdir) if n.startswith("shard-") and n.endswith(".pickle"))
+    if not names:
+        raise Exception("No shard results in {0}.".format(outdir))
+
+    headers = {}
+    files = {}
+    offsets = {}
+    errors = {}
+    for name in names:
+        res, start = _header(os.path.join(outdir, name))
+        if res.get("format") != FORMAT or res.get("version") != VERSION:
+            raise Exception("{0} isn't a version {1} shard result.".format(name, VERSION))
+        headers[res["shard"]] = (res["grammar"], res["shards"])
+        for path in res["paths"]:
+            files[path] = name
+        for path, offset in res["offsets"].items():
+            offsets[path] = start + offset
+        errors.update(res["errors"])
+
+    grammars = set(g for g, _ in headers.values())
+    counts = set(n for _, n in headers.values())
+    if len(grammars) != 1 or len(counts) != 1:
+        raise Exception("Shards in {0} come from different runs.".format(outdir))
+    shards = counts.pop()
+    missing = sorted(set(range(shards)) - set(headers))
+    if missing:
+        raise Exception("Shards {0} of {1} are missing.".format(missing, shards))
+
+    index = {
+        "format": INDEX_FORMAT,
+        "version": VERSION,
+        "grammar": grammars.pop(),
+        "shards": shards,
+        "files": files,
+        "offsets": offsets,
+        "errors": errors,
+    }
+    _dump(index, os.path.join(outdir, INDEX))
+    return index
+
+
+def load(outdir, path, index=None):
+    """
+    Returns the value parsed from path using the index in outdir. Raises an
+    exception with the error message if the file failed to parse. Only the
+    file's value is read from its shard's results.
+    """
+    index = index or _load(os.path.join(outdir, INDEX))
+    if path in index["errors"]:
+        raise Exception(index["errors"][path])
+    return _load(os.path.join(outdir, index["files"][path]), index["offsets"][path])
+
+
+def main():
+    p = argparse.ArgumentParser(description="Parses a corpus in shards and merges the results.")
+    sub = p.add_subparsers(dest="command")
+    r = sub.add_parser("run", help="Parse shards that don't have results yet.")
+    r.add_argument("grammar", help="Grammar reference like parsr.examples.nginx_conf:loads.")
+    r.add_argument("manifest", help="File with one path per line.")
+    r.add_argument("outdir", help="Directory for the result files.")
+    r.add_argument("-n", "--shards", type=int, required=True)
+    r.add_argument("-w", "--workers", type=int)
+    r.add_argument("--only", type=int, help="Parse only this shard, in this process.")
+    m = sub.add_parser("merge", help="Index the results of every shard.")
+    m.add_argument("outdir")
+    args = p.parse_args()
+
+    if args.command == "run":
+        paths = read_manifest(args.manifest)
+        status = run(args.grammar, paths, args.outdir, args.shards, args.workers, args.only)
+        failed = sorted(i for i, ex in status.items() if ex is not None)
+        for i in failed:
+            print("shard {0} failed: {1!r}".format(i, status[i]), file=sys.stderr)
+        sys.exit(1 if failed else 0)
+    elif args.command == "merge":
+        index = merge(args.outdir)
+        print("{0} files, {1} errors".format(len(index["files"]), len(index["errors"])))
+    else:
+        p.print_help()
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
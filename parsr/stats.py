@@ -0,0 +1,162 @@
+"""
+stats describes individual parses for capacity planning. Every
+:py:class:`ParseStats` has numbers that cost little or nothing to collect,
+so they can be kept for every document in production:
+
+length
+    Characters, or bytes for bytes input, in the document.
+seconds, chars_per_second
+    How long the parse took, including the second parse that collects error
+    messages if it failed, and the throughput.
+failures
+    How many times a parser failed to match during the first parse. Compiled
+    and optimized grammars only count the failures of parsers that weren't
+    compiled or fused.
+memo_hits, memo_misses
+    Memo table lookups, if any parsers were memoized.
+max_recursion
+    The most :py:class:`parsr.Forward` rules that were active at once.
+    Grammars can only recurse through Forward, so this is how deeply rules
+    like ``httpd_conf.Complex`` in nested sections recursed.
+entries
+    :py:class:`parsr.query.Entry` instances in the value. Entries that were
+    built and then thrown away by backtracking aren't counted.
+
+The rest aren't cheap. Parsers don't count their own calls or keep a stack of
+active parsers, so with ``detail=True`` every parser is wrapped with
+``_debug_hook`` for the parse to fill them in, which makes it a few times
+slower. They're for sampling some documents, not for every one. Other parses
+of the grammar aren't slowed down.
+
+calls, failed_calls
+    How many times a parser's ``process`` method was called and how many of
+    those calls failed.
+max_depth
+    The deepest the stack of active parsers got.
+
+    .. code-block:: python
+
+        value, stats = httpd_conf.Top.parse_with_stats(data)
+        log.info("parsed %s chars at %.0f chars/s", stats.length, stats.chars_per_second)
+
+If the parse fails, the exception is raised with the statistics as its
+``stats`` attribute.
+"""
+from parsr import Context, FAIL
+from parsr.profiler import Recorder, timer
+from parsr.query import Entry
+
+
+class ParseStats(object):
+    """
+    ParseStats has the statistics of one parse.
+    """
+    def __init__(self, length):
+        self.length = length
+        self.seconds = 0.0
+        self.failures = 0
+        self.memo_hits = 0
+        self.memo_misses = 0
+        self.max_recursion = 0
+        self.entries = 0
+        self.calls = None
+        self.failed_calls = None
+        self.max_depth = None
+
+    @property
+    def chars_per_second(self):
+        return self.length / self.seconds if self.seconds else 0.0
+
+    def as_dict(self):
+        """
+        Returns the statistics as a dictionary for logging or serializing.
+        """
+        res = dict(self.__dict__)
+        res["chars_per_second"] = self.chars_per_second
+        return res
+
+    def __repr__(self):
+        items = sorted(self.as_dict().items())
+        return "ParseStats({0})".format(", ".join("{0}={1!r}".format(k, v) for k, v in items))
+
+
+class CallCounter(Recorder):
+    """
+    CallCounter counts the parser calls and stack depths of a parse for
+    :py:func:`parse_with_stats`.
+    """
+    def __init__(self):
+        self.calls = 0
+        self.failed_calls = 0
+        self.max_depth = 0
+
+    def call(self, func, parser, pos, data, ctx):
+        self.calls += 1
+        # _debug_hook pushes the parser before calling
+        depth = len(ctx.parser_stack)
+        if depth > self.max_depth:
+            self.max_depth = depth
+        res = func(parser, pos, data, ctx)
+        if res is FAIL:
+            self.failed_calls += 1
+        return res
+
+
+def count_entries(value):
+    """
+    Returns the number of :py:class:`parsr.query.Entry` instances in value,
+    which can be an entry or a list or tuple of values.
+    """
+    n = 0
+    stack = [value]
+    while stack:
+        v = stack.pop()
+        if isinstance(v, Entry):
+            n += 1
+            stack.extend(v.children)
+        elif isinstance(v, (list, tuple)):
+            stack.extend(v)
+    return n
+
+
+def parse_with_stats(parser, data, src=None, Ctx=Context, memo=False, detail=False):
+    """
+    Parses data with parser like :py:meth:`parsr.Parser.__call__` and returns
+    a tuple of the value and a :py:class:`ParseStats`.
+    """
+    stats = ParseStats(len(data))
+    counter = CallCounter() if detail else None
+    contexts = []
+
+    def context(data, src=None):
+        ctx = Ctx(data, src=src)
+        if not contexts:
+            ctx.profile = counter
+        contexts.append(ctx)
+        return ctx
+
+    start = timer()
+    try:
+        value = parser(data, src=src, Ctx=context, memo=memo)
+    except Exception as ex:
+        stats.seconds = timer() - start
+        _collect(stats, contexts, counter)
+        ex.stats = stats
+        raise
+    stats.seconds = timer() - start
+    _collect(stats, contexts, counter)
+    stats.entries = count_entries(value)
+    return value, stats
+
+
+def _collect(stats, contexts, counter):
+    if contexts:
+        ctx = contexts[0]
+        stats.failures = ctx.failures
+        stats.memo_hits = ctx.memo_hits
+        stats.memo_misses = ctx.memo_misses
+        stats.max_recursion = ctx.max_recursion
+    if counter is not None:
+        stats.calls = counter.calls
+        stats.failed_calls = counter.failed_calls
+        stats.max_depth = counter.max_depth
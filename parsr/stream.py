@@ -0,0 +1,275 @@
+"""
+stream parses documents that are a sequence of top level statements, like
+most configuration files, without holding the whole document in memory.
+Statements are parsed as soon as enough of the input has been read and their
+values are returned right away.
+
+Use :py:meth:`parsr.Parser.iterparse` with a grammar and the parser for one
+of its statements.
+
+    .. code-block:: python
+
+        from parsr.examples.nginx_conf import Stmt, Top
+
+        with open("nginx.conf") as f:
+            for entry in Top.iterparse(f, item=Stmt):
+                ...
+
+The grammar should be shaped like ``Many(item) + EOF``. Once no more items
+match, the grammar itself is run on what's left of the input so it's checked
+and errors are reported the same way they would be if the whole document had
+been parsed at once. If the grammar matches item anywhere in what's left, like
+after a separator in ``Many(item) + Char(";") + Many(item)``, those items
+can't be streamed, so an exception is raised instead of dropping them. Only
+parsers that aren't compiled or optimized are checked. Line numbers, columns,
+and :py:class:`parsr.Mark` positions are relative to the whole document.
+
+Only the statement being parsed and the chunk it's in are kept in memory. If
+no more items match and the grammar fails with more than the lookahead read
+past where it failed, the error is raised without reading the rest of the file.
+
+Files opened in binary mode are parsed as UTF-8 bytes, the way
+:py:meth:`parsr.Parser.parse_file` parses them, so only the values parsers
+produce are decoded. Positions count bytes instead of characters.
+
+When input arrives in pieces, like from a socket, use
+:py:meth:`parsr.Parser.push_parser` to get a :py:class:`PushParser` and
+feed it the pieces as they come. It calls a function with the value of each
+statement as soon as it's been parsed.
+
+    .. code-block:: python
+
+        p = Top.push_parser(handle_entry, item=Stmt)
+        for chunk in chunks:
+            p.feed(chunk)
+        p.close()
+"""
+from six import string_types
+
+from parsr import Context, FAIL, FunctionError
+from parsr.profiler import Recorder
+
+CHUNK_SIZE = 64 * 1024
+
+# A statement is only accepted once this many characters past everything its
+# parser looked at have been read, so lookahead can't see a premature end of
+# input. Literals and regular expressions must be shorter than this.
+LOOKAHEAD = 4 * 1024
+
+
+class Buffer(object):
+    """
+    Buffer holds the input that's been read but not parsed yet and where it
+    starts in the document.
+    """
+    def __init__(self, src=None, lookahead=LOOKAHEAD):
+        self.src = src
+        self.lookahead = lookahead
+        self.data = ""
+        self.pos = 0
+        self.start = (0, 0, 0)
+        self.final = False
+        self.ctx = None
+
+    def extend(self, chunk):
+        """
+        Adds chunk to the end of the buffer and drops the input that's already
+        been parsed.
+        """
+        data, pos = self.data, self.pos
+        if not data:
+            # the first chunk decides whether the input is text or bytes
+            data = chunk[:0]
+        if pos:
+            offset, line, col = self.start
+            newline = "\n" if isinstance(data, string_types) else b"\n"
+            lines = data.count(newline, 0, pos)
+            if lines:
+                line += lines
+                col = pos - data.rfind(newline, 0, pos) - 1
+            else:
+                col += pos
+            self.start = (offset + pos, line, col)
+        self.data = data[pos:] + chunk
+        self.pos = 0
+        self.ctx = None
+
+    def context(self):
+        # the context is reused until the data changes so newlines are only
+        # found once per chunk
+        ctx = self.ctx
+        if ctx is None:
+            ctx = self.ctx = Context(self.data, src=self.src)
+            ctx.diagnose = False
+            ctx.offset, ctx.line_offset, ctx.col_offset = self.start
+        ctx.pos = -1
+        ctx.tags = []
+        ctx.indents = []
+        return ctx
+
+    def next(self, item):
+        """
+        Parses the next item and returns its value. Returns :py:data:`FAIL` if
+        more input is needed or if no more items match.
+        """
+        ctx = self.context()
+        try:
+            res = item.process(self.pos, self.data, ctx)
+        except FunctionError:
+            return FAIL
+        if res is FAIL or res[0] == self.pos:
+            return FAIL
+        end, value = res
+        if not self.final and max(end, ctx.pos) + self.lookahead > len(self.data):
+            return FAIL
+        self.pos = end
+        return value
+
+    def stuck(self, parser):
+        """
+        Returns True if parser fails on the rest of the input with more than
+        lookahead characters read past everything it looked at, so reading
+        more can't make it match.
+        """
+        # compiled and optimized parsers only record how far they got when
+        # the context is diagnosing
+        ctx = Context(self.data, src=self.src)
+        try:
+            res = parser.process(self.pos, self.data, ctx)
+        except FunctionError:
+            return False
+        return res is FAIL and ctx.pos + self.lookahead < len(self.data)
+
+    def finish(self, parser, item=None):
+        """
+        Runs parser on the rest of the input and returns its value. It raises
+        the usual exception if the input doesn't match, or if item is given
+        and parser matched it anywhere in the rest of the input.
+        """
+        self.extend(self.data[:0])
+        if item is None:
+            return parser._call(self.data, self.src, Context, False, self.start)
+
+        watch = _Unstreamed(item)
+        contexts = []
+
+        def context(data, src=None):
+            ctx = Context(data, src=src)
+            if not contexts:
+                ctx.profile = watch
+            contexts.append(ctx)
+            return ctx
+
+        value = parser._call(self.data, self.src, context, False, self.start)
+        if watch.pos is not None:
+            ctx = contexts[0]
+            msg = "At line {0} column {1}: An item matched after the last one that could be streamed."
+            raise Exception(msg.format(ctx.line(watch.pos) + 1, ctx.col(watch.pos) + 1))
+        return value
+
+
+class _Unstreamed(Recorder):
+    """
+    Notes the first position item matched input at while the grammar parses
+    what's left after the streamed items.
+    """
+    def __init__(self, item):
+        self.item = item
+        self.pos = None
+
+    def call(self, func, parser, pos, data, ctx):
+        res = func(parser, pos, data, ctx)
+        if parser is self.item and res is not FAIL and res[0] > pos and self.pos is None:
+            self.pos = pos
+        return res
+
+
+class PushParser(object):
+    """
+    PushParser parses input that's given to it in pieces with :py:meth:`feed`
+    and passes the value of each item to callback as soon as the item has
+    been parsed. Call :py:meth:`close` at the end of the input to parse
+    whatever's left and check it with the grammar.
+
+    If item is None, the whole input is one value that's parsed and passed to
+    callback when the parser is closed.
+    """
+    def __init__(self, parser, callback, item=None, src=None, lookahead=LOOKAHEAD):
+        self.parser = parser
+        self.callback = callback
+        self.item = item
+        self.buf = Buffer(src=src, lookahead=lookahead)
+        self.pending = []
+        self.pending_size = 0
+        self.closed = False
+
+    def feed(self, chunk):
+        """
+        Adds chunk to the input and parses as many items as it can. Chunks can
+        be strings, bytes, or memoryviews, but they must all be text or all be
+        bytes.
+        """
+        if self.closed:
+            raise Exception("Can't feed a closed parser.")
+        if isinstance(chunk, memoryview):
+            chunk = chunk.tobytes()
+        self.pending.append(chunk)
+        self.pending_size += len(chunk)
+        # wait until as much input has arrived as is waiting to be parsed so
+        # an item split over many small chunks is only parsed a few times.
+        if self.pending_size >= len(self.buf.data) - self.buf.pos:
+            self._drain()
+
+    def close(self):
+        """
+        Parses the rest of the input. The grammar must match whatever's left
+        after the last item.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.buf.final = True
+        self._drain()
+        res = self.buf.finish(self.parser, self.item)
+        if self.item is None:
+            self.callback(res)
+
+    def _drain(self):
+        buf = self.buf
+        if self.pending:
+            buf.extend(self.pending[0][:0].join(self.pending))
+            self.pending = []
+            self.pending_size = 0
+        if self.item is None:
+            return
+        value = buf.next(self.item)
+        while value is not FAIL:
+            self.callback(value)
+            value = buf.next(self.item)
+
+
+def iterparse(parser, fileobj, item, src=None, chunk_size=CHUNK_SIZE, lookahead=LOOKAHEAD):
+    """
+    Reads fileobj in chunks and yields the value of each item at the start of
+    its contents. See :py:meth:`parsr.Parser.iterparse`.
+    """
+    buf = Buffer(src=src, lookahead=lookahead)
+    while True:
+        value = buf.next(item)
+        if value is not FAIL:
+            yield value
+        elif buf.final:
+            break
+        elif len(buf.data) - buf.pos > lookahead and buf.stuck(parser):
+            # a syntax error in the middle of the file is reported without
+            # reading the rest of it
+            break
+        else:
+            # read at least as much as is buffered so a statement that spans
+            # many chunks is only parsed again a few times.
+            chunk = fileobj.read(max(chunk_size, len(buf.data) - buf.pos))
+            if chunk:
+                buf.extend(chunk)
+            else:
+                buf.final = True
+    buf.finish(parser, item)
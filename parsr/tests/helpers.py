@@ -0,0 +1,19 @@
+import pytest
+from parsr.query import Entry
+
+
+def simplify(val):
+    # turns entries into tuples so values from different parses compare equal
+    if isinstance(val, Entry):
+        return (val._name, simplify(val.attrs), val.lineno, simplify(val.children))
+    if isinstance(val, (list, tuple)):
+        return [simplify(v) for v in val]
+    if isinstance(val, dict):
+        return dict((k, simplify(v)) for k, v in val.items())
+    return val
+
+
+def error(parser, data):
+    with pytest.raises(Exception) as ex:
+        parser(data)
+    return str(ex.value)
@@ -0,0 +1,146 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pytest
+from parsr import aio
+from parsr.examples import nginx_conf
+from parsr.examples.tests.test_nginx import NGINX_CONF
+from parsr.tests.helpers import error, simplify
+
+
+@pytest.fixture
+def paths(tmp_path):
+    result = []
+    for i in range(10):
+        path = tmp_path.joinpath("f{0}".format(i))
+        path.write_text(NGINX_CONF)
+        result.append(str(path))
+    return result
+
+
+class Slow(object):
+    """
+    Parses slowly and keeps track of how many parses run at once.
+    """
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.running = 0
+        self.most = 0
+        self.started = 0
+
+    def __call__(self, data):
+        with self.lock:
+            self.running += 1
+            self.started += 1
+            self.most = max(self.most, self.running)
+        time.sleep(self.delay)
+        with self.lock:
+            self.running -= 1
+        return len(data)
+
+
+def test_parse_file(paths):
+    res = asyncio.run(aio.parse_file(nginx_conf.Top, paths[0]))
+    assert simplify(res) == simplify(nginx_conf.Top(NGINX_CONF))
+
+
+def test_parse_file_errors(tmp_path):
+    path = tmp_path.joinpath("bad")
+    path.write_text("events {")
+    with pytest.raises(Exception) as ex:
+        asyncio.run(aio.parse_file(nginx_conf.Top, str(path)))
+    assert str(ex.value) == error(nginx_conf.Top, "events {")
+
+
+def test_process_pool(paths):
+    async def main():
+        with ProcessPoolExecutor(max_workers=2) as pool:
+            return await aio.parse_file("parsr.examples.nginx_conf:loads", paths[0], executor=pool)
+    assert simplify(asyncio.run(main())) == simplify(nginx_conf.loads(NGINX_CONF))
+
+
+def test_parse_files(paths):
+    async def main():
+        return [r async for r in aio.parse_files(nginx_conf.loads, paths + ["missing"], concurrency=3)]
+    results = asyncio.run(main())
+    assert sorted(r.path for r in results) == sorted(paths + ["missing"])
+    expected = simplify(nginx_conf.loads(NGINX_CONF))
+    for r in results:
+        if r.path == "missing":
+            assert isinstance(r.error, IOError)
+        else:
+            assert r.error is None and simplify(r.value) == expected
+
+
+def test_async_paths(paths):
+    async def gen():
+        for p in paths:
+            await asyncio.sleep(0)
+            yield p
+
+    async def main():
+        return [r async for r in aio.parse_files(len, gen())]
+    assert [r.value for r in asyncio.run(main())] == [len(NGINX_CONF)] * len(paths)
+
+
+def test_backpressure(paths):
+    slow = Slow()
+
+    async def main():
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            files = aio.parse_files(slow, paths, concurrency=2, executor=pool)
+            await files.__anext__()
+            # nothing more starts while the consumer is busy
+            await asyncio.sleep(slow.delay * 3)
+            started = slow.started
+            rest = [r async for r in files]
+        return started, rest
+
+    started, rest = asyncio.run(main())
+    assert started <= 3
+    assert len(rest) == len(paths) - 1
+    assert slow.most <= 2
+
+
+def test_loop_not_blocked(paths):
+    slow = Slow(0.2)
+    ticks = []
+
+    async def tick():
+        while True:
+            ticks.append(time.time())
+            await asyncio.sleep(0.01)
+
+    async def main():
+        ticker = asyncio.ensure_future(tick())
+        await aio.parse_file(slow, paths[0])
+        ticker.cancel()
+
+    asyncio.run(main())
+    assert len(ticks) > 5
+
+
+def test_cancellation(paths):
+    slow = Slow()
+
+    async def consume():
+        async for _ in aio.parse_files(slow, paths * 10, concurrency=2):
+            pass
+
+    async def main():
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            asyncio.get_running_loop().set_default_executor(pool)
+            task = asyncio.ensure_future(consume())
+            await asyncio.sleep(slow.delay * 2.5)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            return slow.started
+
+    started = asyncio.run(main())
+    time.sleep(slow.delay * 2)
+    assert started < 10
+    assert slow.started == started
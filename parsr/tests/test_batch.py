@@ -0,0 +1,78 @@
+import multiprocessing
+
+import pytest
+from parsr.batch import parse_many, resolve
+from parsr.examples import (arith, corosync_conf, httpd_conf, iniparser, json_parser,
+        kvpairs, logrotate_conf, multipath_conf, nginx_conf)
+from parsr.examples.tests.test_corosync import COROSYNC_CONF
+from parsr.examples.tests.test_httpd import DATA as HTTPD_CONF
+from parsr.examples.tests.test_iniparser import DATA as INI
+from parsr.examples.tests.test_kvpairs import DATA as KVPAIRS_DATA
+from parsr.examples.tests.test_logrotate import EXAMPLE as LOGROTATE_CONF
+from parsr.examples.tests.test_multipath import EXAMPLE as MULTIPATH_CONF
+from parsr.examples.tests.test_nginx import NGINX_CONF
+from parsr.tests.helpers import error, simplify
+
+EXAMPLES = [
+    ("parsr.examples.arith:Top", arith.Top, "2*(3+4)/3+4"),
+    ("parsr.examples.corosync_conf:loads", corosync_conf.loads, COROSYNC_CONF),
+    ("parsr.examples.httpd_conf:loads", httpd_conf.loads, HTTPD_CONF),
+    ("parsr.examples.iniparser:loads", iniparser.loads, INI),
+    ("parsr.examples.json_parser:loads", json_parser.loads, '{"a": [1, true]}'),
+    ("parsr.examples.kvpairs:loads", kvpairs.loads, KVPAIRS_DATA),
+    ("parsr.examples.logrotate_conf:loads", logrotate_conf.loads, LOGROTATE_CONF),
+    ("parsr.examples.multipath_conf:Top", multipath_conf.Top, MULTIPATH_CONF),
+    ("parsr.examples.nginx_conf:Top", nginx_conf.Top, NGINX_CONF),
+]
+
+
+@pytest.fixture
+def write(tmp_path):
+    def inner(name, data):
+        path = tmp_path.joinpath(name)
+        path.write_text(data)
+        return str(path)
+    return inner
+
+
+@pytest.mark.parametrize("ref, parse, data", EXAMPLES)
+def test_examples(write, ref, parse, data):
+    paths = [write("f{0}".format(i), data) for i in range(5)]
+    results = list(parse_many(ref, paths, workers=2, chunksize=2))
+    assert [r.path for r in results] == paths
+    assert all(r.error is None for r in results)
+    assert [simplify(r.value) for r in results] == [simplify(parse(data))] * 5
+
+
+def test_errors(write):
+    good = write("good", NGINX_CONF)
+    bad = write("bad", "events {")
+    results = list(parse_many("parsr.examples.nginx_conf:loads", [bad, good, "missing"], workers=2))
+    assert [r.path for r in results] == [bad, good, "missing"]
+    assert str(results[0].error) == error(nginx_conf.loads, "events {")
+    assert results[0].value is None
+    assert results[1].error is None
+    assert isinstance(results[2].error, IOError)
+
+
+def test_in_process(write):
+    path = write("f", KVPAIRS_DATA)
+    [res] = parse_many("parsr.examples.kvpairs:loads", [path], workers=1)
+    assert simplify(res.value) == simplify(kvpairs.loads(KVPAIRS_DATA))
+
+
+def test_spawn(write):
+    # spawned workers can only get the grammar by importing it
+    paths = [write("f{0}".format(i), NGINX_CONF) for i in range(3)]
+    ctx = multiprocessing.get_context("spawn")
+    results = list(parse_many("parsr.examples.nginx_conf:loads", paths, workers=2, mp_context=ctx))
+    assert [simplify(r.value) for r in results] == [simplify(nginx_conf.loads(NGINX_CONF))] * 3
+
+
+def test_resolve():
+    assert resolve("parsr.examples.nginx_conf:Top") is nginx_conf.Top
+    assert resolve("parsr.examples.kvpairs:KVPairs.loads") is kvpairs.KVPairs.loads
+    with pytest.raises(Exception):
+        resolve("parsr.examples.nginx_conf")
+    with pytest.raises(AttributeError):
+        resolve("parsr.examples.nginx_conf:Nope")
@@ -0,0 +1,111 @@
+import io
+
+import pytest
+from parsr import (AnyChar, Char, EOF, InSet, Literal, Many, PosMarker, Regex,
+        Space, String, WS)
+from parsr.examples import (arith, corosync_conf, httpd_conf, json_parser,
+        logrotate_conf, multipath_conf, nginx_conf)
+from parsr.examples.kvpairs import KVPairs
+from parsr.examples.tests.test_corosync import COROSYNC_CONF
+from parsr.examples.tests.test_httpd import DATA as HTTPD_CONF, HTTPD_CONF_NEST_1
+from parsr.examples.tests.test_kvpairs import DATA as KVPAIRS_DATA
+from parsr.examples.tests.test_logrotate import EXAMPLE as LOGROTATE_CONF
+from parsr.examples.tests.test_multipath import EXAMPLE as MULTIPATH_CONF
+from parsr.examples.tests.test_nginx import MIME_TYPES, NGINX_CONF
+from parsr.tests.helpers import error, simplify
+
+EXAMPLES = [
+    (arith.Top, "2*(3+4)/3+4"),
+    (corosync_conf.Top, COROSYNC_CONF),
+    (httpd_conf.Top, HTTPD_CONF),
+    (httpd_conf.Top, HTTPD_CONF_NEST_1),
+    (json_parser.Top, '{"a": [1, 2.5, "x\\"y", true, null, {"b": false}]}'),
+    (KVPairs().Top, KVPAIRS_DATA),
+    (logrotate_conf.Top, LOGROTATE_CONF),
+    (multipath_conf.Top, MULTIPATH_CONF),
+    (nginx_conf.Top, NGINX_CONF),
+    (nginx_conf.Top, MIME_TYPES),
+]
+
+MODES = [
+    lambda g: g,
+    lambda g: g.compile(),
+    lambda g: g.optimize(),
+]
+
+
+def encoded(data):
+    return [data.encode("utf-8"), memoryview(data.encode("utf-8"))]
+
+
+@pytest.mark.parametrize("grammar, data", EXAMPLES)
+@pytest.mark.parametrize("mode", MODES)
+def test_examples(grammar, data, mode):
+    expected = simplify(grammar(data))
+    p = mode(grammar)
+    for d in encoded(data):
+        assert simplify(p(d)) == expected
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_primitives(mode):
+    data = u"a b\té€\\\"x\"ABC!é"
+    p = mode(Char("a") + Space + InSet("b") + WS + String(u"é€\"x", echars="\"")
+             + Literal("abc", ignore_case=True) + Regex("!+") + AnyChar + EOF)
+    expected = ["a", " ", "b", ["\t"], u"é€\"x\"", "ABC", "!", u"é", None]
+    assert p(data) == expected
+    for d in encoded(data):
+        assert p(d) == expected
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_non_ascii_single_chars(mode):
+    p = mode(Many(InSet(u"aé")) + Many(Char(u"€")) + Many(Space) + EOF)
+    data = u"aéa€€\u00a0 \u3000"
+    assert p(data) == [[u"a", u"é", u"a"], [u"€", u"€"], [u"\u00a0", u" ", u"\u3000"], None]
+    for d in encoded(data):
+        assert p(d) == p(data)
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_values_are_text(mode):
+    p = mode(Many(WS >> String("abc") << WS))
+    res = p(b"abc cab ")
+    assert res == ["abc", "cab"]
+    assert all(type(v) is type(u"") for v in res)
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_positions(mode):
+    Word = WS >> PosMarker(String(u"abé")) << WS
+    marks = mode(Many(Word) + EOF)(u"ab\n éa b".encode("utf-8"))[0]
+    assert [m.value for m in marks] == ["ab", u"éa", "b"]
+    assert [(m.lineno, m.col, m.start, m.end) for m in marks] == [(1, 1, 0, 2), (2, 2, 4, 7), (2, 6, 8, 9)]
+
+
+def test_errors():
+    bad = NGINX_CONF.replace("events {", "events {{")
+    for d in encoded(bad):
+        for p in (nginx_conf.Top, nginx_conf.Top.compile(), nginx_conf.Top.optimize()):
+            with pytest.raises(Exception) as ex:
+                p(d)
+            assert str(ex.value) == error(nginx_conf.Top, bad)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 100, 65536])
+def test_iterparse(chunk_size):
+    expected = simplify(nginx_conf.Top(NGINX_CONF)[0])
+    f = io.BytesIO(NGINX_CONF.encode("utf-8"))
+    res = nginx_conf.Top.iterparse(f, item=nginx_conf.Stmt, chunk_size=chunk_size, lookahead=100)
+    assert simplify([v for v in res if v is not None]) == expected
+
+
+def test_push_parser():
+    expected = simplify(nginx_conf.Top(NGINX_CONF)[0])
+    data = memoryview(NGINX_CONF.encode("utf-8"))
+    values = []
+    p = nginx_conf.Top.push_parser(values.append, item=nginx_conf.Stmt, lookahead=100)
+    for i in range(0, len(data), 7):
+        p.feed(data[i:i + 7])
+    p.close()
+    assert simplify([v for v in values if v is not None]) == expected
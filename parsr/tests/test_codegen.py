@@ -0,0 +1,141 @@
+import ast
+import importlib.util
+import os
+import subprocess
+import sys
+
+import pytest
+from parsr import Backtrack, Char, Many, Number, Regex, WS, codegen
+from parsr.examples import (arith, corosync_conf, httpd_conf, json_parser,
+        logrotate_conf, multipath_conf, nginx_conf)
+from parsr.examples.kvpairs import KVPairs
+from parsr.examples.tests.test_corosync import COROSYNC_CONF
+from parsr.examples.tests.test_httpd import HTTPD_CONF_NEST_1
+from parsr.examples.tests.test_kvpairs import DATA as KVPAIRS_DATA
+from parsr.examples.tests.test_logrotate import EXAMPLE as LOGROTATE_CONF
+from parsr.examples.tests.test_multipath import EXAMPLE as MULTIPATH_CONF
+from parsr.examples.tests.test_nginx import MIME_TYPES, NGINX_CONF
+from parsr.tests.helpers import simplify
+
+
+@pytest.fixture
+def load(tmp_path):
+    def inner(parser):
+        path = tmp_path.joinpath("generated.py")
+        path.write_text(codegen.generate(parser))
+        spec = importlib.util.spec_from_file_location("generated", str(path))
+        mod = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(mod)
+        return mod
+    return inner
+
+
+def error(func, data):
+    with pytest.raises(Exception) as ex:
+        func(data)
+    return str(ex.value)
+
+
+def expected(msg):
+    # generated modules don't report the names of the active parsers
+    lines = msg.splitlines()
+    return lines[0], sorted(set(l for l in lines[1:] if l.startswith("    ")))
+
+
+@pytest.mark.parametrize("grammar, data", [
+    (arith.Top, "2*(3+4)/3+4"),
+    (corosync_conf.Top, COROSYNC_CONF),
+    (httpd_conf.Top, HTTPD_CONF_NEST_1),
+    (json_parser.Top, '{"a": [1, 2.5, "x", true, null, {"b": false}]}'),
+    (KVPairs().Top, KVPAIRS_DATA),
+    (logrotate_conf.Top, LOGROTATE_CONF),
+    (multipath_conf.Top, MULTIPATH_CONF),
+    (nginx_conf.Top, NGINX_CONF),
+    (nginx_conf.Top, MIME_TYPES),
+])
+def test_generated_examples(load, grammar, data):
+    mod = load(grammar)
+    assert simplify(mod.parse(data)) == simplify(grammar(data))
+
+
+@pytest.mark.parametrize("grammar, data", [
+    (arith.Top, "2*(3+4"),
+    (nginx_conf.Top, NGINX_CONF.replace("events {", "events {{")),
+    (json_parser.Top, '{"a": [1, 2.5,, "x"]}'),
+])
+def test_generated_errors(load, grammar, data):
+    mod = load(grammar)
+    assert expected(error(mod.parse, data)) == expected(error(grammar, data))
+
+
+def test_generated_function_error(load):
+    def boom(_):
+        raise Exception("Boom")
+
+    p = Char("a").map(boom)
+    assert error(load(p).parse, "a").startswith("At line 1 column 2: Map raised")
+
+
+def test_generated_backtrack(load):
+    def odd(x):
+        if x % 2 == 0:
+            raise Backtrack("Expected an odd number")
+        return x
+
+    p = Many(WS >> (Number.map(odd) | Char("2")))
+    assert load(p).parse("1 2 3") == [1.0, "2", 3.0]
+
+
+def test_generated_closure():
+    n = 1
+    p = Char("a").map(lambda x: x * n)
+    with pytest.raises(Exception):
+        codegen.generate(p)
+
+
+def test_generated_deterministic():
+    first = codegen.generate(nginx_conf.Top)
+    assert first == codegen.generate(nginx_conf.Top)
+    assert codegen.fingerprint(nginx_conf.Top) in first
+    assert codegen.fingerprint(nginx_conf.Top) != codegen.fingerprint(arith.Top)
+
+
+def test_generated_imports(tmp_path):
+    # generated modules only import what the grammar's functions need
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    env = dict(os.environ, PYTHONPATH=root)
+    tmp_path.joinpath("arith_parser.py").write_text(codegen.generate(arith.Top))
+    tmp_path.joinpath("nginx_parser.py").write_text(codegen.generate(nginx_conf.Top))
+    script = ("import sys, arith_parser, nginx_parser\n"
+              "assert arith_parser.parse('1+2*3') == 7.0\n"
+              "assert 'parsr.examples.nginx_conf' not in sys.modules\n"
+              "sys.modules.pop('parsr.query')\n"
+              "assert 'parsr' in sys.modules\n")
+    subprocess.check_call([sys.executable, "-c", script], cwd=str(tmp_path), env=env)
+
+    script = "import sys, arith_parser\nassert 'parsr' not in sys.modules\n"
+    subprocess.check_call([sys.executable, "-c", script], cwd=str(tmp_path), env=env)
+
+
+LAMBDAS = '''
+a = Char("a").map(lambda x: x.upper())
+b = Lift(lambda x, y=(1, 2): {x: y}) * Char("b")
+c = [lambda s: s[1:], lambda s: "é" + s]  # comment
+d = f(key=lambda m: (m.value
+                     if m else None), other=1)
+e = lambda: g(lambda x: x, 2)
+'''
+
+
+def test_lambda_segment_fallback():
+    nodes = [n for n in ast.walk(ast.parse(LAMBDAS)) if isinstance(n, ast.Lambda)]
+    assert len(nodes) == 7
+    for node in nodes:
+        assert codegen._lambda_segment(LAMBDAS, node) == ast.get_source_segment(LAMBDAS, node)
+
+
+def test_anchored_regex(load):
+    mod = load(Char("a") + Regex("^b+") + Regex("c", return_match=True))
+    v = mod.parse("abbc")
+    assert v[:2] == ["a", "bb"]
+    assert v[2].span() == (0, 1)
@@ -0,0 +1,83 @@
+import pytest
+from parsr import Backtrack, Char, Forward, InSet, Literal, Many, Number, Space, WS
+from parsr.examples import (arith, corosync_conf, httpd_conf, json_parser,
+        logrotate_conf, multipath_conf, nginx_conf)
+from parsr.examples.tests.test_corosync import COROSYNC_CONF
+from parsr.examples.tests.test_httpd import DATA as HTTPD_CONF, HTTPD_CONF_NEST_1
+from parsr.examples.tests.test_logrotate import EXAMPLE as LOGROTATE_CONF
+from parsr.examples.tests.test_multipath import EXAMPLE as MULTIPATH_CONF
+from parsr.examples.tests.test_nginx import MIME_TYPES, NGINX_CONF
+from parsr.tests.helpers import error, simplify
+
+
+@pytest.mark.parametrize("grammar, data", [
+    (arith.Top, "2*(3+4)/3+4"),
+    (corosync_conf.Top, COROSYNC_CONF),
+    (httpd_conf.Top, HTTPD_CONF),
+    (httpd_conf.Top, HTTPD_CONF_NEST_1),
+    (json_parser.Top, '{"a": [1, 2.5, "x", true, null, {"b": false}]}'),
+    (logrotate_conf.Top, LOGROTATE_CONF),
+    (multipath_conf.Top, MULTIPATH_CONF),
+    (nginx_conf.Top, NGINX_CONF),
+    (nginx_conf.Top, MIME_TYPES),
+])
+def test_compiled_examples(grammar, data):
+    assert simplify(grammar.compile()(data)) == simplify(grammar(data))
+
+
+def test_compiled_errors():
+    bad = NGINX_CONF.replace("events {", "events {{")
+    assert error(nginx_conf.Top.compile(), bad) == error(nginx_conf.Top, bad)
+
+    bad = HTTPD_CONF_NEST_1.replace("</Directory>", "</Direct>")
+    assert error(httpd_conf.Top.compile(), bad) == error(httpd_conf.Top, bad)
+
+
+def test_compiled_function_error():
+    def boom(_):
+        raise Exception("Boom")
+
+    p = Char("a").map(boom)
+    assert error(p.compile(), "a") == error(p, "a")
+
+
+def test_compiled_backtrack():
+    def odd(x):
+        if x % 2 == 0:
+            raise Backtrack("Expected an odd number")
+        return x
+
+    p = Many(WS >> (Number.map(odd) | Literal("2", value="two")))
+    assert p.compile()("1 2 3") == [1.0, "two", 3.0]
+
+
+@pytest.mark.parametrize("parser, data", [
+    (Many(Space) + Many(InSet("a-]")), " \t\u00a0\u2003a-]]b"),
+    (Many(Char("^"), lower=2), "^^^x"),
+    (Many(Char("x"), lower=2), "x"),
+    (Many(InSet("ab"), upper=2), "aba"),
+    (Many(Char("x").debug()), "xxy"),
+])
+def test_compiled_char_runs(parser, data):
+    try:
+        expected = parser(data)
+    except Exception:
+        with pytest.raises(Exception):
+            parser.compile()(data)
+    else:
+        assert parser.compile()(data) == expected
+
+
+def test_compiled_recursion():
+    expr = Forward()
+    expr <= (Char("(") >> expr << Char(")")) | Char("x")
+    p = expr.compile()
+    assert p("((x))") == "x"
+    with pytest.raises(Exception):
+        p("((x)")
+
+
+def test_compiled_memo():
+    lit = Literal("ab").memo()
+    p = (lit + Char("c")) | (lit + Char("d"))
+    assert p.compile()("abd") == ["ab", "d"]
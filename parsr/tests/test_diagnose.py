@@ -0,0 +1,74 @@
+import pytest
+from parsr import Char, Context, Lift, Many, Wrapper
+from parsr.examples import json_parser
+
+
+class Spy(Context):
+    contexts = []
+
+    def __init__(self, *args, **kwargs):
+        super(Spy, self).__init__(*args, **kwargs)
+        Spy.contexts.append(self)
+
+
+class Counted(Wrapper):
+    formatted = 0
+
+    def __repr__(self):
+        Counted.formatted += 1
+        return super(Counted, self).__repr__()
+
+
+@pytest.fixture(autouse=True)
+def reset():
+    Spy.contexts = []
+    Counted.formatted = 0
+
+
+def test_success_records_nothing():
+    assert json_parser.Top('{"a": [1, 2, {"b": null}]}', Ctx=Spy) == {"a": [1, 2, {"b": None}]}
+    ctx, = Spy.contexts
+    assert not ctx.diagnose
+    assert ctx.errors == []
+    assert ctx.parser_stack == []
+    assert ctx.pos > 0
+
+
+def test_messages_are_lazy():
+    p = Many(Counted(Char("a")), lower=2) | Char("a")
+    assert p("a") == "a"
+    assert Counted.formatted == 0
+
+
+def test_failure_parses_again():
+    p = Many(Counted(Char("a")), lower=2) | Char("b")
+    with pytest.raises(Exception) as ex:
+        p("")
+    assert "Expected at least 2 of Counted." in str(ex.value)
+    assert Counted.formatted > 0
+
+
+def test_diagnostic_pass():
+    with pytest.raises(Exception):
+        json_parser.Top('{"a": [1, 2,, 3]}', Ctx=Spy)
+    first, second = Spy.contexts
+    assert first.errors == [] and not first.diagnose
+    assert second.errors and second.diagnose and not second.dispatch
+    assert first.pos == second.pos
+
+
+def test_functions_run_again():
+    calls = []
+
+    def seen(x):
+        calls.append(x)
+        return x
+
+    p = Lift(lambda a, b: a + b) * Char("a").map(seen) * Char("b")
+    assert p("ab") == "ab"
+    assert calls == ["a"]
+    del calls[:]
+    with pytest.raises(Exception):
+        p("ac")
+    # once for the first parse and once for the one that collects messages
+    assert calls == ["a", "a"]
@@ -0,0 +1,132 @@
+import pytest
+from parsr import (Backtrack, Char, Context, FAIL, Many, Number, Parser, WS,
+        Wrapper)
+
+
+class OldStyle(Parser):
+    # fails the way custom parsers did before FAIL
+    def process(self, pos, data, ctx):
+        if data.startswith("ab", pos):
+            return pos + 2, "ab"
+        ctx.set(pos, "Expected ab.")
+        raise Exception()
+
+
+def test_process_returns_fail():
+    ctx = Context("b")
+    assert Char("a").process(0, "b", ctx) is FAIL
+    assert (Char("b") + Char("c")).process(0, "b", ctx) is FAIL
+    assert Char("b").process(0, "b", ctx) == (1, "b")
+
+
+def test_old_style_parser():
+    p = Wrapper(OldStyle() | Char("c")) + Char("d")
+    assert p("abd") == ["ab", "d"]
+    assert p("cd") == ["c", "d"]
+    with pytest.raises(Exception) as ex:
+        p("xd")
+    assert "Expected ab." in str(ex.value)
+
+
+def test_backtrack():
+    def odd(x):
+        if x % 2 == 0:
+            raise Backtrack("Expected an odd number.")
+        return x
+
+    p = Many(WS >> Number.map(odd))
+    assert p("1 3 4") == [1.0, 3.0]
+    with pytest.raises(Exception) as ex:
+        (Number.map(odd) + Char("x"))("2x")
+    assert "Expected an odd number." in str(ex.value)
+
+
+def test_function_error():
+    def boom(_):
+        raise Exception("Boom")
+
+    with pytest.raises(Exception) as ex:
+        (Char("a").map(boom) | Char("a"))("a")
+    assert str(ex.value).startswith("At line 1 column 2: Map raised")
+    assert "Boom" in str(ex.value)
+
+
+class OldChoice(Parser):
+    # backtracks by unpacking, so failing children still raise inside it
+    def __init__(self, left, right):
+        super(OldChoice, self).__init__()
+        self.set_children([left, right])
+
+    def process(self, pos, data, ctx):
+        try:
+            pos, value = self.children[0].process(pos, data, ctx)
+            return pos, value
+        except Exception:
+            return self.children[1].process(pos, data, ctx)
+
+
+class TryChoice(Parser):
+    # returns the first child's result from inside the try, so it relies on
+    # failing children raising
+    def __init__(self, left, right):
+        super(TryChoice, self).__init__()
+        self.set_children([left, right])
+
+    def process(self, pos, data, ctx):
+        try:
+            return self.children[0].process(pos, data, ctx)
+        except Exception:
+            return self.children[1].process(pos, data, ctx)
+
+
+class NewChoice(Parser):
+    checks_for_fail = True
+
+    def __init__(self, left, right):
+        super(NewChoice, self).__init__()
+        self.set_children([left, right])
+
+    def process(self, pos, data, ctx):
+        res = self.children[0].process(pos, data, ctx)
+        if res is FAIL:
+            res = self.children[1].process(pos, data, ctx)
+        return res
+
+
+def test_old_style_parser_in_combinators():
+    p = Many(OldStyle() | Char("c")) + Char("x")
+    assert p("abcabx") == [["ab", "c", "ab"], "x"]
+    assert OldStyle().process(0, "x", Context("x")) is FAIL
+
+
+def test_custom_combinators():
+    for Choice in (OldChoice, TryChoice, NewChoice):
+        p = Choice(OldStyle(), Char("c")) + Char("d")
+        assert p("abd") == ["ab", "d"]
+        assert p("cd") == ["c", "d"]
+        p = Choice(Char("a"), Char("c"))
+        assert p("c") == "c"
+        with pytest.raises(Exception) as ex:
+            p("x")
+        assert "At line 1 column 1" in str(ex.value)
+
+
+def test_children_of_custom_combinators():
+    a = Char("a")
+    p = TryChoice(Wrapper(a) + Char("b"), Char("c"))
+    seq = p.children[0]
+    assert seq.process(0, "x", Context("x")) is FAIL
+    ctx = Context("x")
+    ctx.raise_failures = True
+    with pytest.raises(Exception):
+        seq.process(0, "x", ctx)
+    # a's parent is in parsr, so a still returns FAIL to it
+    assert "process" not in a.__dict__
+    assert "process" not in NewChoice(a, Char("c")).children[0].__dict__
+    # failing and memoized parses run instrumented copies of the grammar
+    assert p("ab", memo=True) == ["a", "b"]
+    assert p("c", memo=True) == "c"
+    with pytest.raises(Exception) as ex:
+        p("x")
+    assert "Expected 'a'." in str(ex.value)
+    assert "Expected 'c'." in str(ex.value)
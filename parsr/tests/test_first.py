@@ -0,0 +1,108 @@
+import copy
+
+import pytest
+from parsr import (AnyChar, Char, Context, EOF, Forward, InSet, Literal, Many,
+        Number, Opt, Regex, String, WS, Wrapper)
+from parsr.examples import json_parser, multipath_conf, nginx_conf
+from parsr.examples.tests.test_nginx import NGINX_CONF
+
+
+class NoDispatch(Context):
+    def __init__(self, *args, **kwargs):
+        super(NoDispatch, self).__init__(*args, **kwargs)
+        self.dispatch = False
+
+
+def error(parser, data, **kwargs):
+    with pytest.raises(Exception) as ex:
+        parser(data, **kwargs)
+    return str(ex.value)
+
+
+def test_first_sets():
+    assert Char("a").first() == (set("a"), False)
+    assert InSet("ab").first() == (set("ab"), False)
+    assert String("ab", min_length=0).first() == (set("ab"), True)
+    assert Literal("xy").first() == (set("x"), False)
+    assert Literal("xy", ignore_case=True).first() == (None, True)
+    assert AnyChar.first()[0] is None
+    assert EOF.first() == (set(), False)
+    assert (Opt(Char("a")) + Char("b")).first() == (set("ab"), False)
+    assert (Many(Char("a")) + Opt(Char("b"))).first() == (set("ab"), True)
+    assert (Char("a") | Literal("bc")).first() == (set("ab"), False)
+    assert Number.first() == (set("-0123456789"), False)
+    assert Regex("(?i)a").first() == (None, True)
+    assert " " in (WS >> Char("a")).first()[0]
+
+
+def test_left_recursion():
+    expr = Forward()
+    expr <= (expr + Char("a")) | Char("b")
+    assert expr.first() == (None, True)
+
+
+def test_dispatch_table():
+    table, default = json_parser.JsonValue.children[0].children[1]._dispatch()
+    assert [repr(c) for c in table["["]] == ["Forward"]
+    assert default == []
+
+    table, default = multipath_conf.Value.children[0].children[1]._dispatch()
+    # numbers, "none", and bare words all start with "n"
+    assert len(table["n"]) == 2
+    assert len(table["1"]) == 2
+
+
+def test_ordered_choice():
+    # both alternatives start with "a", so the first one that matches wins
+    p = Wrapper(Literal("a") | Literal("ab")) + Opt(Char("b"))
+    assert p("ab") == ["a", "b"]
+
+
+def test_nullable_alternatives():
+    p = Char("x") | Opt(Char("y"), default="none")
+    assert p("z") == "none"
+    assert p("x") == "x"
+
+
+def test_table_rebuilt():
+    p = Char("a") | Char("b")
+    assert p("b") == "b"
+    p | Char("c")
+    assert p("c") == "c"
+
+
+def test_table_rebuilt_for_changes_below():
+    inner = Wrapper(Char("x"))
+    fwd = Forward()
+    fwd <= inner
+    p = Char("a") | fwd
+    assert p("x") == "x"
+    inner.set_children([InSet("yz")])
+    assert p("z") == "z"
+
+
+def test_table_kept_for_other_grammars():
+    p = Char("a") | Char("b")
+    assert p("b") == "b"
+    table = p._table
+    Char("x") + Char("y")
+    json_parser.Top("[1]")
+    assert p("a") == "a"
+    assert p._table is table
+
+
+def test_deep_copies_track_changes():
+    inner = Wrapper(Char("x"))
+    p = copy.deepcopy(Char("a") | inner)
+    assert p("x") == "x"
+    p.children[1].set_children([Char("y")])
+    assert p("y") == "y"
+
+
+def test_same_errors():
+    for data in ['{"a": [1, 2,, 3]}', '{"a": tru}', "[1, 2"]:
+        plain = error(json_parser.Top, data, Ctx=NoDispatch)
+        assert error(json_parser.Top, data) == plain
+
+    bad = NGINX_CONF.replace("events {", "events {{")
+    assert error(nginx_conf.Top, bad) == error(nginx_conf.Top, bad, Ctx=NoDispatch)
@@ -0,0 +1,115 @@
+import pytest
+from parsr import (AnyChar, Char, EOF, InSet, Literal, Many, Opt, PosMarker,
+        QuotedString, String, WS, Wrapper, text_format)
+from parsr.examples import (arith, corosync_conf, httpd_conf, json_parser,
+        logrotate_conf, multipath_conf, nginx_conf)
+from parsr.examples.tests.test_corosync import COROSYNC_CONF
+from parsr.examples.tests.test_httpd import DATA as HTTPD_CONF, HTTPD_CONF_NEST_1
+from parsr.examples.tests.test_logrotate import EXAMPLE as LOGROTATE_CONF
+from parsr.examples.tests.test_multipath import EXAMPLE as MULTIPATH_CONF
+from parsr.examples.tests.test_nginx import MIME_TYPES, NGINX_CONF
+from parsr import fusion
+from parsr.fusion import Fused
+from parsr.tests.helpers import error, simplify
+
+
+@pytest.fixture(autouse=True, params=[True, False] if fusion.ATOMIC else [False],
+                ids=lambda native: "atomic" if native else "emulated")
+def atomic(request, monkeypatch):
+    # every test also runs with the emulated atomic groups older pythons use
+    monkeypatch.setattr(fusion, "ATOMIC", request.param)
+
+
+def fused(parser):
+    return parser.optimize().fused
+
+
+@pytest.mark.parametrize("grammar, data", [
+    (arith.Top, "2*(3+4)/3+4"),
+    (corosync_conf.Top, COROSYNC_CONF),
+    (httpd_conf.Top, HTTPD_CONF),
+    (httpd_conf.Top, HTTPD_CONF_NEST_1),
+    (json_parser.Top, '{"a": [1, 2.5, "x\\"y", true, null, {"b": false}]}'),
+    (logrotate_conf.Top, LOGROTATE_CONF),
+    (multipath_conf.Top, MULTIPATH_CONF),
+    (nginx_conf.Top, NGINX_CONF),
+    (nginx_conf.Top, MIME_TYPES),
+])
+def test_optimized_examples(grammar, data):
+    optimized = grammar.optimize()
+    assert "Fused" in text_format(optimized.fused)
+    assert simplify(optimized(data)) == simplify(grammar(data))
+    assert simplify(optimized.compile()(data)) == simplify(grammar(data))
+
+
+def test_optimized_errors():
+    bad = NGINX_CONF.replace("events {", "events {{")
+    assert error(nginx_conf.Top.optimize(), bad) == error(nginx_conf.Top, bad)
+
+
+def test_original_unchanged():
+    p = Char("'") >> String("abc") << Char("'")
+    before = text_format(p)
+    p.optimize()
+    assert text_format(p) == before
+
+
+def test_quoted_string():
+    p = fused(QuotedString)
+    assert isinstance(p, Fused)
+    assert p('"a\\"b"') == 'a"b'
+    assert p("'xyz'") == "xyz"
+
+
+def test_greedy_strings():
+    # PEGs don't give back what a String matched
+    p = fused(String("a") + Char("a"))
+    with pytest.raises(Exception):
+        p("aaa")
+
+
+def test_ordered_choice():
+    # the first alternative that matches is final
+    p = fused((Literal("a") | Literal("ab")) + Char("b") + EOF)
+    assert p("ab") == ["a", "b", None]
+    with pytest.raises(Exception):
+        (Wrapper((Literal("a") | Literal("ab")) + EOF)).optimize()("ab")
+
+
+def test_many_bounds():
+    p = fused(Many(InSet("ab"), lower=2, upper=3))
+    assert p("ab") == ["a", "b"]
+    assert p("aba") == ["a", "b", "a"]
+    with pytest.raises(Exception):
+        p("a")
+    with pytest.raises(Exception):
+        p("abab")
+
+
+def test_opt_and_until():
+    p = fused(Opt(Char("x"), default="none") + AnyChar.until(Char(";")) + Char(";"))
+    assert p("x12;") == ["x", ["1", "2"], ";"]
+    assert p("12;") == ["none", ["1", "2"], ";"]
+
+
+def test_pos_marker():
+    p = fused(WS >> PosMarker(String("abc")) << WS)
+    mark = p("\n  abc ")
+    assert (mark.lineno, mark.col, mark.value, mark.start, mark.end) == (2, 3, "abc", 3, 6)
+
+
+def test_unfusable_values():
+    # repeated values of more than one character can't come from one match
+    p = Many(Literal("ab"))
+    assert not isinstance(fused(p), Fused)
+    assert fused(p)("abab") == ["ab", "ab"]
+
+    p = Many(Literal("ab")) >> Char("c")
+    assert isinstance(fused(p), Fused)
+    assert fused(p)("ababc") == "c"
+
+
+def test_atomic_groups():
+    pattern = fused(QuotedString).pattern
+    assert ("(?>" in pattern) == fusion.ATOMIC
+    assert ("(?P=a" in pattern) != fusion.ATOMIC
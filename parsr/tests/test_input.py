@@ -0,0 +1,57 @@
+import tracemalloc
+
+import pytest
+from parsr import Char, Context, EOF, Literal, Many, String, WS
+
+
+def error(parser, data):
+    with pytest.raises(Exception) as ex:
+        parser(data)
+    return str(ex.value)
+
+
+def test_error_at_end_of_input():
+    p = Char("a") + Char("b")
+    msg = error(p, "a")
+    assert msg.startswith("At line 1 column 2:")
+    assert "Expected 'b'. Got 'EOF'." in msg
+
+    msg = error(Literal("abc"), "ab")
+    assert "Expected 'abc'. Got 'a'." in msg
+
+
+def test_line_numbers():
+    p = Many(WS >> String("ab") << WS) << EOF
+    msg = error(p, "ab\nba\n  abc")
+    assert msg.startswith("At line 3 column 5:")
+
+
+def test_input_not_copied():
+    # the engine works on the input string directly, so parsing a large input
+    # doesn't allocate memory proportional to its size
+    data = "a" * 1000000
+    tracemalloc.start()
+    try:
+        assert Char("a")(data) == "a"
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak < len(data) // 10
+
+
+def test_legacy_context_signature():
+    class Legacy(Context):
+        def __init__(self, lines, orig, src=None):
+            super(Legacy, self).__init__(lines, orig, src)
+            self.made = True
+
+    p = Many(WS >> String("ab") << WS) << EOF
+    with pytest.warns(DeprecationWarning):
+        assert p("ab ba", Ctx=Legacy) == ["ab", "ba"]
+    with pytest.warns(DeprecationWarning):
+        msg = error(lambda d: p(d, Ctx=Legacy), "ab\nbc")
+    assert msg.startswith("At line 2 column 2:")
+
+    with pytest.warns(DeprecationWarning):
+        ctx = Context(list("a\nb"), "a\nb", src="x.conf")
+    assert (ctx.orig, ctx.src, list(ctx.lines)) == ("a\nb", "x.conf", [1])
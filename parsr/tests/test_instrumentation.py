@@ -0,0 +1,117 @@
+import copy
+import logging
+import pickle
+
+import pytest
+from parsr import (Char, Choice, Context, InSet, Many, Parser, disable_debug,
+        enable_debug)
+
+
+class Custom(Parser):
+    def process(self, pos, data, ctx):
+        return pos + 1, data[pos]
+
+
+@pytest.fixture
+def hooked():
+    enable_debug()
+    yield
+    disable_debug()
+
+
+def test_unwrapped_by_default():
+    for cls in (Char, Choice, InSet, Many):
+        assert cls.__dict__["process"] is cls._raw_process
+    assert "process" not in Char("a").__dict__
+
+
+def test_enable_debug(hooked):
+    assert Char.__dict__["process"] is not Char._raw_process
+    ctx = Context("ab")
+    stack = []
+
+    class Spy(Parser):
+        def process(self, pos, data, ctx):
+            stack.extend(ctx.parser_stack)
+            return pos, None
+
+    spy = Spy()
+    p = Many(Char("a")) + spy
+    p.process(0, "ab", ctx)
+    assert stack == [p, spy]
+    assert ctx.parser_stack == []
+
+
+def test_nested_enable():
+    enable_debug()
+    enable_debug()
+    disable_debug()
+    assert Char.__dict__["process"] is not Char._raw_process
+    disable_debug()
+    assert Char.__dict__["process"] is Char._raw_process
+    disable_debug()
+    assert Char.__dict__["process"] is Char._raw_process
+
+
+def test_new_classes(hooked):
+    class Late(Parser):
+        def process(self, pos, data, ctx):
+            return pos, None
+    assert Late.__dict__["process"] is not Late._raw_process
+
+
+def test_custom_parsers_convert_exceptions():
+    # Custom raises IndexError at the end of the input
+    assert Many(Custom())("xy") == ["x", "y"]
+
+
+def test_debug_logs(caplog):
+    p = Char("a") % "A"
+    p.debug()
+    assert "process" in p.__dict__
+    with caplog.at_level(logging.DEBUG, logger="parsr"):
+        assert (Many(p) + Char("b"))("ab") == [["a"], "b"]
+    assert "Trying A" in caplog.text
+    assert "Result: a" in caplog.text
+    p.debug(False)
+    assert "process" not in p.__dict__
+
+
+def test_copy_and_pickle_memo():
+    p = Many(Char("a")).memo()
+    for other in (copy.copy(p), pickle.loads(pickle.dumps(p))):
+        assert other.process.func is not p.process.func
+        assert other("aa") == ["a", "a"]
+
+
+def test_instrumented_parses_leave_classes_alone():
+    seen = []
+
+    class Spy(Parser):
+        def process(self, pos, data, ctx):
+            seen.append((Char.__dict__["process"] is Char._raw_process, list(ctx.parser_stack)))
+            return pos, None
+
+    spy = Spy()
+    a = Char("a")
+    p = Many(a) + spy + Char("b")
+    assert p("ab", memo=True) == [["a"], None, "b"]
+    with pytest.raises(Exception):
+        p("ac")
+    # the memoized parse, the failed parse, and its diagnostic pass
+    assert [s[0] for s in seen] == [True, True, True]
+    assert seen[0][1] == [p, spy]
+    assert seen[2][1] == [p, spy]
+    assert "process" not in p.__dict__
+    assert "process" not in a.__dict__
+
+
+def test_instrumented_copy_kept_for_other_grammars():
+    inner = Char("a") | Char("z")
+    p = Many(inner) + Char("b")
+    assert p("ab", memo=True) == [["a"], "b"]
+    instrumented = p._instrumented()
+    Char("x") + Char("y")
+    assert p._instrumented() is instrumented
+    inner | Char("c")
+    assert p._instrumented() is not instrumented
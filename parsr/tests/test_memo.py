@@ -0,0 +1,75 @@
+from parsr import Char, Context, Forward, Literal, Wrapper
+from parsr.examples import httpd_conf, nginx_conf
+from parsr.examples.tests.test_httpd import HTTPD_CONF_NEST_1
+from parsr.examples.tests.test_nginx import NGINX_CONF
+
+
+class RecordingContext(Context):
+    """ Keeps the last Context created so tests can inspect memo counters. """
+    last = None
+
+    def __init__(self, *args, **kwargs):
+        super(RecordingContext, self).__init__(*args, **kwargs)
+        RecordingContext.last = self
+
+
+def nested(depth):
+    return "(" * depth + "a" + ")x" * depth
+
+
+def make_exponential():
+    # Each level tries the same recursive prefix twice, so without memoization
+    # the work doubles with every level of nesting.
+    expr = Forward()
+    prefix = Wrapper(Char("(") + expr + Char(")"))
+    expr <= (prefix + Char("y")) | (prefix + Char("x")) | Char("a")
+    return expr
+
+
+def test_memo_same_results():
+    plain = nginx_conf.Top(NGINX_CONF)
+    memoized = nginx_conf.Top(NGINX_CONF, memo=True)
+    assert len(plain[0]) == len(memoized[0])
+    assert [e.name for e in plain[0]] == [e.name for e in memoized[0]]
+
+
+def test_memo_tag_stack():
+    # httpd sections push start tags and pop them at end tags, so replayed
+    # results have to restore the tag stack.
+    plain = httpd_conf.Top(HTTPD_CONF_NEST_1)[0]
+    res = httpd_conf.Top(HTTPD_CONF_NEST_1, memo=True, Ctx=RecordingContext)[0]
+    assert [e.name for e in res] == [e.name for e in plain]
+    assert [len(e.children) for e in res] == [len(e.children) for e in plain]
+    assert RecordingContext.last.memo_hits > 0
+    assert 0.0 < RecordingContext.last.memo_hit_rate < 1.0
+
+
+def test_memo_exponential():
+    expr = make_exponential()
+    expr(nested(8), Ctx=RecordingContext)
+    plain = RecordingContext.last.memo_misses
+    assert plain == 0
+
+    expr(nested(8), memo=True, Ctx=RecordingContext)
+    small = RecordingContext.last.memo_misses
+
+    expr(nested(16), memo=True, Ctx=RecordingContext)
+    large = RecordingContext.last.memo_misses
+
+    # memoized evaluation is linear in the nesting depth
+    assert large < small * 3
+
+
+def test_memo_annotation():
+    lit = Literal("ab").memo()
+    p = (lit + Char("c")) | (lit + Char("d"))
+    assert p("abd", Ctx=RecordingContext) == ["ab", "d"]
+    assert RecordingContext.last.memo_hits == 1
+    assert RecordingContext.last.memo_misses == 1
+
+
+def test_memo_failure():
+    lit = Literal("ab").memo()
+    p = (lit + Char("c")) | (lit + Char("d")) | Literal("ax")
+    assert p("ax", Ctx=RecordingContext) == "ax"
+    assert RecordingContext.last.memo_hits == 1
@@ -0,0 +1,157 @@
+import threading
+
+from six.moves.urllib.request import urlopen
+
+import parsr
+from parsr import Char, EOF, Number, ParseEvent, WS, add_call_hook, remove_call_hook
+from parsr.examples import iniparser, kvpairs
+from parsr.metrics import Registry
+
+
+def boom(v):
+    raise ValueError(v)
+
+
+AB = (Char("a") % "A" + Char("b") % "B") % "AB"
+BOOM = Char("x").map(boom) % "Boom"
+
+
+def parse(p, data):
+    try:
+        p(data)
+    except Exception:
+        pass
+
+
+def test_call_hook():
+    events = []
+    add_call_hook(events.append)
+    try:
+        AB("ab")
+        parse(AB, "ax")
+        parse(BOOM, "x")
+    finally:
+        remove_call_hook(events.append)
+    AB("ab")
+    assert parsr._call_hooks == []
+    assert [(e.parser, e.length, e.error, e.rule) for e in events] == [
+        (AB, 2, None, None),
+        (AB, 2, "parse", "B"),
+        (BOOM, 1, "function", "Boom"),
+    ]
+    assert all(isinstance(e, ParseEvent) and e.seconds >= 0 for e in events)
+
+
+def test_failures_in_builtin_parsers():
+    # WS and Number are named, but failures in them belong to the rule
+    # that uses them
+    pair = (Char("k") + WS + Number) % "Pair"
+    events = []
+    add_call_hook(events.append)
+    try:
+        parse(pair << EOF, "k ")
+        parse(WS + Number, "x")
+    finally:
+        remove_call_hook(events.append)
+    assert [e.rule for e in events] == ["Pair", None]
+
+
+def test_registry():
+    with Registry(grammars={"ab": AB}) as registry:
+        for _ in range(3):
+            AB("ab")
+        parse(AB, "b")
+        parse(AB, "ax")
+        parse(BOOM, "x")
+        compiled = AB.compile()
+        compiled("ab")
+    metrics = registry.collect()
+    assert sorted(metrics) == ["Boom", "Compiled", "ab"]
+    ab = metrics["ab"]
+    assert ab.ok == 3
+    assert ab.failures == {"A": 1, "B": 1}
+    assert ab.length == 9
+    assert ab.duration.count == ab.size.count == 5
+    assert ab.size.counts[0] == 5
+    assert metrics["Boom"].function_errors == {"Boom": 1}
+
+    text = registry.exposition()
+    assert 'parsr_parses_total{grammar="ab",outcome="ok"} 3\n' in text
+    assert 'parsr_parses_total{grammar="ab",outcome="parse_error"} 2\n' in text
+    assert 'parsr_parse_failures_total{grammar="ab",rule="B"} 1\n' in text
+    assert 'parsr_function_errors_total{grammar="Boom",rule="Boom"} 1\n' in text
+    assert 'parsr_input_total{grammar="ab"} 9\n' in text
+    assert 'parsr_parse_duration_seconds_bucket{grammar="ab",le="+Inf"} 5\n' in text
+    assert 'parsr_input_size_count{grammar="ab"} 5\n' in text
+    assert "# TYPE parsr_parse_duration_seconds histogram" in text
+
+
+def test_threads():
+    registry = Registry(grammars={"ab": AB}).install()
+    try:
+        def run():
+            for _ in range(200):
+                AB("ab")
+        threads = [threading.Thread(target=run) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        registry.uninstall()
+    # the metrics of threads that exited are added to the totals
+    assert registry._shards == {}
+    assert registry.collect()["ab"].ok == 1600
+
+
+def test_unnamed_grammars(caplog):
+    first = Char("a") << EOF
+    second = Char("b") << EOF
+    with Registry() as registry:
+        first("a")
+        second("b")
+        parse(second, "a")
+    warnings = [r for r in caplog.records if r.name == "parsr.metrics"]
+    assert len(warnings) == 1
+    assert "'KeepLeft'" in warnings[0].getMessage()
+    metrics = registry.collect()
+    assert list(metrics) == ["KeepLeft"]
+    assert metrics["KeepLeft"].ok == 2
+    assert 'rule=""' in registry.exposition()
+    assert registry.names == {}
+
+
+def test_grammars_built_per_parse():
+    with Registry() as registry:
+        for _ in range(5):
+            iniparser.grammar()("[a]\nb = 1\n")
+            kvpairs.loads("b = 1\n", comment_chars="#")
+    metrics = registry.collect()
+    assert sorted(metrics) == ["ini", "kvpairs"]
+    assert metrics["ini"].ok == metrics["kvpairs"].ok == 5
+    assert registry.names == {}
+
+
+def test_write_and_serve(tmp_path):
+    registry = Registry(grammars={"ab": AB})
+    with registry:
+        AB("ab")
+    path = str(tmp_path.joinpath("parsr.prom"))
+    registry.write(path)
+    with open(path) as f:
+        assert f.read() == registry.exposition()
+
+    server = registry.serve()
+    try:
+        res = urlopen("http://{0}:{1}/metrics".format(*server.address))
+        assert res.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+        assert res.read().decode("utf-8") == registry.exposition()
+    finally:
+        server.stop()
+
+
+def test_escape():
+    p = Char("q") % 'say "hi"\\'
+    with Registry() as registry:
+        p("q")
+    assert 'grammar="say \\"hi\\"\\\\"' in registry.exposition()
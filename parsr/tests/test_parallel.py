@@ -0,0 +1,96 @@
+import multiprocessing
+import os
+
+import pytest
+from parsr import Char, EOF, Many, String, WS, parallel
+from parsr.examples import corosync_conf, iniparser, nginx_conf
+from parsr.examples.kvpairs import KVPairs
+from parsr.examples.tests.test_corosync import COROSYNC_CONF
+from parsr.examples.tests.test_iniparser import DATA as INI
+from parsr.examples.tests.test_kvpairs import DATA as KVPAIRS_DATA
+from parsr.examples.tests.test_nginx import NGINX_CONF
+from parsr.parallel import blocks, chunks, lines, parse_parallel, sections
+from parsr.tests.helpers import error, simplify
+
+
+def test_lines():
+    data = "a\nbc\nd"
+    assert [lines(data, 0, p) for p in range(7)] == [0, 2, 2, 5, 5, 5, 6]
+
+
+def test_sections():
+    data = "[a]\nx=1\n  [b]\ny=[2]\n[c]\n"
+    assert sections(data, 0, 1) == 20
+    assert sections(data, 20, 21) == len(data)
+
+
+def test_indented_continuations():
+    # "    [continued]" continues the value of key. It isn't a section.
+    data = "".join("[s{0}]\nkey = value\n    [continued]\nother = {0}\n".format(i) for i in range(40))
+    grammar = iniparser.grammar()
+    assert len(chunks(data, sections, 50)) > 1
+    res = parse_parallel(grammar, data, sections, workers=2, chunk_size=50)
+    assert simplify(res) == simplify(grammar(data))
+
+
+def test_blocks():
+    split = blocks()
+    data = "a {\n b {\n }\n}\nc;\nd {\n}\n"
+    assert split(data, 0, 1) == 14
+    assert split(data, 14, 15) == 17
+    assert split(data, 17, 18) == len(data)
+    assert split(data.encode("utf-8"), 0, 1) == 14
+
+
+def test_chunks_positions():
+    data = "ab\ncd\nef"
+    pieces = chunks(data, lambda data, start, pos: min(pos, len(data)), 4)
+    assert pieces == [("ab\nc", (0, 0, 0)), ("d\nef", (4, 1, 1))]
+
+
+@pytest.mark.parametrize("grammar, data, splitter", [
+    (KVPairs().Top, KVPAIRS_DATA * 20, lines),
+    (iniparser.grammar(), INI * 20, sections),
+    (nginx_conf.Top, NGINX_CONF * 5, blocks()),
+    (corosync_conf.Top, COROSYNC_CONF * 5, blocks()),
+    (nginx_conf.Top.compile(), (NGINX_CONF * 5).encode("utf-8"), blocks()),
+])
+def test_examples(grammar, data, splitter):
+    res = parse_parallel(grammar, data, splitter, workers=2, chunk_size=1000)
+    assert simplify(res) == simplify(grammar(data))
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="needs fork")
+def test_without_initializer(monkeypatch):
+    # python 3.6 forks the workers with the grammar in a global
+    monkeypatch.setattr(parallel, "_INITIALIZER", False)
+    Top = Many(Char("a").map(lambda _: os.getpid()) << WS)
+    pids = parse_parallel(Top, "a\n" * 100, lines, workers=2, chunk_size=20)
+    assert len(pids) == 100
+    assert os.getpid() not in pids
+    assert parallel._grammar is None
+
+
+def test_bad_split():
+    # lines cuts the quoted strings in half, so the pieces don't parse by
+    # themselves.
+    Quoted = Char('"') >> String("ab\n") << Char('"')
+    Top = Many(WS >> Quoted << WS) + EOF
+    data = '"a\nb"\n' * 50
+    assert len(chunks(data, lines, 7)) > 1
+    res = parse_parallel(Top, data, lines, workers=2, chunk_size=7)
+    assert res == Top(data)
+
+
+def test_errors():
+    bad = NGINX_CONF * 5 + "oops {"
+    with pytest.raises(Exception) as ex:
+        parse_parallel(nginx_conf.Top, bad, blocks(), workers=2, chunk_size=1000)
+    assert str(ex.value) == error(nginx_conf.Top, bad)
+
+
+def test_merge_values():
+    Top = Many(Char("a") << WS)
+    res = parse_parallel(Top, "a\n" * 100, lines, workers=2, chunk_size=20,
+                         merge_values=lambda values: sum(len(v) for v in values))
+    assert res == 100
@@ -0,0 +1,63 @@
+import tracemalloc
+
+import pytest
+from parsr import EOF, Literal, Many, PosMarker, String, WS
+from parsr.examples import corosync_conf, httpd_conf, multipath_conf, nginx_conf
+from parsr.examples.tests.test_corosync import COROSYNC_CONF
+from parsr.examples.tests.test_httpd import DATA as HTTPD_CONF
+from parsr.examples.tests.test_multipath import EXAMPLE as MULTIPATH_CONF
+from parsr.examples.tests.test_nginx import NGINX_CONF
+from parsr.tests.helpers import error, simplify
+
+
+@pytest.fixture
+def write(tmp_path):
+    def inner(data):
+        path = tmp_path.joinpath("input")
+        path.write_bytes(data.encode("utf-8"))
+        return str(path)
+    return inner
+
+
+@pytest.mark.parametrize("grammar, data", [
+    (corosync_conf.Top, COROSYNC_CONF),
+    (httpd_conf.Top, HTTPD_CONF),
+    (multipath_conf.Top, MULTIPATH_CONF),
+    (nginx_conf.Top, NGINX_CONF),
+    (nginx_conf.Top.compile(), NGINX_CONF),
+])
+def test_examples(write, grammar, data):
+    assert simplify(grammar.parse_file(write(data))) == simplify(grammar(data))
+
+
+def test_empty_file(write):
+    assert Many(Literal("a")).parse_file(write("")) == []
+
+
+def test_errors(write):
+    bad = NGINX_CONF.replace("events {", "events {{")
+    with pytest.raises(Exception) as ex:
+        nginx_conf.Top.parse_file(write(bad))
+    assert str(ex.value) == error(nginx_conf.Top, bad)
+
+
+def test_utf8(write):
+    Word = WS >> PosMarker(String("abcé€")) << WS
+    marks = Many(Word).parse_file(write("abc\n é€a"))
+    assert [m.value for m in marks] == ["abc", "é€a"]
+    # positions count bytes
+    assert [(m.lineno, m.col, m.start, m.end) for m in marks] == [(1, 1, 0, 3), (2, 2, 5, 11)]
+
+
+def test_no_copies(write):
+    line = "0123456789" * 10 + "\n"
+    path = write(line * 40000)
+    p = Many(Literal(line, value=None)) + EOF
+    tracemalloc.start()
+    try:
+        res = p.parse_file(path)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert len(res[0]) == 40000
+    assert peak < len(line) * 40000 // 4
@@ -0,0 +1,71 @@
+import pytest
+from parsr import Char, Choice, Context, Literal, Many, text_format
+from parsr.examples import httpd_conf
+from parsr.examples.tests.test_httpd import DATA as HTTPD_CONF
+from parsr.profiler import Profile
+from parsr.tests.helpers import simplify
+
+
+def test_counts():
+    a = Char("a")
+    ab = a + Char("b")
+    ac = a + Char("c")
+    p = Many(ab | ac)
+    prof = Profile()
+    assert prof.run(p, "abacab") == [["a", "b"], ["a", "c"], ["a", "b"]]
+
+    # both alternatives are tried again at the end of the input
+    s = prof.get(a)
+    assert (s.calls, s.successes, s.failures, s.consumed) == (6, 4, 2, 4)
+    s = prof.get(ab)
+    assert (s.calls, s.successes, s.failures, s.consumed, s.backtracked) == (4, 2, 2, 4, 1)
+    s = prof.get(ac)
+    assert (s.calls, s.successes, s.failures, s.consumed, s.backtracked) == (2, 1, 1, 2, 0)
+    s = prof.get(p)
+    assert (s.calls, s.successes, s.consumed) == (1, 1, 6)
+    assert s.cumulative >= s.time >= 0
+    assert s.cumulative >= prof.get(ab).cumulative
+
+
+def test_accumulates_and_unhooks():
+    p = Literal("x")
+    prof = Profile()
+    prof.run(p, "x")
+    prof.run(p, "x")
+    assert prof.get(p).calls == 2
+    assert "process" not in Literal.__dict__ or Literal.__dict__["process"] is Literal._raw_process
+    assert Context("x").profile is None
+
+
+def test_failed_parse():
+    p = Char("a") + Char("b")
+    prof = Profile()
+    with pytest.raises(Exception):
+        prof.run(p, "ac")
+    # the parse that collects error messages isn't profiled
+    assert prof.get(p).calls == 1
+    assert prof.get(p).backtracked == 1
+
+
+def test_recursion():
+    prof = Profile()
+    value = prof.run(httpd_conf.Top, HTTPD_CONF)
+    assert simplify(value) == simplify(httpd_conf.Top(HTTPD_CONF))
+    total = prof.get(httpd_conf.Top).cumulative
+    # recursive rules are only timed by their outermost calls
+    assert all(s.cumulative <= total * 1.01 for s in prof.stats.values())
+    report = prof.report(limit=5)
+    assert len(report.splitlines()) == 6
+    assert "backtracked" in report
+
+
+def test_render_stats():
+    a = Char("a")
+    p = Choice([a, Char("b")])
+    prof = Profile()
+    prof.run(p, "a")
+    text = text_format(p, stats=prof)
+    assert "Char('a')  [calls=1 ok=1 fail=0" in text
+    # parsers that never ran aren't annotated
+    assert "Char('b')\n" in text
+    assert text_format(p) == "Choice\n  Char('a')\n  Char('b')\n"
@@ -1,5 +1,5 @@
 import pytest
-from parsr import Regex
+from parsr import Char, Regex
 
 
 def test_simple_regex():
@@ -11,3 +11,22 @@ def test_simple_regex_fail():
     Ident = Regex("[a-zA-Z]([a-zA-Z0-9])*")
     with pytest.raises(Exception):
         Ident("1abcd1")
+
+
+def test_anchors_match_at_the_current_position():
+    for pattern in ("^b+", r"\Ab+", "(?<!a)b+"):
+        p = Char("a") + Regex(pattern)
+        for grammar in (p, p.compile()):
+            assert grammar("abb") == ["a", "bb"]
+            assert grammar(b"abb") == ["a", "bb"]
+    # anchors in character classes don't count
+    assert (Char("a") + Regex("[^a]+"))("abc") == ["a", "bc"]
+
+
+def test_return_match_spans_are_relative():
+    p = Char("a") + Regex("b(c)", return_match=True)
+    for grammar in (p, p.compile()):
+        for data in ("abc", b"abc"):
+            m = grammar(data)[1]
+            assert m.span() == (0, 2)
+            assert m.span(1) == (1, 2)
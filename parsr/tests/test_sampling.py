@@ -0,0 +1,55 @@
+import threading
+
+from parsr import Char, Many, Parser
+from parsr.examples import httpd_conf
+from parsr.examples.tests.test_httpd import DATA as HTTPD_CONF
+from parsr.sampling import Sampler
+
+
+def test_sample():
+    entered = threading.Event()
+    release = threading.Event()
+
+    class Wait(Parser):
+        def process(self, pos, data, ctx):
+            entered.set()
+            release.wait()
+            return pos, None
+
+    wait = Wait()
+    inner = Char("a") + wait
+    top = Many(Char("b")) + inner
+    t = threading.Thread(target=top, args=("ba",))
+    t.start()
+    entered.wait()
+    sampler = Sampler(grammars={"top": top})
+    try:
+        sampler.sample()
+        sampler.sample()
+    finally:
+        release.set()
+        t.join()
+
+    samples, own, total = sampler.grammars[top]
+    assert samples == 2
+    assert own == {wait: 2}
+    assert total == {top: 2, inner: 2, wait: 2}
+    report = sampler.report()
+    assert "top: 2 samples" in report
+    assert "  100.0%   100.0%  Wait" in report
+
+
+def test_background(tmp_path):
+    path = str(tmp_path.joinpath("hot.txt"))
+    data = HTTPD_CONF * 20
+    with Sampler(interval=0.001, path=path, dump_interval=0.01,
+                 grammars={"httpd": httpd_conf.Top}) as sampler:
+        while not sampler.grammars:
+            httpd_conf.Top(data)
+    assert sampler.elapsed > 0 and 0 < sampler.overhead < 1
+    with open(path) as f:
+        report = f.read()
+    assert report.startswith("sampling took")
+    assert "httpd: " in report
+    sampler.clear()
+    assert "httpd" not in sampler.report()
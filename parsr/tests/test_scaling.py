@@ -0,0 +1,69 @@
+import gc
+import time
+
+from parsr import Many, Number, Regex
+from parsr.examples import multipath_conf, nginx_conf
+from parsr.examples.tests.test_multipath import EXAMPLE as MULTIPATH_CONF
+from parsr.examples.tests.test_nginx import NGINX_CONF
+
+
+class Input(str):
+    """ Records the length of every slice taken from the input. """
+    def __new__(cls, value):
+        obj = super(Input, cls).__new__(cls, value)
+        obj.slices = []
+        return obj
+
+    def __getitem__(self, key):
+        res = super(Input, self).__getitem__(key)
+        if isinstance(key, slice):
+            self.slices.append(len(res))
+        return res
+
+
+def elapsed(parser, data):
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.time()
+        parser(data)
+        return time.time() - start
+    finally:
+        gc.enable()
+
+
+def test_regex_matches_in_place():
+    data = Input("123" + " " * 1000)
+    assert (Number + Regex(" "))(data) == [123.0, " "]
+    assert max(data.slices) < 1000
+
+
+def test_regex_matched_in_place():
+    # only patterns that would see the text before the current position copy
+    # the rest of the input
+    assert not Regex("a[^b]*$")._sliced
+    assert not Regex(r"\d+(?=x)")._sliced
+    for p in (Regex("^a"), Regex(r"\Aa"), Regex("(?<=a)b"), Regex("a", return_match=True)):
+        assert p._sliced
+
+
+def check_linear(parser, example, size=125000):
+    small = example * (size // len(example))
+    large = small * 4
+    ratio = min(elapsed(parser, large) / elapsed(parser, small) for _ in range(2))
+    # quadratic behavior would make the ratio about 16
+    assert ratio < 8
+
+
+def test_nginx_linear():
+    check_linear(nginx_conf.Top.compile(), NGINX_CONF)
+
+
+def test_multipath_linear():
+    check_linear(multipath_conf.Top.compile(), MULTIPATH_CONF)
+
+
+def test_interpreted_regex_linear():
+    # not compiled, so every match goes through Regex.process
+    word = Regex(r"[a-z]+") << Regex(r"\s+")
+    check_linear(Many(word), "lorem ipsum dolor sit amet\n", size=50000)
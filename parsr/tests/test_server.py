@@ -0,0 +1,135 @@
+import os
+import pickle
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+from parsr import Node
+from parsr.batch import resolve
+from parsr.examples import kvpairs, nginx_conf
+from parsr.examples.tests.test_iniparser import DATA as INI_DATA
+from parsr.examples.tests.test_kvpairs import DATA as KVPAIRS_DATA
+from parsr.examples.tests.test_nginx import NGINX_CONF
+from parsr.query import Entry
+from parsr.server import Client, GRAMMARS, ParseServer, recv_message
+from parsr.tests.helpers import error, simplify
+
+
+@pytest.fixture
+def server(tmp_path):
+    with ParseServer(str(tmp_path.joinpath("parsr.sock")), workers=2) as s:
+        yield s
+
+
+@pytest.fixture
+def client(server):
+    with Client(server.address) as c:
+        yield c
+
+
+@pytest.mark.parametrize("name, data", [
+    ("arith", "1+2"),
+    ("ini", INI_DATA),
+    ("kvpairs", KVPAIRS_DATA),
+    ("nginx", NGINX_CONF),
+])
+def test_grammars_prebuilt(name, data):
+    parse = resolve(GRAMMARS[name])
+    parse(data)
+    # building or changing a parser stamps it with a new version
+    version = Node._version
+    parse(data)
+    assert Node._version == version
+
+
+def test_path_and_data(tmp_path, client):
+    path = tmp_path.joinpath("nginx.conf")
+    path.write_text(NGINX_CONF)
+    expected = simplify(nginx_conf.loads(NGINX_CONF))
+    assert simplify(client.parse("nginx", path=str(path))) == expected
+    assert simplify(client.parse("nginx", data=NGINX_CONF.encode("utf-8"))) == expected
+    assert simplify(client.parse("kvpairs", data=KVPAIRS_DATA)) == simplify(kvpairs.loads(KVPAIRS_DATA))
+
+
+def test_query(client):
+    res = client.parse("nginx", data=NGINX_CONF, query=["http", "server", "listen"])
+    top = Entry(children=nginx_conf.loads(NGINX_CONF))
+    assert simplify(res) == simplify(top["http"]["server"]["listen"])
+
+
+def test_errors(client):
+    with pytest.raises(Exception) as ex:
+        client.parse("nginx", data="events {")
+    assert str(ex.value) == error(nginx_conf.Top, "events {")
+    with pytest.raises(Exception) as ex:
+        client.parse("yaml", data="a: b")
+    assert "Unknown format" in str(ex.value)
+    # the connection still works
+    assert client.parse("arith", data="1+2") == 3
+
+
+def test_concurrent_clients(server):
+    expected = simplify(nginx_conf.loads(NGINX_CONF))
+    results = []
+
+    def run():
+        with Client(server.address) as c:
+            results.extend(simplify(c.parse("nginx", data=NGINX_CONF)) for _ in range(5))
+
+    threads = [threading.Thread(target=run) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == [expected] * 20
+
+
+def test_stop(tmp_path):
+    address = str(tmp_path.joinpath("parsr.sock"))
+    server = ParseServer(address, workers=2).start()
+    pids = set(server.pids)
+    server.stop()
+    assert not os.path.exists(address)
+    for pid in pids:
+        with pytest.raises(OSError):
+            os.kill(pid, signal.SIG_DFL)
+
+
+def test_command_line(tmp_path):
+    address = str(tmp_path.joinpath("parsr.sock"))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    proc = subprocess.Popen([sys.executable, "-m", "parsr.server", address, "--workers", "1"], env=env)
+    try:
+        deadline = time.time() + 30
+        while not os.path.exists(address) and time.time() < deadline:
+            time.sleep(0.05)
+        with Client(address) as c:
+            assert c.parse("arith", data="2*3") == 6
+    finally:
+        proc.terminate()
+        assert proc.wait(timeout=30) == 0
+    assert not os.path.exists(address)
+
+
+def test_socket_permissions(server):
+    assert os.stat(server.address).st_mode & 0o777 == 0o600
+
+
+def test_requests_are_not_unpickled(server):
+    class Evil(object):
+        def __reduce__(self):
+            return (os.getpid, ())
+
+    body = pickle.dumps(Evil())
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(server.address)
+    try:
+        sock.sendall(struct.pack("!I", len(body)) + body)
+        assert recv_message(sock) == ("error", "Malformed request.")
+    finally:
+        sock.close()
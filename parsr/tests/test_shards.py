@@ -0,0 +1,121 @@
+import os
+import subprocess
+import sys
+
+import pytest
+from parsr import shards
+from parsr.examples import nginx_conf
+from parsr.examples.tests.test_nginx import NGINX_CONF
+from parsr.tests.helpers import error, simplify
+
+NGINX = "parsr.examples.nginx_conf:loads"
+LOADED = []
+
+
+class Value(object):
+    # records every time it's unpickled
+    def __init__(self, data):
+        self.data = data
+
+    def __reduce__(self):
+        return (unpickled, (self.data,))
+
+
+def unpickled(data):
+    LOADED.append(data)
+    return Value(data)
+
+
+def crashy(data):
+    # stands in for a node that dies partway through its shard
+    if "CRASH" in data:
+        os._exit(1)
+    return nginx_conf.loads(data)
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    paths = []
+    for i in range(10):
+        path = tmp_path.joinpath("f{0}.conf".format(i))
+        path.write_text(NGINX_CONF if i != 3 else "events {")
+        paths.append(str(path))
+    return paths
+
+
+def test_split():
+    paths = [str(i) for i in range(10)]
+    parts = shards.split(paths, 3)
+    assert [len(p) for p in parts] == [3, 3, 4]
+    assert sum(parts, []) == paths
+    assert shards.split(paths[:2], 4) == [[], ["0"], [], ["1"]]
+
+
+def test_run_and_merge(corpus, tmp_path):
+    out = str(tmp_path.joinpath("out"))
+    status = shards.run(NGINX, corpus, out, 4)
+    assert status == {0: None, 1: None, 2: None, 3: None}
+    index = shards.merge(out)
+    assert index["grammar"] == NGINX and index["shards"] == 4
+    assert sorted(index["files"]) == sorted(corpus)
+    assert list(index["errors"]) == [corpus[3]]
+    assert index["errors"][corpus[3]].endswith(error(nginx_conf.loads, "events {"))
+
+    expected = simplify(nginx_conf.loads(NGINX_CONF))
+    assert simplify(shards.load(out, corpus[9])) == expected
+    with pytest.raises(Exception):
+        shards.load(out, corpus[3])
+
+    # nothing left to do
+    assert shards.run(NGINX, corpus, out, 4) == {}
+    # a different grammar parses everything again
+    assert sorted(shards.run("parsr.examples.nginx_conf:Top", corpus, out, 4, workers=2)) == [0, 1, 2, 3]
+
+
+def test_reads_only_what_it_needs(corpus, tmp_path):
+    out = str(tmp_path.joinpath("out"))
+    ref = "parsr.tests.test_shards:Value"
+    for i in range(2):
+        assert shards.run(ref, corpus, out, 2, only=i) == {i: None}
+    del LOADED[:]
+    assert shards.run(ref, corpus, out, 2, only=0) == {}
+    assert sorted(shards.merge(out)["files"]) == sorted(corpus)
+    assert LOADED == []
+    assert shards.load(out, corpus[7]).data == NGINX_CONF
+    assert LOADED == [NGINX_CONF]
+
+
+def test_resume(corpus, tmp_path):
+    out = str(tmp_path.joinpath("out"))
+    with open(corpus[5], "w") as f:
+        f.write("CRASH")
+    status = shards.run("parsr.tests.test_shards:crashy", corpus, out, 3)
+    # corpus[5] is in shard 1
+    assert status[1] is not None
+    assert not os.path.exists(shards.result_path(out, 1, 3))
+    with pytest.raises(Exception):
+        shards.merge(out)
+
+    done = dict((i, os.stat(shards.result_path(out, i, 3)).st_mtime_ns)
+                for i in range(3) if os.path.exists(shards.result_path(out, i, 3)))
+    with open(corpus[5], "w") as f:
+        f.write(NGINX_CONF)
+    status = shards.run("parsr.tests.test_shards:crashy", corpus, out, 3)
+    assert sorted(status) == sorted(set(range(3)) - set(done))
+    assert all(ex is None for ex in status.values())
+    for i, mtime in done.items():
+        assert os.stat(shards.result_path(out, i, 3)).st_mtime_ns == mtime
+    assert len(shards.merge(out)["files"]) == 10
+
+
+def test_cli(corpus, tmp_path):
+    manifest = tmp_path.joinpath("manifest.txt")
+    manifest.write_text("\n".join(corpus) + "\n\n")
+    out = str(tmp_path.joinpath("out"))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    for i in range(2):
+        # each node parses only its own shard
+        subprocess.check_call([sys.executable, "-m", "parsr.shards", "run", NGINX, str(manifest), out,
+                               "--shards", "2", "--only", str(i)], env=env)
+    res = subprocess.check_output([sys.executable, "-m", "parsr.shards", "merge", out], env=env)
+    assert res.decode("utf-8").strip() == "10 files, 1 errors"
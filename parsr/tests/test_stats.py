@@ -0,0 +1,74 @@
+import pytest
+from parsr import Char, Many
+from parsr.examples import httpd_conf, nginx_conf
+from parsr.examples.tests.test_httpd import DATA as HTTPD_CONF
+from parsr.examples.tests.test_nginx import NGINX_CONF
+from parsr.query import Entry
+from parsr.stats import count_entries
+from parsr.tests.helpers import simplify
+
+
+def test_cheap():
+    p = Many(Char("a") | Char("b"))
+    value, stats = p.parse_with_stats("abba")
+    assert value == ["a", "b", "b", "a"]
+    assert stats.length == 4
+    assert stats.seconds > 0 and stats.chars_per_second > 0
+    # the choice only tries the alternative for the next character until
+    # both fail at the end
+    assert stats.failures == 2
+    assert stats.entries == 0
+    assert stats.max_recursion == 0
+    assert stats.calls is None and stats.max_depth is None
+
+
+def test_detail():
+    p = Many(Char("a") | Char("b"))
+    value, stats = p.parse_with_stats("abba", detail=True)
+    assert value == ["a", "b", "b", "a"]
+    # Many, then the choice and one alternative at each position, and both
+    # at the end
+    assert stats.calls == 1 + 5 + 4 + 2
+    assert stats.failed_calls == 3
+    assert stats.max_depth == 3
+
+
+def test_entries_and_recursion():
+    value, stats = httpd_conf.Top.parse_with_stats(HTTPD_CONF, detail=True)
+    assert simplify(value) == simplify(httpd_conf.Top(HTTPD_CONF))
+    assert stats.entries == count_entries(value) > 0
+    # sections nest inside sections
+    assert stats.max_recursion >= 2
+    assert stats.max_depth > stats.max_recursion
+    assert stats.as_dict()["chars_per_second"] == stats.chars_per_second
+
+
+def test_recursion_without_detail():
+    _, detail = httpd_conf.Top.parse_with_stats(HTTPD_CONF, detail=True)
+    _, stats = httpd_conf.Top.parse_with_stats(HTTPD_CONF)
+    _, compiled = httpd_conf.Top.compile().parse_with_stats(HTTPD_CONF)
+    assert stats.max_recursion == compiled.max_recursion == detail.max_recursion >= 2
+    assert stats.calls is None
+
+
+def test_compiled_and_bytes():
+    grammar = nginx_conf.Top.compile()
+    value, stats = grammar.parse_with_stats(NGINX_CONF.encode("utf-8"))
+    assert simplify(value) == simplify(nginx_conf.Top(NGINX_CONF))
+    assert stats.length == len(NGINX_CONF.encode("utf-8"))
+
+
+def test_failure():
+    p = Char("a") + Char("b")
+    with pytest.raises(Exception) as ex:
+        p.parse_with_stats("ac", detail=True)
+    stats = ex.value.stats
+    assert stats.length == 2
+    assert stats.failures == 1
+    # only the first parse is counted
+    assert stats.calls == 3 and stats.failed_calls == 2
+
+
+def test_count_entries():
+    e = Entry(children=[Entry(), Entry(children=[Entry()])])
+    assert count_entries([e, (Entry(), "x"), None]) == 5
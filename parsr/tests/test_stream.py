@@ -0,0 +1,162 @@
+import io
+
+import pytest
+from parsr import Char, EOF, InSet, Many, PosMarker, String, WS
+from parsr.examples import corosync_conf, iniparser, multipath_conf, nginx_conf
+from parsr.examples.kvpairs import KVPairs, to_entry
+from parsr.examples.tests.test_corosync import COROSYNC_CONF
+from parsr.examples.tests.test_iniparser import DATA as INI_DATA
+from parsr.examples.tests.test_kvpairs import DATA as KVPAIRS_DATA
+from parsr.examples.tests.test_multipath import EXAMPLE as MULTIPATH_CONF
+from parsr.examples.tests.test_nginx import NGINX_CONF
+from parsr.tests.helpers import error, simplify
+
+
+def items(grammar, item, data, **kwargs):
+    res = grammar.iterparse(io.StringIO(data), item=item, **kwargs)
+    return [v for v in res if v is not None]
+
+
+@pytest.mark.parametrize("mod, data, doc", [
+    (nginx_conf, NGINX_CONF, lambda v: v[0]),
+    (multipath_conf, MULTIPATH_CONF, lambda v: v[0]),
+    (corosync_conf, COROSYNC_CONF, lambda v: v),
+])
+@pytest.mark.parametrize("chunk_size", [1, 10, 100, 65536])
+def test_examples(mod, data, doc, chunk_size):
+    expected = simplify(doc(mod.Top(data)))
+    assert simplify(items(mod.Top, mod.Stmt, data, chunk_size=chunk_size)) == expected
+
+
+@pytest.mark.parametrize("chunk_size", [1, 10, 65536])
+def test_kvpairs(chunk_size):
+    kv = KVPairs()
+    pairs = items(kv.Top, kv.Line, KVPAIRS_DATA, chunk_size=chunk_size, lookahead=20)
+    assert simplify(to_entry(pairs)) == simplify(kv.Top(KVPAIRS_DATA)[0])
+
+
+@pytest.mark.parametrize("chunk_size", [1, 10, 65536])
+def test_ini(chunk_size):
+    Top, Stmt = iniparser.rules()
+    sections = items(Top, Stmt, INI_DATA, chunk_size=chunk_size, lookahead=20)
+    assert [s.name for s in sections] == ["DEFAULT", "global", "secret_stuff", "facts",
+                                          "settings", "novalue"]
+    assert simplify(sections) == simplify(iniparser.grammar()(INI_DATA))
+
+
+def test_items_within_lookahead_at_end():
+    # the whole document fits in the lookahead, so every item is accepted
+    # only once the end of the input has been read
+    Word = WS >> InSet("ab") << WS
+    Top = Many(Word) + EOF
+    assert items(Top, Word, "a b a", lookahead=1000) == ["a", "b", "a"]
+    assert feed(Top, "a b a", 2, item=Word) == ["a", "b", "a"]
+
+
+def test_unstreamed_items():
+    Word = WS >> InSet("ab") << WS
+    Top = Many(Word) + Char(";") + Many(Word) + EOF
+    assert items(Top, Word, "a b;") == ["a", "b"]
+    with pytest.raises(Exception) as ex:
+        items(Top, Word, "a b; a b")
+    assert str(ex.value).startswith("At line 1 column 5: An item matched")
+    with pytest.raises(Exception):
+        feed(Top, "a b; a b", 3, item=Word)
+
+
+def test_yields_before_reading_everything():
+    data = NGINX_CONF * 20
+    f = io.StringIO(data)
+    res = nginx_conf.Top.iterparse(f, item=nginx_conf.Stmt, chunk_size=1000, lookahead=100)
+    first = next(v for v in res if v is not None)
+    assert first.name == "user"
+    assert f.tell() < len(data) // 10
+    assert len(list(res)) > 100
+
+
+def test_positions():
+    Word = WS >> PosMarker(String("abcdefghijklmnopqrstuvwxyz")) << WS
+    Top = Many(Word) + EOF
+    data = "alpha beta\n  gamma\ndelta  epsilon"
+    expected = Top(data)[0]
+    marks = items(Top, Word, data, chunk_size=3, lookahead=2)
+    assert [m.value for m in marks] == ["alpha", "beta", "gamma", "delta", "epsilon"]
+    for m, e in zip(marks, expected):
+        assert (m.lineno, m.col, m.start, m.end) == (e.lineno, e.col, e.start, e.end)
+
+
+def test_errors():
+    bad = NGINX_CONF.replace("events {", "events {{")
+    with pytest.raises(Exception) as ex:
+        items(nginx_conf.Top, nginx_conf.Stmt, bad, chunk_size=50)
+    assert str(ex.value) == error(nginx_conf.Top, bad)
+
+
+@pytest.mark.parametrize("compiled", [False, True])
+def test_errors_reported_early(compiled):
+    bad = NGINX_CONF.replace("events {", "events {{") + NGINX_CONF * 50
+    grammar = nginx_conf.Top.compile() if compiled else nginx_conf.Top
+    f = io.StringIO(bad)
+    with pytest.raises(Exception) as ex:
+        list(grammar.iterparse(f, item=nginx_conf.Stmt, chunk_size=1000, lookahead=100))
+    assert str(ex.value) == error(nginx_conf.Top, bad)
+    assert f.tell() < len(bad) // 10
+
+
+def test_long_trailer():
+    Word = WS >> InSet("ab") << WS
+    Top = Many(Word) + Char(";") + String("x") + EOF
+    data = "a b;" + "x" * 5000
+    assert items(Top, Word, data, chunk_size=100, lookahead=10) == ["a", "b"]
+    with pytest.raises(Exception) as ex:
+        items(Top, Word, data + "y", chunk_size=100, lookahead=10)
+    assert str(ex.value) == error(Top, data + "y")
+
+
+def test_trailing_input_checked():
+    Top = Many(WS >> InSet("ab") << WS) + Char(";") + EOF
+    assert items(Top, WS >> InSet("ab") << WS, "a b a;") == ["a", "b", "a"]
+    with pytest.raises(Exception):
+        items(Top, WS >> InSet("ab") << WS, "a b a")
+
+
+def feed(grammar, data, size, item=None):
+    values = []
+    p = grammar.push_parser(values.append, item=item, lookahead=100)
+    for i in range(0, len(data), size):
+        p.feed(data[i:i + size])
+    p.close()
+    return values
+
+
+@pytest.mark.parametrize("size", [1, 7, 4096])
+def test_push_parser(size):
+    expected = simplify(nginx_conf.Top(NGINX_CONF)[0])
+    values = feed(nginx_conf.Top, NGINX_CONF, size, item=nginx_conf.Stmt)
+    assert simplify([v for v in values if v is not None]) == expected
+
+
+def test_push_parser_emits_early():
+    values = []
+    p = nginx_conf.Top.push_parser(values.append, item=nginx_conf.Stmt, lookahead=100)
+    for i in range(0, 2000, 10):
+        p.feed((NGINX_CONF * 10)[i:i + 10])
+    assert values and values[0].name == "user"
+    assert len(values) < 20
+
+
+def test_push_parser_whole_value():
+    expected = simplify([corosync_conf.Top(COROSYNC_CONF)])
+    assert simplify(feed(corosync_conf.Top, COROSYNC_CONF, 5)) == expected
+
+
+def test_push_parser_errors():
+    bad = NGINX_CONF.replace("events {", "events {{")
+    with pytest.raises(Exception) as ex:
+        feed(nginx_conf.Top, bad, 13, item=nginx_conf.Stmt)
+    assert str(ex.value) == error(nginx_conf.Top, bad)
+
+    p = nginx_conf.Top.push_parser(lambda v: None)
+    p.close()
+    with pytest.raises(Exception):
+        p.feed("x")
@@ -0,0 +1,148 @@
+import copy
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from parsr import (Char, Choice, EOF, Forward, InSet, Literal, Node, Number, Space,
+        String, WS)
+from parsr.examples import (corosync_conf, httpd_conf, json_parser, logrotate_conf,
+        multipath_conf, nginx_conf)
+from parsr.examples.kvpairs import KVPairs
+from parsr.examples.tests.test_corosync import COROSYNC_CONF
+from parsr.examples.tests.test_httpd import DATA as HTTPD_CONF
+from parsr.examples.tests.test_kvpairs import DATA as KVPAIRS_DATA
+from parsr.examples.tests.test_logrotate import EXAMPLE as LOGROTATE_CONF
+from parsr.examples.tests.test_multipath import EXAMPLE as MULTIPATH_CONF
+from parsr.examples.tests.test_nginx import NGINX_CONF
+from parsr.tests.helpers import simplify
+from parsr.threads import parse_concurrent
+
+BAD_NGINX = NGINX_CONF.replace("events {", "events {{")
+
+CASES = [
+    (corosync_conf.Top, COROSYNC_CONF),
+    (httpd_conf.Top, HTTPD_CONF),
+    (json_parser.Top, '{"a": [1, 2.5, "x", true, null]}'),
+    (KVPairs().Top, KVPAIRS_DATA),
+    (logrotate_conf.Top, LOGROTATE_CONF),
+    (multipath_conf.Top, MULTIPATH_CONF),
+    (nginx_conf.Top, NGINX_CONF),
+    (nginx_conf.Top, NGINX_CONF.encode("utf-8")),
+    (nginx_conf.Top, BAD_NGINX),
+    (nginx_conf.Top.compile(), NGINX_CONF.encode("utf-8")),
+    (multipath_conf.Top.optimize(), MULTIPATH_CONF),
+    (httpd_conf.Top.optimize(), HTTPD_CONF.encode("utf-8")),
+]
+
+
+def outcome(grammar, data, memo=False):
+    try:
+        return simplify(grammar(data, memo=memo))
+    except Exception as ex:
+        return str(ex)
+
+
+@pytest.fixture
+def switchy():
+    # switch threads as often as possible to shake out races
+    old = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(old)
+
+
+def test_stress(switchy):
+    expected = [outcome(g, d) for g, d in CASES] + [outcome(g, d, True) for g, d in CASES[:3]]
+    jobs = [(g, d, False) for g, d in CASES] + [(g, d, True) for g, d in CASES[:3]]
+    start = threading.Barrier(16)
+
+    def run(worker):
+        start.wait()
+        order = list(range(len(jobs)))[worker:] + list(range(len(jobs)))[:worker]
+        results = [None] * len(jobs)
+        for _ in range(3):
+            for i in order:
+                g, d, memo = jobs[i]
+                results[i] = outcome(g, d, memo)
+        return results
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        for results in pool.map(run, range(16)):
+            assert results == expected
+
+
+def test_parse_concurrent(switchy):
+    grammar = copy.deepcopy(nginx_conf.Top).freeze()
+    inputs = [NGINX_CONF, NGINX_CONF.encode("utf-8")] * 20
+    expected = simplify(nginx_conf.Top(NGINX_CONF))
+    assert [simplify(v) for v in parse_concurrent(grammar, inputs, max_workers=8)] == [expected] * 40
+
+    with pytest.raises(Exception) as ex:
+        parse_concurrent(grammar, [NGINX_CONF, BAD_NGINX], max_workers=2)
+    assert str(ex.value) == outcome(nginx_conf.Top, BAD_NGINX)
+
+
+def test_frozen_grammars_reject_changes():
+    a = Char("a")
+    seq = (a + Char("b")).freeze()
+    fwd = Forward()
+    fwd <= (a | InSet("xy"))
+    fwd.freeze()
+    assert isinstance(seq.children, tuple)
+    for change in (lambda: seq + Char("c"), lambda: a.debug(), lambda: a.memo(),
+                   lambda: a % "A", lambda: fwd <= Char("b"), lambda: fwd.children[0] | Char("z")):
+        with pytest.raises(Exception):
+            change()
+    assert seq("ab") == ["a", "b"]
+    assert fwd("y") == "y"
+
+
+def test_frozen_caches():
+    s = String(u"abé")
+    choice = Choice([Literal("ab"), Char("c")])
+    (s + choice).freeze()
+    assert s._bytes_regex is not None
+    table = choice._table
+    Node._version += 1
+    assert choice(b"c") == "c"
+    assert choice._table is table
+
+
+def test_freeze_compiled_and_optimized():
+    grammar = copy.deepcopy(nginx_conf.Top)
+    expected = simplify(nginx_conf.Top(NGINX_CONF))
+    for p in (grammar.compile().freeze(), grammar.optimize().freeze()):
+        assert simplify(p(NGINX_CONF)) == expected
+        assert simplify(p(NGINX_CONF.encode("utf-8"))) == expected
+    # optimizing a frozen grammar makes a copy that isn't frozen
+    assert simplify(grammar.freeze().optimize()(NGINX_CONF)) == expected
+
+
+def test_freeze_leaves_shared_parsers_alone():
+    grammar = (WS >> Number << WS) + EOF
+    grammar.freeze()
+    assert grammar._frozen
+    for shared in (WS, Number, EOF, Space):
+        assert not shared._frozen
+        assert isinstance(shared.children, list)
+    assert grammar(" 1 ") == [1.0, None]
+    # copies belong to the grammar they're in
+    copied = copy.deepcopy(grammar).freeze()
+    assert all(p._frozen for p in copied.children[0].children)
+
+
+def test_parsing_leaves_frozen_grammars_alone():
+    grammar = copy.deepcopy(nginx_conf.Top).freeze()
+    nodes = []
+    stack = [grammar]
+    while stack:
+        node = stack.pop()
+        if node not in nodes:
+            nodes.append(node)
+            stack.extend(node.children)
+    before = [dict(n.__dict__) for n in nodes]
+    assert outcome(grammar, BAD_NGINX) == outcome(nginx_conf.Top, BAD_NGINX)
+    outcome(grammar, NGINX_CONF, memo=True)
+    outcome(grammar.children[0], BAD_NGINX)
+    assert [dict(n.__dict__) for n in nodes] == before
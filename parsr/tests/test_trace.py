@@ -0,0 +1,89 @@
+import io
+import json
+
+from parsr import Char, Many, Parser
+from parsr.examples import httpd_conf
+from parsr.examples.tests.test_httpd import DATA as HTTPD_CONF
+from parsr.tests.helpers import simplify
+from parsr.trace import ENTER, EXIT, FAILED, Tracer
+
+
+def test_events():
+    a = Char("a")
+    p = Many(a)
+    tracer = Tracer(capacity=16)
+    assert tracer.run(p, "aa") == ["a", "a"]
+    events = [(k, str(parser), pos) for k, parser, pos, _ in tracer.events()]
+    assert events == [
+        (ENTER, str(p), 0),
+        (ENTER, "Char('a')", 0),
+        (EXIT, "Char('a')", 1),
+        (ENTER, "Char('a')", 1),
+        (EXIT, "Char('a')", 2),
+        (ENTER, "Char('a')", 2),
+        (FAILED, "Char('a')", 2),
+        (EXIT, str(p), 2),
+    ]
+    times = [t for _, _, _, t in tracer.events()]
+    assert times == sorted(times)
+    assert tracer.parsers == [p, a]
+
+
+def test_ring_buffer():
+    a = Char("a")
+    p = Many(a)
+    tracer = Tracer(capacity=5)
+    tracer.run(p, "aaaa")
+    assert tracer.count == 12
+    assert len(list(tracer.events())) == 5
+    # the outer call's start was overwritten, so its return is skipped
+    spans = list(tracer.spans())
+    assert [path for path, _, _, _, _, _ in spans] == [[a], [a]]
+    assert [failed for _, _, _, _, _, failed in spans] == [False, True]
+
+
+def test_collapsed_recursion():
+    tracer = Tracer()
+    assert simplify(tracer.run(httpd_conf.Top, HTTPD_CONF)) == simplify(httpd_conf.Top(HTTPD_CONF))
+    stacks = tracer.collapsed()
+    complex_ = str(httpd_conf.Complex)
+    # Complex -> Stanza -> Complex
+    assert any(k.count(complex_) >= 2 for k in stacks)
+    assert all(us >= 0 for us in stacks.values())
+
+    out = io.StringIO()
+    tracer.write_collapsed(out)
+    lines = out.getvalue().splitlines()
+    assert len(lines) == len(stacks)
+    key, us = lines[0].rsplit(" ", 1)
+    assert key in stacks and int(us) >= 0
+
+
+def test_chrome():
+    tracer = Tracer()
+    tracer.run(httpd_conf.Top, HTTPD_CONF)
+    out = io.StringIO()
+    tracer.write_chrome(out)
+    trace = json.loads(out.getvalue())["traceEvents"]
+    assert len(trace) == tracer.count // 2
+    assert all(e["ph"] == "X" and e["dur"] >= 0 for e in trace)
+    outer = max(trace, key=lambda e: e["dur"])
+    assert outer["ts"] == 0 and outer["args"] == {"pos": 0, "depth": 1}
+    assert any(e["cat"] == "fail" for e in trace)
+
+
+def test_unfinished():
+    tracer = Tracer()
+    seen = []
+
+    class Spy(Parser):
+        def process(self, pos, data, ctx):
+            seen.extend(tracer.spans())
+            return pos, None
+
+    a = Char("a")
+    spy = Spy()
+    p = a + spy
+    tracer.run(p, "a")
+    # p and spy were still running
+    assert [path for path, _, _, _, _, _ in seen] == [[p, a], [p, spy], [p]]
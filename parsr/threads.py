@@ -0,0 +1,47 @@
+"""
+threads parses many inputs at once with a pool of threads sharing one
+grammar.
+
+    .. code-block:: python
+
+        import copy
+
+        from parsr.examples.nginx_conf import Top
+        from parsr.threads import parse_concurrent
+
+        results = parse_concurrent(copy.deepcopy(Top).freeze(), documents, max_workers=8)
+
+Grammars can be shared by any number of threads as long as nobody changes
+them while they're in use. Everything that changes during a parse is in the
+:py:class:`parsr.Context` made for it. Parsers fill a few caches the first time
+they run, like :py:class:`parsr.Choice` dispatch tables and the regular
+expressions for bytes input. Each is built completely before it's stored, so
+at worst two threads build the same thing. :py:meth:`parsr.Parser.freeze`
+builds them ahead of time so parsing only reads the grammar, and it makes any
+attempt to change the grammar raise an exception. It freezes every parser the
+grammar reaches except parsr's shared module level parsers like
+:py:data:`parsr.WS`, so freeze a deep copy of a grammar whose rules other code
+builds on, like the examples' ``Top``.
+
+:py:func:`parsr.enable_debug` switches every parser class to the debugging
+hook until :py:func:`parsr.disable_debug` is called, which slows down parses
+in every thread. Parses with ``memo=True``, the second pass that collects
+errors after a failed parse, and recorded parses run an instrumented copy of
+the grammar instead, so they don't slow down other parses.
+
+Objects that hold the state of one parse, like :py:class:`parsr.Context`,
+:py:class:`parsr.stream.PushParser`, and the generators returned by
+:py:meth:`parsr.Parser.iterparse`, must only be used by one thread at a time.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+
+def parse_concurrent(grammar, inputs, max_workers=None):
+    """
+    Parses each of inputs with grammar in a pool of max_workers threads and
+    returns a list of their values in the same order. The first exception
+    raised by a parse is raised once every parse has finished.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(grammar, data) for data in inputs]
+    return [f.result() for f in futures]
@@ -0,0 +1,186 @@
+"""
+trace records an event every time a parser is entered and every time it
+returns or fails, with the parser, the input position, and a timestamp.
+Events go into a ring buffer that's allocated once, so tracing a big input
+keeps the most recent events instead of running out of memory.
+
+    .. code-block:: python
+
+        from parsr.examples import httpd_conf
+        from parsr.trace import Tracer
+
+        tracer = Tracer()
+        tracer.run(httpd_conf.Top, data)
+        with open("httpd.folded", "w") as f:
+            tracer.write_collapsed(f)
+        with open("httpd.json", "w") as f:
+            tracer.write_chrome(f)
+
+``write_collapsed`` writes one line per stack of parsers with the
+microseconds spent in the innermost one, the input that flamegraph.pl and
+speedscope take. ``write_chrome`` writes Chrome's trace event JSON for
+chrome://tracing or Perfetto, where each call is a span that shows the
+position it started at. Recursive rules like ``httpd_conf.Complex`` show up
+nested inside themselves as deep as the input goes.
+
+If the buffer wraps, the oldest events are lost. Exports skip returns whose
+calls were lost and end calls that were still running at the last event.
+"""
+import json
+from array import array
+
+from parsr import FAIL
+from parsr.profiler import Recorder, timer
+
+ENTER = 0
+EXIT = 1
+FAILED = 2
+
+
+class Tracer(Recorder):
+    """
+    Tracer records events for the parses it runs in a buffer that holds the
+    last capacity events. Events accumulate across parses.
+    """
+    def __init__(self, capacity=1 << 20):
+        self.capacity = capacity
+        self.kinds = array("b", [0]) * capacity
+        self.ids = array("l", [0]) * capacity
+        self.positions = array("l", [0]) * capacity
+        self.times = array("d", [0.0]) * capacity
+        self.count = 0
+        # parser ids are indexes into parsers
+        self.parsers = []
+        self._ids = {}
+
+    def _id(self, parser):
+        pid = self._ids.get(parser)
+        if pid is None:
+            pid = self._ids[parser] = len(self.parsers)
+            self.parsers.append(parser)
+        return pid
+
+    def call(self, func, parser, pos, data, ctx):
+        pid = self._ids.get(parser)
+        if pid is None:
+            pid = self._id(parser)
+        i = self.count % self.capacity
+        self.kinds[i] = ENTER
+        self.ids[i] = pid
+        self.positions[i] = pos
+        self.count += 1
+        self.times[i] = timer()
+
+        res = FAIL
+        try:
+            res = func(parser, pos, data, ctx)
+            return res
+        finally:
+            t = timer()
+            i = self.count % self.capacity
+            if res is FAIL:
+                self.kinds[i] = FAILED
+                self.positions[i] = pos
+            else:
+                self.kinds[i] = EXIT
+                self.positions[i] = res[0]
+            self.ids[i] = pid
+            self.times[i] = t
+            self.count += 1
+
+    def clear(self):
+        """
+        Discards every event.
+        """
+        self.count = 0
+
+    def events(self):
+        """
+        Yields a tuple of the kind, the parser, the position, and the
+        timestamp of each event in the buffer from oldest to newest. The
+        kind is :py:data:`ENTER`, :py:data:`EXIT`, or :py:data:`FAILED`. The
+        position of an exit is where the parser's match ended.
+        """
+        start = max(0, self.count - self.capacity)
+        for n in range(start, self.count):
+            i = n % self.capacity
+            yield self.kinds[i], self.parsers[self.ids[i]], self.positions[i], self.times[i]
+
+    def spans(self):
+        """
+        Yields a tuple of the stack of parsers, the start and end times, the
+        time spent in the innermost parser itself, the start position, and
+        whether the call failed for every call that the buffer has events
+        for, in the order the calls returned.
+        """
+        stack = []
+        last = None
+        for kind, parser, pos, t in self.events():
+            last = t
+            if kind == ENTER:
+                stack.append([parser, t, pos, 0.0])
+                continue
+            if not stack or stack[-1][0] is not parser:
+                # the call started before the oldest event in the buffer
+                continue
+            path = [f[0] for f in stack]
+            _, begin, start_pos, children = stack.pop()
+            if stack:
+                stack[-1][3] += t - begin
+            yield path, begin, t, t - begin - children, start_pos, kind == FAILED
+
+        while stack:
+            path = [f[0] for f in stack]
+            _, begin, start_pos, children = stack.pop()
+            if stack:
+                stack[-1][3] += last - begin
+            yield path, begin, last, last - begin - children, start_pos, False
+
+    def collapsed(self):
+        """
+        Returns a dictionary from each stack of parser names, joined by
+        semicolons, to the microseconds spent in its innermost parser.
+        """
+        totals = {}
+        for path, _, _, own, _, _ in self.spans():
+            key = ";".join(_label(p) for p in path)
+            totals[key] = totals.get(key, 0.0) + own * 1e6
+        return totals
+
+    def write_collapsed(self, f):
+        """
+        Writes the collapsed stacks to the file object f.
+        """
+        for key, us in sorted(self.collapsed().items()):
+            f.write("{0} {1}\n".format(key, int(round(us))))
+
+    def chrome(self):
+        """
+        Returns the trace as a dictionary in Chrome's trace event format.
+        """
+        events = list(self.spans())
+        origin = min(begin for _, begin, _, _, _, _ in events) if events else 0.0
+        trace = []
+        for path, begin, end, _, pos, failed in events:
+            trace.append({
+                "name": _label(path[-1]),
+                "cat": "fail" if failed else "ok",
+                "ph": "X",
+                "ts": (begin - origin) * 1e6,
+                "dur": (end - begin) * 1e6,
+                "pid": 1,
+                "tid": 1,
+                "args": {"pos": pos, "depth": len(path)},
+            })
+        return {"traceEvents": trace, "displayTimeUnit": "ms"}
+
+    def write_chrome(self, f):
+        """
+        Writes the Chrome trace JSON to the file object f.
+        """
+        json.dump(self.chrome(), f)
+
+
+def _label(parser):
+    # semicolons separate frames in collapsed stacks
+    return str(parser).replace(";", ",")